@@ -11,15 +11,24 @@ from PIL     import ImageTk
 from PIL     import Image
 from os      import path
 from math    import log 
-from support import read_ini_section, read_ini_parameter
-from kmeans  import KMeansImage 
-from dp      import DPImage 
+from support import read_ini_section, read_ini_parameter, log_image_name
+# the clustering modules (dp, kmeans, cache, jobs) are imported when they are used first, so that the 
+# window comes up without loading them 
+
+# interval (in milliseconds) for polling the progress of the clustering jobs 
+POLL_MS = 100
 
 
 class Application(tk.Frame):
     def __init__(self, master=None):
         super().__init__(master)
         self.pack()
+        # cache of the quantized images, shared by the preview and both clustering algorithms 
+        self.cache = None
+        # clustering jobs, running in the background (one for each algorithm: 'kmean' and 'dp') 
+        self.executor = None
+        self.jobs = dict()
+        self.polling = False
         # Frame with header information 
         self.header_frame = tk.Frame(master)
         self.header_frame.pack(side="top")
@@ -151,10 +160,11 @@ class Application(tk.Frame):
         # display the original image and the cubed image 
         #################################################
         
-        # the first panel will store the original image
+        # the startup image is shown in all four panels (opened and rescaled only once) 
         self.image = Image.open(self.iimm)
-        # rescale image for display in frame 
-        img = self.image_rescaler(self.image)
+        self.image2 = self.image3 = self.image4 = self.image
+        img = img2 = img3 = img4 = self.image_rescaler(self.image)
+        # the first panel will store the original image
         self.panelA = tk.Label(self.srcorig_frame,image=img)
         self.panelA.image = img
         self.panelA.pack(side="top", padx=10, pady=10)
@@ -165,9 +175,6 @@ class Application(tk.Frame):
         
     
         # the second panel will store the cubed image
-        self.image2 = Image.open(self.iimm)
-        # rescale image for display in frame 
-        img2 = self.image_rescaler(self.image2)
         self.panelB = tk.Label(self.srccube_frame,image=img2)
         self.panelB.image = img2
         self.panelB.pack(side="top", padx=10, pady=10)
@@ -187,9 +194,6 @@ class Application(tk.Frame):
         self.kmlabel = tk.Label(self.kmeams_head,text="KMeans Clustering")
         self.kmlabel.pack(side = "top")
         
-        self.image3 = Image.open(self.iimm)
-        # rescale image for display in frame 
-        img3 = self.image_rescaler(self.image3)
         self.panelC = tk.Label(self.kmeams_img_frame,image=img3)
         self.panelC.image3 = img3
         self.panelC.pack(side="top", padx=10, pady=10)
@@ -218,9 +222,6 @@ class Application(tk.Frame):
         self.dplabel = tk.Label(self.dp_head,text="Density Peak (DP) Clustering")
         self.dplabel.pack(side = "top")
         
-        self.image4 = Image.open(self.iimm)
-        # rescale image for display in frame 
-        img4 = self.image_rescaler(self.image4)
         self.panelD = tk.Label(self.dp_img_frame,image=img4)
         self.panelD.image = img4
         self.panelD.pack(side="top", padx=10, pady=10)
@@ -244,12 +245,21 @@ class Application(tk.Frame):
         scaler = fix_height / imageSizeHeight
         newImageSizeHeight = int(imageSizeHeight*scaler)
         newImageSizeWidth  = int(imageSizeWidth*scaler)
-        # rescale image for display in frame 
-        image = image.resize((newImageSizeWidth, newImageSizeHeight), Image.ANTIALIAS)
+        # rescale image for display in frame (palette images of the segmentation are converted to RGB first) 
+        if image.mode == 'P':
+            image = image.convert('RGB')
+        image = image.resize((newImageSizeWidth, newImageSizeHeight), Image.LANCZOS)
         return ImageTk.PhotoImage(image)
     
     
     
+    # cache of the quantized images (see module cache), created with the first clustering run 
+    def get_cache(self):
+        if self.cache is None:
+            from cache import default_cache
+            self.cache = default_cache()
+        return self.cache
+
     def on_logging_click(self):
         if self.logging.get() == 1:
             # this data is read in from the app.ini file - APP section 
@@ -282,11 +292,12 @@ class Application(tk.Frame):
             self.panelA.configure(image=img)
             self.panelA.image=img   
             # the second panel will store the cubed image
-            self.image2 = Image.open(self.iimm)
+            from dp import DPImage
             dp = DPImage(self.d_value.get()[:-9]) 
             dp.GRANULARITY = int(self.c_value.get()[-3:]) # get the integer portion of the label 
+            dp.cache = self.get_cache()
             dp.pre_process_img(self.image)
-            self.image2.putdata(dp.get_pre_processed_data())
+            self.image2 = dp.get_pre_processed_image().convert(self.image.mode)
             # rescale image for display in frame 
             img2 = self.image_rescaler(self.image2)
             self.panelB.configure(image=img2)
@@ -296,37 +307,53 @@ class Application(tk.Frame):
             self.CubeSide.configure(text="Preprocessed Image \r "+self.c_value.get()+"\r " + "Number of distinct pixels: " 
                                     + str(len(dp.pnts.keys())))
       
+    # run KMEANS in the background; while it runs, the button cancels the run 
     def kmean_it(self):   
+        if self.cancel_job('kmean'):
+            return
         # number of clusters in kmeans run  
         k = int(self.k_value.get()[:2]) # cut the first two characters in the string and convert to int
         # run the KMEANS algorithm
+        from kmeans import KMeansImage
         km = KMeansImage(k, self.d_value.get()[:-9], True)
-        kmimg = Image.open(self.iimm)
         km.GRANULARITY = int(self.c_value.get()[-3:]) # get the integer portion of the label 
-        km.run_img(self.image2)
-        pixels = km.get_data_img()
-        kmimg.putdata(pixels)
+        km.cache = self.get_cache()
+        # the source image gives the same cubes as the preprocessed image (and shares its cache entry) 
+        self.start_job('kmean', km, km.run_img, self.image)
+
+    # display the result of a KMEANS run (called in the GUI thread once the job is done) 
+    def kmean_done(self, km, params):
+        k = km.k
+        kmimg = km.get_image()
         # log the segmented file 
         if self.logging.get() == 1:
-            self.log_image(kmimg, "kmean", k)
+            self.log_image(kmimg, "kmean", k, params)
         # rescale image for display in panelC 
         kmout = self.image_rescaler(kmimg)
         self.panelC.configure(image=kmout)
         self.panelC.image=kmout
        
         self.kmeanO.configure(text="k: " + str(k)+"\r Number of loops: "+str(km.counter)
-        +"\r Runtime (in seconds): "+str(km.seconds))
+        +"\r Runtime (in seconds): "+str(round(km.seconds, 2))
+        +"\r"+km.profile.summary())
         
         
+    # run DP in the background; while it runs, the button cancels the run 
     def dp_it(self):   
+        if self.cancel_job('dp'):
+            return
+        from dp import DPImage
         dp = DPImage(self.d_value.get()[:-9])
-        dpimg = Image.open(self.iimm)
         dp.GRANULARITY = int(self.c_value.get()[-3:]) # get the integer portion of the label 
-        dp.run_img(self.image2)
-        dpimg.putdata(dp.get_data())  
+        dp.cache = self.get_cache()
+        self.start_job('dp', dp, dp.run_img, self.image)
+
+    # display the result of a DP run (called in the GUI thread once the job is done) 
+    def dp_done(self, dp, params):
+        dpimg = dp.get_image()
         # log the segmented file 
         if self.logging.get() == 1:
-            self.log_image(dpimg, "dp", len(dp.centroids))
+            self.log_image(dpimg, "dp", len(dp.centroids), params)
         # rescale image for display in panelD 
         dpout = self.image_rescaler(dpimg)
         self.panelD.configure(image=dpout)
@@ -334,11 +361,84 @@ class Application(tk.Frame):
        
         self.dpO.configure(text="k: " + str(len(dp.centroids)) 
         + "\r Percentage DC to max pixel distance: "+str(round(100*dp.dc/dp.max_dist,1))+"%"
-        + "\r Runtime (in seconds): "+str(dp.seconds))       
-        
-    def log_image(self, imgg, alg, k):
-        fff = path.basename(self.iimm)
-        imgg.save(self.logpath+fff+"_"+alg+"_"+str(k)+"_"+self.c_value.get()[-3:].strip()+"_"+self.d_value.get()[:-9]+".jpeg")
+        + "\r Runtime (in seconds): "+str(round(dp.seconds, 2))
+        + "\r"+dp.profile.summary())       
+
+    # button, output label, button text and function for the result of each algorithm 
+    def job_widgets(self, alg):
+        if alg == 'kmean':
+            return self.kmean_pic, self.kmeanO, "KMEANS Segmentation", self.kmean_done
+        return self.dp_pic, self.dpO, "DP Segmentation", self.dp_done
+
+    # start a clustering job in the background; KMEANS and DP can run at the same time. The image and 
+    # the parameters for the log file name are taken now, as another image may be loaded during the run 
+    def start_job(self, alg, model, run, *args):
+        from jobs import Job, job_executor
+        if self.executor is None:
+            self.executor = job_executor()
+        params = (self.iimm, self.c_value.get()[-3:].strip(), self.d_value.get()[:-9])
+        self.jobs[alg] = Job(self.executor, model, run, *args, params = params)
+        button, label, text, _ = self.job_widgets(alg)
+        button["text"] = "Cancel " + text
+        label.configure(text="Running ...")
+        if not self.polling:
+            self.polling = True
+            self.after(POLL_MS, self.poll_jobs)
+
+    # cancel the running job of an algorithm; False if the algorithm has no running job 
+    def cancel_job(self, alg):
+        if alg not in self.jobs:
+            return False
+        self.jobs[alg].cancel()
+        self.job_widgets(alg)[1].configure(text="Cancelling ...")
+        return True
+
+    # show the progress of the running jobs, and the results of the jobs that are done 
+    def poll_jobs(self):
+        from stages import Cancelled
+        for alg, job in list(self.jobs.items()):
+            button, label, text, done = self.job_widgets(alg)
+            progress = progress_text(job.poll())
+            if len(progress) > 0 and not job.cancelled.is_set():
+                label.configure(text=progress)
+            if job.done():
+                del self.jobs[alg]
+                button["text"] = text
+                try:
+                    job.result()
+                    done(job.model, job.params)
+                except Cancelled:
+                    label.configure(text="Segmentation cancelled")
+                except Exception as e:
+                    label.configure(text="Segmentation failed: "+str(e))
+        if len(self.jobs) > 0:
+            self.after(POLL_MS, self.poll_jobs)
+        else:
+            self.polling = False
+
+    # cancel all jobs (when the window is closed) 
+    def close_jobs(self):
+        for job in self.jobs.values():
+            job.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        
+    # log the segmented image of a job, with the image path, granularity and distance of the job (params) 
+    def log_image(self, imgg, alg, k, params):
+        image_path, granularity, dist = params
+        imgg.convert('RGB').save(self.logpath+log_image_name(image_path, alg, k, granularity, dist))
+
+# progress of a clustering run for the output label, from the latest events of its stage profile 
+def progress_text(events):
+    text = ""
+    for event, name, value in events:
+        if event == 'start':
+            text = "Running: " + name
+        elif event == 'progress':
+            text = "Running: " + name + " " + str(int(100*value)) + "%"
+        elif event == 'count' and name == 'iterations':
+            text = "Running: loop " + str(value)
+    return text
 
 # run the GUI application 
 def run_gui ():
@@ -350,6 +450,8 @@ def run_gui ():
     root.geometry(window_size)  # set windows size 
     app = Application(master=root)
     app.mainloop()
+    app.close_jobs()
     
     
-run_gui() 
+if __name__ == '__main__':
+    run_gui() 
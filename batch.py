@@ -0,0 +1,169 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+# Headless batch segmentation of image directories, without the GUI. Each image is segmented with the
+# DP and/or KMEANS algorithm in a pool of worker processes; the segmented images are written to the
+# log directory (same file names as the GUI) and the runtimes are recorded in a CSV file.
+#
+#   python batch.py [source] [--alg dp kmean] [--k 3] [--granularity 16] [--dist Euclidean]
+#                   [--out log/] [--csv timing.csv] [--workers N] [--sequence] [--superpixels N]
+#
+# source is a directory or a glob pattern (default: ImageSourcePath in app.ini). With --sequence the source 
+# is segmented as one sequence of frames (a directory of frames, an animated GIF, a .npy array or a video 
+# file, see support.image_frames): each frame starts from the state of the previous frame (see DPSequence 
+# and KMeansSequence), and the frames are segmented one after another in this process 
+
+import argparse
+import csv
+import os
+from os      import path, cpu_count
+from time    import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL     import Image
+from support import read_ini_section, read_ini_parameter, log_image_name, image_files
+
+
+# segment one image file with algorithm alg ('dp' or 'kmean') and save the segmented image in out_dir;
+# returns one row for the timing CSV file
+def segment_file(image_path, alg, k, granularity, dist, out_dir, segments = None):
+    # the clustering modules are only imported where images are segmented (e.g. in the worker processes) 
+    from kmeans import KMeansImage
+    from dp     import DPImage
+    t1 = perf_counter()
+    image = Image.open(image_path).convert('RGB')
+    if alg == 'dp':
+        model = DPImage(dist)
+    elif alg == 'kmean':
+        model = KMeansImage(k, dist, True)
+    else:
+        raise Exception('Algorithm '+alg+' is not defined in program')
+    model.GRANULARITY = granularity
+    if segments is not None:
+        model.SEGMENTS = segments
+    t2 = perf_counter()
+    model.run_img(image)
+    t3 = perf_counter()
+    clusters = len(model.centroids) if alg == 'dp' else k
+    out_path = path.join(out_dir, log_image_name(image_path, alg, clusters, granularity, dist))
+    model.get_image().convert('RGB').save(out_path)
+    t4 = perf_counter()
+    return {'file': path.basename(image_path), 'alg': alg, 'k': clusters, 'granularity': granularity,
+            'dist': dist, 'pixels': image.size[0] * image.size[1], 'cubes': len(model.pnts),
+            'loops': model.counter if alg == 'kmean' else '', 'load_seconds': round(t2 - t1, 4),
+            'run_seconds': round(t3 - t2, 4), 'total_seconds': round(t4 - t1, 4), 'output': out_path, 'error': ''}
+
+
+# name of a sequence: the file name without extension, or the name of the directory of the frames 
+def sequence_name(source):
+    source = path.normpath(source)
+    if path.isfile(source) or path.isdir(source):
+        return path.splitext(path.basename(source))[0]
+    return path.basename(path.dirname(source))
+
+
+# segment the frames of a sequence with algorithm alg ('dp' or 'kmean') and save each segmented frame in 
+# out_dir (file name with the frame number); returns one row for the timing CSV file for each frame 
+def segment_sequence(source, alg, k, granularity, dist, out_dir):
+    from kmeans import KMeansSequence
+    from dp     import DPSequence
+    if alg == 'dp':
+        model = DPSequence(dist)
+    elif alg == 'kmean':
+        model = KMeansSequence(k, dist, True)
+    else:
+        raise Exception('Algorithm '+alg+' is not defined in program')
+    model.GRANULARITY = granularity
+    rows = list()
+    for i, _ in enumerate(model.run_sequence(source)):
+        clusters = len(model.centroids) if alg == 'dp' else k
+        name = sequence_name(source)+'_'+str(i).zfill(5)
+        out_path = path.join(out_dir, log_image_name(name, alg, clusters, granularity, dist))
+        model.get_image().convert('RGB').save(out_path)
+        rows.append({'file': sequence_name(source), 'frame': i, 'alg': alg, 'k': clusters,
+                     'granularity': granularity, 'dist': dist, 'cubes': len(model.pnts),
+                     'loops': model.counter if alg == 'kmean' else '', 'run_seconds': round(model.seconds, 4),
+                     'output': out_path})
+        print(rows[-1]['file'], 'frame', i, alg, 'k='+str(clusters), str(rows[-1]['run_seconds'])+'s')
+    return rows
+
+
+# segment all images with all algorithms in a pool of worker processes and write the timing CSV file; an 
+# image that cannot be segmented (e.g. an unreadable file) gets a row with the error, and the batch goes on 
+def run_batch(files, algs, k, granularity, dist, out_dir, csv_path, workers = None, segments = None):
+    rows = list()
+    os.makedirs(out_dir, exist_ok = True)
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        jobs = {pool.submit(segment_file, f, alg, k, granularity, dist, out_dir, segments): (f, alg) 
+                for f in files for alg in algs}
+        for job in as_completed(jobs):
+            try:
+                row = job.result()
+                print(row['file'], row['alg'], 'k='+str(row['k']), str(row['run_seconds'])+'s')
+            except Exception as e:
+                f, alg = jobs[job]
+                row = {'file': path.basename(f), 'alg': alg, 'error': str(e) or type(e).__name__}
+                print(row['file'], row['alg'], 'failed:', row['error'])
+            rows.append(row)
+    rows.sort(key = lambda r: (r['file'], r['alg']))
+    write_csv(rows, csv_path)
+    return rows
+
+
+# segment the frames of a sequence with all algorithms (one after another) and write the timing CSV file; 
+# prints the frame rate of each algorithm 
+def run_sequence(source, algs, k, granularity, dist, out_dir, csv_path):
+    rows = list()
+    os.makedirs(out_dir, exist_ok = True)
+    for alg in algs:
+        t1 = perf_counter()
+        frames = segment_sequence(source, alg, k, granularity, dist, out_dir)
+        seconds = perf_counter() - t1
+        print(alg, len(frames), 'frames', str(round(len(frames) / seconds, 2) if seconds > 0 else 0)+' frames/s')
+        rows += frames
+    write_csv(rows, csv_path)
+    return rows
+
+
+# the columns are the keys of all rows, in order of their first appearance and the error last (rows of 
+# failed images only have file, alg and error) 
+def write_csv(rows, csv_path):
+    if len(rows) > 0:
+        fields = sorted(dict.fromkeys(key for row in rows for key in row), key = lambda key: key == 'error')
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames = fields, restval = '')
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main(argv = None):
+    # defaults are read in from the app.ini file - APP and GLOBAL sections
+    sc = read_ini_section('APP')
+    src, logpath = read_ini_parameter(sc,'ImageSourcePath'), read_ini_parameter(sc,'ImageLogPath')
+    sc = read_ini_section('GLOBAL')
+    parser = argparse.ArgumentParser(description = 'Batch segmentation of images with DP and KMEANS clustering')
+    parser.add_argument('source', nargs = '?', default = src, help = 'image directory or glob pattern')
+    parser.add_argument('--alg', nargs = '+', default = ['dp', 'kmean'], choices = ['dp', 'kmean'])
+    parser.add_argument('--k', type = int, default = 3, help = 'number of clusters for KMEANS')
+    parser.add_argument('--granularity', type = int, default = int(read_ini_parameter(sc,'Granularity')))
+    parser.add_argument('--dist', default = read_ini_parameter(sc,'DistanceMetric'),
+                        choices = ['Euclidean', 'Manhattan', 'Supremum'])
+    parser.add_argument('--out', default = logpath, help = 'directory for the segmented images')
+    parser.add_argument('--csv', default = None, help = 'timing CSV file (default: <out>/timing.csv)')
+    parser.add_argument('--workers', type = int, default = cpu_count(), help = 'number of worker processes')
+    parser.add_argument('--sequence', action = 'store_true', help = 'segment the source as sequence of frames')
+    parser.add_argument('--superpixels', type = int, default = None,
+                        help = 'number of superpixels before clustering (0: off; default: Segments in app.ini)')
+    args = parser.parse_args(argv)
+    csv_path = args.csv if args.csv is not None else path.join(args.out, 'timing.csv')
+    if args.sequence:
+        return run_sequence(args.source, args.alg, args.k, args.granularity, args.dist, args.out, csv_path)
+    files = image_files(args.source)
+    return run_batch(files, args.alg, args.k, args.granularity, args.dist, args.out, csv_path, args.workers,
+                     args.superpixels)
+
+
+if __name__ == '__main__':
+    main()
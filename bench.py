@@ -0,0 +1,157 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+# Benchmark of the DP and KMEANS algorithms over the bundled images and synthetic images of scaled sizes.
+# Each combination of image, algorithm, granularity, distance metric and k (KMEANS only) is run in this
+# process, one after another; the wall time (perf_counter, best of --repeat runs), the peak memory
+# (tracemalloc, in a separate run), the number of distinct cubes and the number of KMEANS loops are
+# saved in a JSON file. A second JSON file (e.g. from an earlier commit) can be compared against it.
+#
+#   python bench.py [source] [--alg dp kmean] [--granularity 64 32 16 8 4] [--dist Euclidean Manhattan Supremum]
+#                   [--k 3 5] [--sizes 0.25 1 4] [--repeat 1] [--json bench.json] [--compare old.json]
+#
+# source is a directory or a glob pattern (default: ImageSourcePath in app.ini); --sizes adds synthetic
+# images of the given number of megapixels, scaled from the first source image
+
+import argparse
+import json
+import platform
+import subprocess
+import tracemalloc
+from datetime import datetime
+from os       import path
+from time     import perf_counter
+
+import numpy as np
+from PIL      import Image
+from support  import read_ini_section, read_ini_parameter, image_files
+from kmeans   import KMeansImage
+from dp       import DPImage
+
+
+# synthetic image with about 'megapixels' million pixels: the base image scaled to the same aspect ratio
+def synthetic_image(base, megapixels):
+    width, height = base.size
+    scale = (megapixels * 1e6 / (width * height)) ** 0.5
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return base.resize(size, Image.BICUBIC)
+
+
+# images of the benchmark: (name, image) for each source file and each synthetic size
+def bench_images(files, sizes):
+    images = [(path.basename(f), Image.open(f).convert('RGB')) for f in files]
+    if len(images) > 0:
+        base = images[0][1]
+        images += [('synthetic_'+str(mp)+'MP', synthetic_image(base, mp)) for mp in sizes]
+    return images
+
+
+def make_model(alg, k, granularity, dist):
+    if alg == 'dp':
+        model = DPImage(dist)
+    elif alg == 'kmean':
+        model = KMeansImage(k, dist, True)
+    else:
+        raise Exception('Algorithm '+alg+' is not defined in program')
+    model.GRANULARITY = granularity
+    return model
+
+
+# run one benchmark case: best wall time of 'repeat' runs, and the peak memory of a separate traced run
+def bench_case(name, image, alg, k, granularity, dist, repeat = 1):
+    times = list()
+    for _ in range(repeat):
+        model = make_model(alg, k, granularity, dist)
+        t1 = perf_counter()
+        model.run_img(image)
+        times.append(perf_counter() - t1)
+    traced = make_model(alg, k, granularity, dist)
+    tracemalloc.start()
+    traced.run_img(image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'image': name, 'alg': alg, 'k': k if alg == 'kmean' else len(model.centroids),
+            'granularity': granularity, 'dist': dist, 'pixels': image.size[0] * image.size[1],
+            'cubes': len(model.pnts), 'iterations': model.counter if alg == 'kmean' else None,
+            'seconds': min(times), 'peak_mb': round(peak / 2**20, 3)}
+
+
+# key of a benchmark case, for the comparison of two benchmark files
+def case_key(row):
+    return (row['image'], row['alg'], row['k'] if row['alg'] == 'kmean' else None, row['granularity'], row['dist'])
+
+
+# commit of the working directory (empty if git is not available)
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True,
+                              text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def run_bench(images, algs, granularities, dists, ks, repeat = 1):
+    rows = list()
+    for name, image in images:
+        for alg in algs:
+            for granularity in granularities:
+                for dist in dists:
+                    for k in (ks if alg == 'kmean' else [None]):
+                        row = bench_case(name, image, alg, k, granularity, dist, repeat)
+                        rows.append(row)
+                        print(name, alg, 'G='+str(granularity), dist, 'k='+str(row['k']), 'cubes='+str(row['cubes']),
+                              str(round(row['seconds'], 4))+'s', str(row['peak_mb'])+'MB')
+    return rows
+
+
+# compare the results with an earlier benchmark file: ratio of the runtimes (new/old) for all common cases
+def compare(rows, old_rows):
+    old = {case_key(r): r for r in old_rows}
+    report = list()
+    for row in rows:
+        o = old.get(case_key(row))
+        if o is not None and o['seconds'] > 0:
+            report.append({'case': case_key(row), 'old_seconds': o['seconds'], 'seconds': row['seconds'],
+                           'ratio': row['seconds'] / o['seconds'], 'old_peak_mb': o['peak_mb'], 'peak_mb': row['peak_mb']})
+    return report
+
+
+def main(argv = None):
+    # defaults are read in from the app.ini file - APP section
+    sc = read_ini_section('APP')
+    parser = argparse.ArgumentParser(description = 'Benchmark of DP and KMEANS clustering on images')
+    parser.add_argument('source', nargs = '?', default = read_ini_parameter(sc,'ImageSourcePath'),
+                        help = 'image directory or glob pattern')
+    parser.add_argument('--alg', nargs = '+', default = ['dp', 'kmean'], choices = ['dp', 'kmean'])
+    parser.add_argument('--granularity', nargs = '+', type = int, default = [64, 32, 16, 8, 4],
+                        help = 'cube lengths (powers of 2 from 1 to 64)')
+    parser.add_argument('--dist', nargs = '+', default = ['Euclidean', 'Manhattan', 'Supremum'],
+                        choices = ['Euclidean', 'Manhattan', 'Supremum'])
+    parser.add_argument('--k', nargs = '+', type = int, default = [3, 5], help = 'numbers of clusters for KMEANS')
+    parser.add_argument('--sizes', nargs = '*', type = float, default = [0.25, 1, 4],
+                        help = 'megapixels of the synthetic images')
+    parser.add_argument('--repeat', type = int, default = 1, help = 'runs per case (the best time is reported)')
+    parser.add_argument('--json', default = 'bench.json', help = 'JSON file for the results')
+    parser.add_argument('--compare', default = None, help = 'earlier JSON file to compare the results with')
+    args = parser.parse_args(argv)
+
+    images = bench_images(image_files(args.source), args.sizes)
+    rows = run_bench(images, args.alg, args.granularity, args.dist, args.k, args.repeat)
+    result = {'commit': git_commit(), 'date': datetime.now().isoformat(timespec = 'seconds'),
+              'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+              'results': rows}
+    with open(args.json, 'w') as f:
+        json.dump(result, f, indent = 1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            report = compare(rows, json.load(f)['results'])
+        for r in report:
+            print(*r['case'], str(round(r['old_seconds'], 4))+'s ->', str(round(r['seconds'], 4))+'s',
+                  'x'+str(round(r['ratio'], 2)))
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from support import read_ini_section, read_ini_parameter, quantize, label_dtype
+
+# Content-addressed cache of quantized images: the cube histogram (distinct cubes and their counts)
+# and the inverse index of an image are stored under a key built from the digest of the pixel data
+# and the granularity. The cache has two tiers, both with least-recently-used (LRU) eviction: a
+# number of entries in memory, and a number of .npz files in the cache directory on disk.
+# Repeated runs on the same image (with a different k, distance metric or DP threshold) then skip
+# the preprocessing altogether.
+class HistogramCache:
+
+    def __init__(self, directory = None, memory_items = 8, disk_items = 64):
+        self.directory    = directory       # cache directory on disk (None: memory tier only)
+        self.memory_items = memory_items    # maximum number of entries in memory
+        self.disk_items   = disk_items      # maximum number of files in the cache directory
+        self.memory       = OrderedDict()   # entries in memory, least recently used first
+        self.hits         = 0               # number of lookups found in memory or on disk
+        self.misses       = 0               # number of lookups that had to quantize the data
+        self.lock         = threading.Lock() # the cache may be shared by runs in several threads (see app.py)
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok = True)
+
+    # cache key: digest of the pixel data (with its shape and data type) and the granularity
+    def key (self, data, granularity):
+        a = np.ascontiguousarray(np.asarray(data))
+        h = hashlib.blake2b(digest_size = 16)
+        h.update(str((a.shape, a.dtype.str, granularity)).encode())
+        h.update(a.data)
+        return h.hexdigest()
+
+    def file_name (self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    # look up an entry (cubes, counts, inverse) in memory and on disk; None if it is not cached
+    def get (self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            if self.directory is not None and os.path.exists(self.file_name(key)):
+                with np.load(self.file_name(key)) as f:
+                    entry = (f['cubes'], f['counts'], f['inverse'])
+                os.utime(self.file_name(key))     # the modification time records the last use on disk
+                self.put_memory(key, entry)
+                return entry
+            return None
+
+    def put (self, key, entry):
+        with self.lock:
+            self.put_memory(key, entry)
+            if self.directory is not None:
+                cubes, counts, inverse = entry
+                np.savez(self.file_name(key), cubes = cubes, counts = counts, inverse = inverse)
+                self.evict_disk()
+
+    def put_memory (self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last = False)
+
+    # remove the least recently used files beyond disk_items from the cache directory
+    def evict_disk (self):
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.npz')]
+        files.sort(key = os.path.getmtime)
+        for f in files[:max(0, len(files) - self.disk_items)]:
+            os.remove(f)
+
+    # quantize the data (see support.quantize) or take the result from the cache; the inverse index
+    # is kept in the smallest unsigned integer type for the number of cubes
+    def quantize (self, data, granularity = None):
+        key = self.key(data, granularity)
+        entry = self.get(key)
+        with self.lock:
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+        cubes, counts, inverse = quantize(data, granularity)
+        entry = (cubes, counts, inverse.astype(label_dtype(len(cubes))))
+        self.put(key, entry)
+        return entry
+
+    def clear (self):
+        with self.lock:
+            self.memory.clear()
+            if self.directory is not None:
+                for f in os.listdir(self.directory):
+                    if f.endswith('.npz'):
+                        os.remove(os.path.join(self.directory, f))
+
+
+# cache with the settings of the CACHE section in app.ini (created once per process)
+_default_cache = None
+
+def default_cache ():
+    global _default_cache
+    if _default_cache is None:
+        sc = read_ini_section('CACHE')
+        directory = read_ini_parameter(sc,'CachePath')
+        _default_cache = HistogramCache(directory if len(directory) > 0 else None,
+                                        int(read_ini_parameter(sc,'MemoryItems')),
+                                        int(read_ini_parameter(sc,'DiskItems')))
+    return _default_cache
@@ -3,22 +3,101 @@
 # Code for the Final Project Report
 # Due Date:    Friday, 15 June 2018 
 
-from math     import exp, log
-from datetime import datetime
+from math     import exp, log, ceil
+from time     import perf_counter
 
-from support import read_ini_section, read_ini_parameter, dist_func 
+import numpy as np
+
+from support import read_ini_section, read_ini_parameter, dist_func, dist_matrix, dist_rows, row_blocks, quantize, lattice_dist_table 
+from support import label_dtype, label_image, merge_histograms, image_strips, source_shape, image_frames 
+from support import kernel_table, offset_table, lattice_convolve, BLOCK_ELEMENTS 
+from spatial import make_index 
+from parallel import SharedPool, map_blocks
+from stages import StageProfile 
+from superpixels import superpixel_settings, superpixel_quantize 
+
+# block functions of the vectorised engines: each function computes one block of rows (slice) of 
+# cubes against the cubes in the dictionary of arrays. They are module functions, so that the same 
+# code runs serially and in the worker processes of a SharedPool (see module parallel) 
+
+# distances of the cubes in the block to all cubes, taken from the cached distance matrix (see 
+# DistanceCacheSize in app.ini) when the dictionary of arrays contains one 
+def block_distances (a, rows, dist): 
+    if 'distances' in a: 
+        return a['distances'][rows]
+    return dist_matrix(a['cubes'][rows], a['cubes'], dist)
+
+# fill the rows of the block in the distance matrix 'distances' (in the shared memory of the pool, or the 
+# matrix itself in serial runs) 
+def distances_block (a, rows, dist): 
+    a['distances'][rows] = dist_matrix(a['cubes'][rows], a['cubes'], dist)
+
+# maximum distance of the cubes in the block to any cube 
+def max_dist_block (a, rows, dist): 
+    return float(block_distances(a, rows, dist).max())
+
+# density of the cubes in the block: sum of the weights of all cubes, scaled with exp(-(d/dc)^2) 
+def density_block (a, rows, dist, dc): 
+    d = block_distances(a, rows, dist)
+    return np.exp(-(d/dc)**2) @ a['weights']
+
+# distance to the nearest cube with higher density (delta) and its index (parent) for the cubes in 
+# the block; cubes without any cube of higher density get parent -1 and their maximum distance 
+def delta_block (a, rows, dist): 
+    d = block_distances(a, rows, dist)
+    higher = a['rho'][None, :] > a['rho'][rows, None]
+    dh = np.where(higher, d, np.inf)
+    parent = np.argmin(dh, axis=1)
+    delta = dh[np.arange(len(parent)), parent]
+    top = ~higher.any(axis=1)
+    delta[top]  = d.max(axis=1)[top]
+    parent[top] = -1
+    return delta, parent
+
+# delta and parent for a block of cubes sorted by decreasing density (arrays 'cubes' and 'rho' in sorted 
+# order, 'order' with the original index of each sorted cube); only the cubes up to the end of the block 
+# can have a higher density. On equal distances the cube that comes first in pnts is taken (as function 
+# min in assign_point). Cubes without any cube of higher density get parent -1 (and delta infinity) 
+def delta_sorted_block (a, rows, dist): 
+    cubes, rho, order = a['cubes'], a['rho'], a['order']
+    if 'distances' in a: 
+        d = a['distances'][order[rows]][:, order[:rows.stop]]
+    else: 
+        d = dist_matrix(cubes[rows], cubes[:rows.stop], dist)
+    higher = rho[None, :rows.stop] > rho[rows, None]
+    dh = np.where(higher, d, np.inf)
+    delta = dh.min(axis=1)
+    parent = np.where(dh == delta[:, None], order[None, :rows.stop], np.iinfo(order.dtype).max).min(axis=1)
+    parent[~higher.any(axis=1)] = -1
+    return delta, parent
 
 # we construct a base class for implementation of a generic Density-Peak (DP) clustering algorithm; 
 # it can work on any input list with 'points' and is not restricted to images. 
-# 'Points' in the list can be provided as tuples or lists; in the case of images those 'points'
+# 'Points' in the list can be provided as tuples or lists, or as (n,d) array of any dimension d (e.g. 
+# memory-mapped, see module loader); in the case of images those 'points'
 # are the 3-dimensional pixels with the RGB components (each between 0 and 255)
 class DPPoints:
 
-    def __init__(self, dist = 'Euclidean'):
+    def __init__(self, dist = 'Euclidean', engine = 'sorted', index = None, workers = 1):
         
         self.dist = dist                 # distance function that should be applied. Supported options are: 
                                          # 'Euclidean', 'Manhattan' and 'Supremum' 
+        self.engine = engine             # calculation engine for density and distance. Supported options are: 
+                                         # 'sorted' (vectorised, cubes sorted by density, default), 
+                                         # 'numpy' (vectorised), 'python' (loops over dictionaries) and 
+                                         # 'approx' (sampled density, exact delta for the densest cubes only) 
+        if self.engine not in ('sorted', 'numpy', 'python', 'approx'):
+            raise Exception('DP engine '+self.engine+' is not defined in program')
+        self.index = index               # optional spatial index for the vectorised engines ('grid', 'brute' or 
+                                         # an index class, see module spatial); densities are then truncated 
+                                         # at a distance of DensityCutoff * dc 
+        self.workers = workers           # number of worker processes for density and distance of the vectorised 
+                                         # engines without index (1: serial run); results are identical 
         self.points          = list()    # list of original pixel stream (passed into the process)  
+        self.cache           = None      # optional HistogramCache for the preprocessing (see module cache) 
+        self.hooks           = list()    # callbacks hook(event, name, value) for the stages of a run (see module stages) 
+        self.dist_table      = None      # distances of the lattice offsets between the cubes (python engine, see 
+                                         # support.lattice_dist_table) 
         
         # this data is read in from the app.ini file - global section 
         sc = read_ini_section('GLOBAL') 
@@ -30,13 +109,19 @@ class DPPoints:
         self.DG_SCALING  = int  (read_ini_parameter(sc,'DecisionGraphScaling'))
         self.PCT_OUTLIER = float(read_ini_parameter(sc,'OutlierPercentage'))
         self.DENSITY_MIN = float(read_ini_parameter(sc,'DensityMin'))
+        self.D_CUTOFF    = float(read_ini_parameter(sc,'DensityCutoff'))
+        self.D_CACHE     = int  (read_ini_parameter(sc,'DistanceCacheSize'))
+        self.D_METHOD    =       read_ini_parameter(sc,'DensityMethod')
+        self.SAMPLE_SIZE = int  (read_ini_parameter(sc,'SampleSize'))
+        self.S_RADIUS    = int  (read_ini_parameter(sc,'SearchRadius'))
         
         self.initialise()
         
         
     def initialise (self):  
         self.seconds = 0
-        self.p_map           = dict()    # map original pixels to approximated pixels
+        self.profile         = StageProfile(self.hooks) # times of the stages and counters of the last run 
+        self.inverse         = np.empty(0, dtype=int) # index of the approximated pixel (cube) for each original pixel
         self.pnts            = dict()    # dictionary with pre-processed pixels, value contains count for pixel
         self.dst             = dict()    # dictionary of distances associated with each point  
         self.dens            = dict()    # dictionary of densities associated with each point 
@@ -47,64 +132,335 @@ class DPPoints:
         self.dc              = 0.0       # scaling factor for density calculation (rho)
         self.dst_threshold   = 0.0       # calculated distance threshold for outliers in Decision Graph 
         self.dens_threshold  = 0.0       # calculated density threshold for outliers in Decision Graph
+        
+        # array representation of the pre-processed points; index i in each of the arrays 
+        # refers to the i-th key in the dictionary pnts 
+        self.keys            = list()             # list of cubes (keys of pnts) 
+        self.order           = np.empty(0, dtype=int) # indexes of the cubes sorted by decreasing density 
+        self.spatial         = None               # spatial index over the cubes (if option index is set) 
+        self.pool            = None               # pool of worker processes while running with workers > 1 
+        self.distances       = None               # cached matrix of distances between all cubes (if small enough) 
+        self.graph           = None               # decision graph of the last run (see class DecisionGraph) 
+        self.graphs          = dict()             # decision graphs for each DensityScaling used in function retune 
+        self.cubes           = np.empty((0, 0))   # (n,d) array with the cubes 
+        self.weights         = np.empty(0)        # number of pixels in each cube 
+        self.rho             = np.empty(0)        # density of each cube 
+        self.rho_max         = 0.0                # largest density before the scaling to DG_SCALING 
+        self.delta           = np.empty(0)        # distance of each cube to its nearest cube with higher density 
+        self.parent          = np.empty(0, dtype=int) # index of that nearest cube with higher density (-1 for none)
 
    
     # This  method returns the clustered data stream for the image for display
     def get_data(self):
-        return [self.assigned_group[self.p_map[p]] for p in self.points] 
+        groups = [self.assigned_group[p] for p in self.keys]
+        return [groups[i] for i in self.inverse.tolist()] 
     
     # preprocessed image data (to improve runtimes of clustering algorithm)
     def get_pre_processed_data (self):
-        return [self.p_map[p] for p in self.points]
+        return [self.keys[i] for i in self.inverse.tolist()]
+
+    # compact output of the clustering: label map with the index of the centroid (in list centroids) 
+    # for each original point, as uint8 (up to 256 clusters) or uint16 array 
+    def get_labels (self):
+        cidx  = {p: i for i, p in enumerate(self.centroids)}
+        dtype = label_dtype(len(self.centroids))
+        groups = np.array([cidx[self.assigned_group[p]] for p in self.keys], dtype=dtype)
+        return groups[self.inverse]
+
+    # palette for the label map: one row with the centroid for each label 
+    def get_palette (self):
+        return np.array(self.centroids).reshape(len(self.centroids), -1)
 
     
+    # quantize the points into cubes (see support.quantize); the inverse index maps each 
+    # original point to its cube 
     def pre_process_points (self, data): 
         self.points = data
-        self.pnts = dict()
-        self.p_map = dict() 
-        for _pp in self.points:
-            pp = list(_pp)
-            p = tuple(map(lambda x: ((int(x/self.GRANULARITY))*self.GRANULARITY) + int(self.GRANULARITY/2), list(pp)))
-            if p not in self.pnts: 
-                self.pnts[p] = 1
-            else: 
-                self.pnts[p] = self.pnts[p] + 1
-            if _pp not in self.p_map: 
-                self.p_map[_pp] = p
+        quantizer = quantize if self.cache is None else self.cache.quantize
+        cubes, counts, inverse = quantizer(data, self.GRANULARITY)
+        self.set_cubes(cubes, counts, inverse)
+
+    # set the pre-processed points: the distinct cubes, the number of points in each cube and 
+    # (optionally) the inverse index from the original points to the cubes 
+    def set_cubes (self, cubes, counts, inverse = None): 
+        cubes = np.asarray(cubes)
+        self.keys    = [tuple(p) for p in cubes.reshape(len(cubes), -1).tolist()]
+        self.pnts    = dict(zip(self.keys, np.asarray(counts).tolist()))
+        self.cubes   = cubes.astype(float).reshape(len(self.keys), -1)
+        self.weights = np.asarray(counts, dtype=float)
+        self.inverse = np.empty(0, dtype=int) if inverse is None else inverse
+        # the python engine looks up the distances between the cubes in the table of the lattice offsets 
+        if self.engine == 'python': 
+            self.dist_table = lattice_dist_table(self.dist, self.GRANULARITY, cubes.reshape(len(self.keys), -1))
     
     
     # calculate the density for a given point in the list of points: 
     def density (self, p):
         # for points inside the same cube: 
-        # use the average distance between two random points in a cube. 
-        # The average distance depends on the distance metric:
+        # use the average distance between two random points in a cube (see est_dist) 
+        rho = (self.pnts[p] - 1) * exp(-pow(self.est_dist()/self.dc,2)) 
+        # now use the distance between centroids of each of the other cubes to add 
+        # to the calculation of the overall density for the point: 
+        for pp in self.pnts.keys(): 
+            if pp != p: 
+                rho = rho + self.pnts[pp]*exp(-pow(dist_func(pp, p, self.dist, self.dist_table)/self.dc,2))
+        return rho
+
+    # estimated distance between two points inside the same cube: the average distance between 
+    # two random points in a cube. The average distance depends on the distance metric. Without a 
+    # granularity (None) the points are not quantized, and the points counted together are identical:
+    def est_dist (self): 
+        if self.GRANULARITY is None: 
+            return 0
         if self.dist == 'Euclidean': 
             est = 0.66
         elif self.dist == 'Manhattan':
             est = 1.0 
         else:
             est = 0.54  # Supremum distance
-        est_dist = int (self.GRANULARITY * est)
-        rho = (self.pnts[p] - 1) * exp(-pow(est_dist/self.dc,2)) 
-        # now use the distance between centroids of each of the other cubes to add 
-        # to the calculation of the overall density for the point: 
-        for pp in self.pnts.keys(): 
-            if pp != p: 
-                rho = rho + self.pnts[pp]*exp(-pow(dist_func(pp, p, self.dist)/self.dc,2))
-        return rho
+        return int (self.GRANULARITY * est)
+
+    # vectorised calculation of max_dist, dc and the density of all cubes. The distances 
+    # are calculated block by block (rows of cubes against all cubes) with dist_matrix 
+    def density_points_np (self): 
+        n = len(self.keys)
+        lattice = None if self.index is not None else self.lattice_coords()
+        with self.profile.stage('max_dist'):
+            if self.index is not None:
+                index = make_index(self.index, self.cubes, self.dist)
+                self.max_dist = index.max_distance()
+                self.profile.count('distance_evals', index.dist_evals)
+            else:
+                arrays = {'cubes': self.cubes, 'weights': self.weights}
+                # keep the distances between all cubes for a re-run with a new DensityScaling. With a pool, the 
+                # workers write the distances into the shared memory, which the density and delta blocks then 
+                # read (the matrix is shared again, i.e. copied, only for the run of a new pool) 
+                if self.distances is None and n * n <= self.D_CACHE and self.engine != 'approx': 
+                    self.distances = np.zeros((n, n))
+                    arrays['distances'] = self.distances
+                    list(map_blocks(self.pool, distances_block, row_blocks(n, n), arrays, self.dist))
+                    if self.pool is not None: 
+                        self.distances[...] = self.pool.shared('distances')
+                    self.profile.count('distance_evals', n * n)
+                if self.distances is not None: 
+                    arrays['distances'] = self.distances
+                if (lattice is not None or self.engine == 'approx') and self.distances is None: 
+                    index = make_index('grid', self.cubes, self.dist)
+                    self.max_dist = index.max_distance()
+                    self.profile.count('distance_evals', index.dist_evals)
+                else: 
+                    self.max_dist = max(map_blocks(self.pool, max_dist_block, row_blocks(n, n), arrays, self.dist))
+                    if self.distances is None: 
+                        self.profile.count('distance_evals', n * n)
+        self.dc = self.max_dist / self.D_SCALING
+        self.dc = log(float(self.weights.sum())) + self.dc 
+        self.rho = np.zeros(n)
+        with self.profile.stage('density'):
+            if self.index is not None:
+                # only cubes within the cutoff distance contribute to the density; a cell length of a quarter 
+                # of the cutoff keeps the searched cells close to the ball around each cube 
+                cutoff = self.D_CUTOFF * self.dc
+                self.spatial = make_index(self.index, self.cubes, self.dist, cutoff/4)
+                for rows, cols, d in self.spatial.radius_blocks(cutoff): 
+                    self.rho[rows] += np.exp(-(d/self.dc)**2) @ self.weights[cols]
+                    self.profile.count('distance_evals', d.size)
+            elif lattice is not None:
+                self.rho = self.density_lattice(lattice)
+            elif self.engine == 'approx':
+                self.rho = self.density_sampled()
+            else:
+                blocks = row_blocks(n, n)
+                for rows, rho in zip(blocks, map_blocks(self.pool, density_block, blocks, arrays, self.dist, self.dc)): 
+                    self.rho[rows] = rho
+                    self.profile.progress('density', rows.stop, n)
+                if self.distances is None: 
+                    self.profile.count('distance_evals', n * n)
+        # the sum above includes each cube itself with distance 0 (weight * exp(0)); replace this 
+        # term with the estimate for points inside the same cube (as in function density) 
+        self.rho += (self.weights - 1) * exp(-pow(self.est_dist()/self.dc,2)) - self.weights
+        self.rho_max = self.rho.max()
+        self.rho *= self.DG_SCALING/self.rho_max
+        self.dens = dict(zip(self.keys, self.rho.tolist()))
+        return self.dens
+
+    # integer coordinates of the cubes on the lattice with cube length GRANULARITY (starting at 0); None 
+    # if the cubes do not lie on the lattice 
+    def lattice_points (self): 
+        if len(self.keys) == 0 or self.GRANULARITY is None: 
+            return None
+        q = (self.cubes - int(self.GRANULARITY/2)) / self.GRANULARITY
+        if not np.array_equal(q, np.round(q)): 
+            return None
+        q = q.astype(np.int64)
+        return q - q.min(axis=0)
+
+    # lattice coordinates of the cubes (see lattice_points), if the density is calculated on the lattice (see DensityMethod in app.ini); otherwise None 
+    def lattice_coords (self): 
+        n = len(self.keys)
+        if self.D_METHOD not in ('auto', 'lattice', 'direct'): 
+            raise Exception('Density method '+self.D_METHOD+' is not defined in program')
+        q = self.lattice_points() if self.D_METHOD != 'direct' else None
+        if q is None: 
+            return None
+        # auto: only when the lattice has fewer cells than there are pairs of cubes; the convolution runs 
+        # on the lattice padded with the kernel, i.e. up to 2^d times the cells for d dimensions 
+        if self.D_METHOD == 'auto' and np.prod(2.0 * (q.max(axis=0) + 1) - 1) >= float(n) * n: 
+            return None
+        return q
+
+    # density of all cubes as convolution of the lattice histogram (pixel counts of the cubes) with the 
+    # kernel exp(-(d/dc)^2) of the lattice offsets. The kernel covers the whole lattice if it fits into 
+    # BLOCK_ELEMENTS; on finer lattices it stops at the cutoff distance DensityCutoff * dc 
+    def density_lattice (self, q): 
+        side = q.max(axis=0) + 1
+        radius = int(side.max()) - 1
+        if np.prod(2.0 * side - 1) > BLOCK_ELEMENTS: 
+            radius = min(radius, int(ceil(self.D_CUTOFF * self.dc / self.GRANULARITY)))
+        kernel = kernel_table(self.dist, radius, q.shape[1], self.GRANULARITY, self.dc)
+        return lattice_convolve(q, self.weights, kernel)
+
+    # density of all cubes estimated from a sample of SAMPLE_SIZE cubes, drawn with probability proportional 
+    # to their number of pixels: each drawn cube stands for weights.sum()/SAMPLE_SIZE pixels. The term of 
+    # each cube itself is exact (as in the direct sum), for the cubes in the sample and all others, so that 
+    # the sum over the other cubes is unbiased; with fewer cubes than SAMPLE_SIZE the sum is exact 
+    def density_sampled (self): 
+        n = len(self.keys)
+        if n <= self.SAMPLE_SIZE: 
+            sample, counts = np.arange(n), self.weights
+        else: 
+            rng = np.random.default_rng(0)     # fixed seed: repeated runs give the same result 
+            draw = rng.choice(n, size=self.SAMPLE_SIZE, p=self.weights/self.weights.sum())
+            sample, counts = np.unique(draw, return_counts=True)
+            counts = counts * (self.weights.sum() / self.SAMPLE_SIZE)
+        rho = np.zeros(n)
+        for rows in row_blocks(n, len(sample)): 
+            d = dist_matrix(self.cubes[rows], self.cubes[sample], self.dist)
+            rho[rows] = np.exp(-(d/self.dc)**2) @ counts
+            self.profile.count('distance_evals', d.size)
+            self.profile.progress('density', rows.stop, n)
+        rho[sample] -= counts
+        return rho + self.weights
+
+    # delta and parent with a local search on the lattice: for each cube, the lattice offsets within 
+    # SearchRadius lattice steps are visited in order of their distance, and the first offset with a cube 
+    # of higher density gives the parent (the cube with the lowest index on equal distances, as in the 
+    # other engines). Only the cubes without a cube of higher density in that ball (local density peaks, 
+    # i.e. the candidates for centroids) are compared with all cubes. Cubes off the lattice (or on a 
+    # lattice with more than BLOCK_ELEMENTS cells) use the grid index instead 
+    def distance_points_approx (self): 
+        n = len(self.keys)
+        self.order = np.argsort(-self.rho, kind='stable')
+        q = self.lattice_points()
+        if q is None or np.prod(q.max(axis=0) + 1 + 2.0 * self.S_RADIUS) > BLOCK_ELEMENTS: 
+            index = make_index('grid', self.cubes, self.dist)
+            self.delta, self.parent = index.nearest_higher(self.rho)
+            self.profile.count('distance_evals', index.dist_evals)
+        else: 
+            self.delta, self.parent = self.nearest_higher_lattice(q)
+            peaks = np.nonzero(self.parent < 0)[0]
+            arrays = {'cubes': self.cubes, 'rho': self.rho}
+            blocks = [peaks[rows] for rows in row_blocks(len(peaks), n)]
+            for rows, (delta, parent) in zip(blocks, map_blocks(self.pool, delta_block, blocks, arrays, self.dist)): 
+                self.delta[rows], self.parent[rows] = delta, parent
+                self.profile.count('distance_evals', len(rows) * n)
+        self.delta *= self.DG_SCALING/self.delta.max()
+        self.dst = dict(zip(self.keys, self.delta.tolist()))
+        return self.dst
+
+    # nearest cube with higher density within SearchRadius lattice steps (see distance_points_approx); 
+    # parent -1 for cubes without such a cube. Only the cubes 'rows' are searched (default: all cubes) 
+    def nearest_higher_lattice (self, q, rows = None): 
+        n, d = q.shape
+        r = self.S_RADIUS
+        # density and index of the cubes on the lattice, padded by the search radius on each side 
+        shape = tuple((q.max(axis=0) + 1 + 2 * r).tolist())
+        rho = np.full(shape, -np.inf)
+        idx = np.full(shape, n, dtype=np.int64)
+        cells = tuple((q + r).T)
+        rho[cells], idx[cells] = self.rho, np.arange(n)
+        table = offset_table(self.dist, r, d)
+        offsets = np.argwhere(table <= r) - r
+        steps = table[tuple((offsets + r).T)]
+        delta  = np.zeros(n)
+        parent = np.full(n, -1, dtype=int)
+        open_ = np.arange(n) if rows is None else np.asarray(rows)
+        for step in np.unique(steps[steps > 0]): 
+            best = np.full(len(open_), n, dtype=np.int64)
+            for o in offsets[steps == step]: 
+                at = tuple((q[open_] + r + o).T)
+                best = np.minimum(best, np.where(rho[at] > self.rho[open_], idx[at], n))
+            self.profile.count('distance_evals', len(open_) * int((steps == step).sum()))
+            hit = best < n
+            delta[open_[hit]], parent[open_[hit]] = step * self.GRANULARITY, best[hit]
+            open_ = open_[~hit]
+            if len(open_) == 0: 
+                break
+        return delta, parent
+
+    # vectorised calculation of delta and the nearest cube with higher density (parent) for all cubes 
+    def distance_points_np (self): 
+        n = len(self.keys)
+        self.delta  = np.zeros(n)
+        self.parent = np.full(n, -1, dtype=int)
+        arrays = {'cubes': self.cubes, 'rho': self.rho}
+        if self.distances is not None: 
+            arrays['distances'] = self.distances
+        blocks = row_blocks(n, n)
+        for rows, (delta, parent) in zip(blocks, map_blocks(self.pool, delta_block, blocks, arrays, self.dist)): 
+            self.delta[rows]  = delta 
+            self.parent[rows] = parent
+            self.profile.progress('delta', rows.stop, n)
+        if self.distances is None: 
+            self.profile.count('distance_evals', n * n)
+        self.delta *= self.DG_SCALING/self.delta.max()
+        self.dst = dict(zip(self.keys, self.delta.tolist()))
+        return self.dst
+
+    # sort-based calculation of delta and parent: the cubes are sorted once by decreasing density, 
+    # so that all cubes with a higher density than a given cube precede it in the sorted order. 
+    # Each block of sorted cubes is therefore only compared with the cubes up to the end of the block 
+    def distance_points_sorted (self): 
+        n = len(self.keys)
+        self.order = np.argsort(-self.rho, kind='stable')
+        self.delta  = np.zeros(n)
+        self.parent = np.full(n, -1, dtype=int)
+        arrays = {'cubes': self.cubes[self.order], 'rho': self.rho[self.order], 'order': self.order}
+        if self.distances is not None: 
+            arrays['distances'] = self.distances
+        blocks = row_blocks(n, n)
+        for rows, (delta, parent) in zip(blocks, map_blocks(self.pool, delta_sorted_block, blocks, arrays, self.dist)): 
+            self.delta[self.order[rows]]  = delta 
+            self.parent[self.order[rows]] = parent
+            # the blocks further down the order compare with more cubes: progress by the number of pairs 
+            self.profile.progress('delta', rows.stop * rows.stop, n * n)
+            if self.distances is None: 
+                self.profile.count('distance_evals', (rows.stop - rows.start) * rows.stop)
+        # cubes without any cube of higher density get their maximum distance to any cube 
+        top = np.nonzero(self.parent < 0)[0]
+        for rows in row_blocks(len(top), n): 
+            self.delta[top[rows]] = dist_matrix(self.cubes[top[rows]], self.cubes, self.dist).max(axis=1)
+        self.delta *= self.DG_SCALING/self.delta.max()
+        self.dst = dict(zip(self.keys, self.delta.tolist()))
+        return self.dst
 
     # now we use this function to calculate the density of each point in the list; 
     # the function returns a list of densities, with each index corresponding to the 
     # point in the original list that has been passed into the function 
     def density_points (self): 
+        if self.engine != 'python':
+            return self.density_points_np()
         # get the maximum distance between any two pixels in the image 
-        self.max_dist = max([dist_func(p, q, self.dist) for p in self.pnts.keys() for q in self.pnts.keys()])
+        with self.profile.stage('max_dist'):
+            self.max_dist = max([dist_func(p, q, self.dist, self.dist_table) for p in self.pnts.keys() for q in self.pnts.keys()])
         # set density scaling factor
         self.dc = self.max_dist / self.D_SCALING
         # take number of records into consideration in the order of natural logarithm: 
-        self.dc = log(float(len(self.points))) + self.dc 
-        for p in self.pnts.keys(): 
-            self.dens [p] = self.density (p)
+        self.dc = log(float(sum(self.pnts.values()))) + self.dc 
+        with self.profile.stage('density'):
+            for i, p in enumerate(self.pnts.keys()): 
+                self.dens [p] = self.density (p)
+                self.profile.progress('density', i + 1, len(self.pnts))
+        self.profile.count('distance_evals', 2 * len(self.pnts) ** 2)
         # now scale the density values between 0 and DG_SCALING: 
         m = self.DG_SCALING/max(self.dens.values())
         for p in self.dens:
@@ -114,11 +470,24 @@ class DPPoints:
 
     # For each point calculate the minimum distance of the point to another point with higher or equal density: 
     def distance_points (self): 
+        if self.engine != 'python' and self.spatial is not None:
+            evals = self.spatial.dist_evals
+            self.delta, self.parent = self.spatial.nearest_higher(self.rho)
+            self.profile.count('distance_evals', self.spatial.dist_evals - evals)
+            self.delta *= self.DG_SCALING/self.delta.max()
+            self.dst = dict(zip(self.keys, self.delta.tolist()))
+            return self.dst
+        if self.engine == 'sorted':
+            return self.distance_points_sorted()
+        if self.engine == 'approx':
+            return self.distance_points_approx()
+        if self.engine == 'numpy':
+            return self.distance_points_np()
         pmax = max([p for p in self.pnts.keys()], key = lambda x : self.dens[x])
-        self.dst[pmax] = max([dist_func(pmax, pp, self.dist) for pp in self.pnts.keys()])
+        self.dst[pmax] = max([dist_func(pmax, pp, self.dist, self.dist_table) for pp in self.pnts.keys()])
         for p in self.pnts.keys(): 
             if p != pmax:
-                self.dst[p] = min([dist_func(p, pp, self.dist) for pp in self.pnts.keys() if self.dens[pp] > self.dens[p]])    
+                self.dst[p] = min([dist_func(p, pp, self.dist, self.dist_table) for pp in self.pnts.keys() if self.dens[pp] > self.dens[p]])    
         # scale the distance value between 0 and DG_sCALING  
         m = self.DG_SCALING/max(self.dst.values())
         for p in self.dst:
@@ -145,6 +514,10 @@ class DPPoints:
         self.dens_threshold = self.get_dens_threshold ()
         self.centroids = [p for p in self.pnts.keys() 
                               if self.dst[p] > self.dst_threshold and self.dens[p] > self.dens_threshold]
+        # the point with the highest density is always a centroid (even if the distance threshold 
+        # exceeds DG_SCALING, e.g. for images with very few cubes) 
+        if len(self.centroids) == 0 and len(self.pnts) > 0:
+            self.centroids = [max(self.pnts.keys(), key = lambda x : self.dens[x])]
         return self.centroids
     
 
@@ -153,15 +526,36 @@ class DPPoints:
         if p not in self.assigned_group: 
             # if not yet assigned, then find the closest point with higher density: 
             q = min([pp for pp in self.pnts.keys() 
-                         if self.dens[pp] > self.dens[p]], key = lambda x : dist_func(x, p, self.dist))
+                         if self.dens[pp] > self.dens[p]], key = lambda x : dist_func(x, p, self.dist, self.dist_table))
             # call the same function recursively to find appropriate group for this point: 
             self.assigned_group[p] = self.assign_point(q)
         # return the appropriate pixel centroid for the point 
         return self.assigned_group[p]
 
     
+    # iterative assignment for the vectorised engines: walking through the cubes in order of decreasing 
+    # density, the parent of each cube (nearest cube with higher density) has always been assigned before. 
+    # Cubes without a parent that are no centroids are assigned to their closest centroid 
+    def assign_points_sorted (self):
+        if len(self.order) != len(self.keys):
+            self.order = np.argsort(-self.rho, kind='stable')
+        index = {p: i for i, p in enumerate(self.keys)}
+        group = np.full(len(self.keys), -1, dtype=int)
+        cidx  = np.array([index[p] for p in self.centroids], dtype=int)
+        group[cidx] = cidx
+        orphans = [i for i in self.order if group[i] < 0 and self.parent[i] < 0]
+        if len(orphans) > 0 and len(cidx) > 0:
+            d = dist_matrix(self.cubes[orphans], self.cubes[cidx], self.dist)
+            group[orphans] = cidx[np.argmin(d, axis=1)]
+        for i in self.order.tolist(): 
+            if group[i] < 0:
+                group[i] = group[self.parent[i]]
+        self.assigned_group.update(zip(self.keys, [self.keys[g] for g in group.tolist()]))
+
     # assign points to relevant groups by calling function assign_group for each key in the dictionary  
     def assign_remaining_points (self):
+        if self.engine != 'python':
+            return self.assign_points_sorted()
         # first initialise the dictionary with the outliers. They are centroids of their respective clusters
         for p in self.centroids:
             self.assigned_group[p] = p
@@ -174,18 +568,106 @@ class DPPoints:
         self.points = data
         # initialise data 
         self.initialise()
-        t1 = datetime.now()
+        t1 = perf_counter()
         # preprocess the pixels 
-        self.pre_process_points(data)
+        with self.profile.stage('preprocess'):
+            self.pre_process_points(data)
+        self.profile.set('points', len(self.inverse))
+        self.cluster()
+        t2 = perf_counter()
+        self.seconds = t2 - t1
+
+    # run the DP algorithm on a histogram of cubes (distinct points and the number of points in each 
+    # cube) without the original points, e.g. for cubes that have been quantized elsewhere 
+    def run_cubes(self, cubes, counts):
+        self.initialise()
+        t1 = perf_counter()
+        self.set_cubes(cubes, counts)
+        self.cluster()
+        t2 = perf_counter()
+        self.seconds = t2 - t1
+
+    # the clustering steps of the DP algorithm on the pre-processed points; with workers > 1 the 
+    # density and distance blocks of the vectorised engines are computed in a pool of worker processes 
+    def cluster(self):
+        if self.workers > 1 and self.engine != 'python' and self.index is None:
+            with SharedPool(self.workers) as self.pool:
+                self.cluster_steps()
+            self.pool = None
+        else:
+            self.cluster_steps()
+
+    def cluster_steps(self):
+        self.profile.set('cubes', len(self.keys))
         # assign density and distance for each point: 
         self.dens = self.density_points()
-        self.dst  = self.distance_points() 
+        with self.profile.stage('delta'):
+            self.dst  = self.distance_points() 
+        self.graph = DecisionGraph(self)
+        self.graphs[self.D_SCALING] = self.graph
+        self.select_clusters()
+
+    # select the centroids in the decision graph and assign the other points to their clusters 
+    def select_clusters(self):
         # now get the outliers in the decision graph  
-        self.centroids = self.get_outliers ()
+        with self.profile.stage('outliers'):
+            self.centroids = self.get_outliers ()
         # assigne the remaining points to their appropriate groups 
-        self.assign_remaining_points()
-        t2 = datetime.now()
-        self.seconds = (t2-t1).seconds
+        with self.profile.stage('assign'):
+            self.assign_remaining_points()
+        self.profile.set('clusters', len(self.centroids))
+
+    # re-run the selection of centroids and the assignment of points with new thresholds on the stored 
+    # decision graph, without calculating density and distance again. A new DensityScaling recomputes 
+    # density and distance from the cached distances between the cubes (or takes the decision graph 
+    # of an earlier call with the same DensityScaling) 
+    def retune(self, pct_outlier = None, density_min = None, d_scaling = None):
+        t1 = perf_counter()
+        self.profile = StageProfile(self.hooks)
+        if pct_outlier is not None:
+            self.PCT_OUTLIER = pct_outlier
+        if density_min is not None:
+            self.DENSITY_MIN = density_min
+        if d_scaling is not None and d_scaling != self.D_SCALING:
+            self.D_SCALING = d_scaling
+            if d_scaling in self.graphs:
+                self.graphs[d_scaling].restore(self)
+            else:
+                self.dens = self.density_points()
+                with self.profile.stage('delta'):
+                    self.dst  = self.distance_points() 
+                self.graphs[d_scaling] = DecisionGraph(self)
+            self.graph = self.graphs[d_scaling]
+        self.assigned_group = dict()
+        self.select_clusters()
+        t2 = perf_counter()
+        self.seconds = t2 - t1
+        return self.centroids
+
+
+# decision graph of a DP run: density (rho) and distance (delta) of each cube, the nearest cube with 
+# higher density (parent), the cubes in order of decreasing density and the scaling factors. The 
+# selection of centroids and the assignment of points only depend on the decision graph, so that 
+# a stored decision graph can be re-used with different thresholds (see function retune). The graph 
+# keeps copies of the dictionaries and arrays, as the next run of the DP object updates them in place 
+class DecisionGraph:
+    def __init__(self, dp):
+        self.d_scaling = dp.D_SCALING
+        self.max_dist  = dp.max_dist
+        self.dc        = dp.dc
+        self.rho_max   = dp.rho_max
+        self.dens      = dict(dp.dens)
+        self.dst       = dict(dp.dst)
+        self.rho       = np.copy(dp.rho)
+        self.delta     = np.copy(dp.delta)
+        self.parent    = np.copy(dp.parent)
+        self.order     = np.copy(dp.order)
+
+    # set (copies of) the decision graph as current state of the DP object 
+    def restore(self, dp):
+        dp.D_SCALING, dp.max_dist, dp.dc, dp.rho_max = self.d_scaling, self.max_dist, self.dc, self.rho_max
+        dp.dens, dp.dst = dict(self.dens), dict(self.dst)
+        dp.rho, dp.delta, dp.parent, dp.order = np.copy(self.rho), np.copy(self.delta), np.copy(self.parent), np.copy(self.order)
         
 
         
@@ -193,18 +675,460 @@ from PIL import Image
 # https://pillow.readthedocs.io/en/5.1.x/reference/Image.html 
 
 class DPImage(DPPoints):
-    def __init__(self, dist = 'Euclidean'):
-        DPPoints.__init__(self, dist)
+    def __init__(self, dist = 'Euclidean', engine = 'sorted', index = None, workers = 1):
+        DPPoints.__init__(self, dist, engine, index, workers)
         self.image = list()
+        self.superpixel = np.empty(0, dtype=int)    # index of the superpixel of each pixel (if Segments > 0) 
+        # this data is read in from the app.ini file - section for superpixels 
+        self.SEGMENTS, self.COMPACTNESS, self.SP_ITERATIONS = superpixel_settings()
+
+    # quantize the pixels, or with Segments > 0 (see app.ini) the mean colours of their superpixels, 
+    # weighted with the number of pixels (see module superpixels; the histogram cache is not used then) 
+    def pre_process_points (self, data): 
+        if self.SEGMENTS <= 0: 
+            return DPPoints.pre_process_points(self, data)
+        self.points = data
+        cubes, counts, inverse, self.superpixel = superpixel_quantize(np.asarray(self.image), self.GRANULARITY, 
+                                                  self.SEGMENTS, self.COMPACTNESS, self.SP_ITERATIONS)
+        self.set_cubes(cubes, counts, inverse)
               
+    # the pixels are passed on as (n,d) array on the image buffer, with one row for each pixel 
     def pre_process_img (self, image): 
         self.image = image
-        self.points = list(image.getdata())
-        DPPoints.pre_process_points(self, self.points)
+        self.points = np.asarray(image).reshape(-1, len(image.getbands()))
+        self.pre_process_points(self.points)
         
     def run_img(self, image):
         self.image = image
-        self.points = list(image.getdata())
+        self.points = np.asarray(image).reshape(-1, len(image.getbands()))
         DPPoints.run(self, self.points)
 
-    
+    # segmented image, rendered from the label map and palette 
+    def get_image (self):
+        return label_image(self.get_labels(), self.get_palette(), self.image.size)
+
+    # preprocessed image, rendered from the inverse index and the cubes 
+    def get_pre_processed_image (self):
+        return label_image(self.inverse, self.cubes, self.image.size)
+
+
+#
+# coarse-to-fine version of the DP algorithm on images: DP runs on the coarse lattice (cube length COARSE), 
+# and only the pixels in coarse cubes at the border between two clusters are re-assigned on the fine lattice 
+# (cube length FINE): a fine cube in a border region joins the cluster of its nearest centroid. All other 
+# pixels keep the cluster of their coarse cube, so that the runtime stays close to the coarse DP run. 
+# (Following the nearest fine cube with higher density instead, as in the DP assignment, moved the border 
+# pixels into the larger clusters and gave a higher colour error than the coarse run alone.) 
+class DPPyramid(DPImage):
+    def __init__(self, dist = 'Euclidean', engine = 'sorted', index = None, workers = 1, coarse = None, fine = None):
+        DPImage.__init__(self, dist, engine, index, workers)
+        sc = read_ini_section('DP')
+        self.COARSE = int(read_ini_parameter(sc,'PyramidCoarse')) if coarse is None else coarse
+        self.FINE   = int(read_ini_parameter(sc,'PyramidFine'))   if fine   is None else fine
+        self.SEGMENTS = 0     # the fine cubes are quantized from the pixels (no superpixels) 
+        if self.COARSE % self.FINE != 0:
+            raise Exception('Coarse cube length '+str(self.COARSE)+' is no multiple of fine cube length '+str(self.FINE))
+        self.fine_inverse = np.empty(0, dtype=int)   # index of the fine cube for each pixel 
+        self.fine_labels  = np.empty(0, dtype=int)   # label (index in centroids) of each fine cube 
+        self.border       = np.empty(0, dtype=bool)  # coarse cubes at the border between two clusters 
+
+    def run_img(self, image):
+        self.GRANULARITY = self.COARSE
+        DPImage.run_img(self, image)
+        t1 = perf_counter()
+        with self.profile.stage('refine'):
+            self.refine()
+        self.seconds += perf_counter() - t1
+
+    # assign the fine cubes: fine cubes in inner coarse cubes take the cluster of their coarse cube, 
+    # fine cubes in border cubes the cluster of their nearest centroid 
+    def refine (self):
+        n = len(self.keys)
+        cidx = {p: i for i, p in enumerate(self.centroids)}
+        labels = np.array([cidx[self.assigned_group[p]] for p in self.keys], dtype=int)
+        # border cubes: a neighbouring coarse cube (one cube length away in each dimension) has another cluster 
+        self.border = np.zeros(n, dtype=bool)
+        for rows in row_blocks(n, n): 
+            near = dist_matrix(self.cubes[rows], self.cubes, 'Supremum') <= self.COARSE
+            self.border[rows] = (near & (labels[None, :] != labels[rows, None])).any(axis=1)
+        quantizer = quantize if self.cache is None else self.cache.quantize
+        fcubes, fcounts, self.fine_inverse = quantizer(self.points, self.FINE)
+        fcubes = fcubes.reshape(len(fcubes), -1)
+        # coarse cube of each fine cube (the fine cubes lie inside the coarse cubes) 
+        index = {p: i for i, p in enumerate(self.keys)}
+        coarse = (fcubes // self.COARSE) * self.COARSE + int(self.COARSE/2)
+        coarse = np.array([index[tuple(c)] for c in coarse.tolist()], dtype=int)
+        group = labels[coarse]
+        fine = self.border[coarse]
+        self.profile.set('border_cubes', int(fine.sum()))
+        if fine.any(): 
+            centroids = np.array(self.centroids, dtype=float)
+            rows = np.nonzero(fine)[0]
+            for block in row_blocks(len(rows), len(centroids)): 
+                d = dist_matrix(fcubes[rows[block]].astype(float), centroids, self.dist)
+                group[rows[block]] = np.argmin(d, axis=1)
+            self.profile.count('distance_evals', len(rows) * len(centroids))
+        self.fine_labels = group
+
+    # label map of the fine cubes (see get_labels of DPPoints) 
+    def get_labels (self):
+        return self.fine_labels.astype(label_dtype(len(self.centroids)))[self.fine_inverse]
+
+
+#
+# streaming version of the DP algorithm: the image is read in strips of rows, and the cubes of each 
+# strip are merged into the cube histogram of the image. The DP algorithm runs on the histogram alone, 
+# which has at most (256/GRANULARITY)^3 cubes no matter how large the image is. A second pass over the 
+# strips assigns the labels. Results are the same as for DPImage on the whole image. Compressed image 
+# files are decoded as a whole in each pass (see support.image_strips) 
+class DPStream(DPPoints):
+    def __init__(self, dist = 'Euclidean', engine = 'sorted', index = None, strip_rows = 256, workers = 1):
+        DPPoints.__init__(self, dist, engine, index, workers)
+        self.strip_rows = strip_rows      # number of image rows read in each strip
+        self.size       = (0, 0)          # size (width, height) of the streamed image 
+        self.label_map  = np.empty((0, 0), dtype=np.uint8) # labels written by run_stream
+
+    # first pass: cube histogram of the image (PIL image, array or file name) 
+    def histogram_stream (self, source):
+        self.size, bands = source_shape(source)
+        cubes, counts = np.empty((0, bands), dtype=np.int64), np.empty(0, dtype=np.int64)
+        for y, pixels in image_strips(source, self.strip_rows):
+            c, n, _ = quantize(pixels, self.GRANULARITY)
+            cubes, counts = merge_histograms(cubes, counts, c, n)
+        return cubes, counts
+
+    # second pass: yields the first row and the labels (index of the centroid) of each strip 
+    def label_stream (self, source):
+        cidx   = {p: i for i, p in enumerate(self.centroids)}
+        groups = np.array([cidx[self.assigned_group[p]] for p in self.keys], dtype=label_dtype(len(self.centroids)))
+        index  = {p: i for i, p in enumerate(self.keys)}
+        for y, pixels in image_strips(source, self.strip_rows):
+            cubes, _, inverse = quantize(pixels, self.GRANULARITY)
+            strip = np.array([index[tuple(p)] for p in cubes.tolist()], dtype=int)
+            yield y, groups[strip][inverse]
+
+    # run the DP algorithm on the histogram and write the label map of the image into 'out' (an (h,w) 
+    # array, e.g. a memory-mapped file); without 'out' the label map is allocated in memory 
+    def run_stream (self, source, out = None):
+        t1 = perf_counter()
+        cubes, counts = self.histogram_stream(source)
+        self.run_cubes(cubes, counts)
+        width, height = self.size
+        if out is None:
+            out = np.zeros((height, width), dtype=label_dtype(len(self.centroids)))
+        for y, labels in self.label_stream(source):
+            out[y:y + len(labels) // width] = labels.reshape(-1, width)
+        self.label_map = out
+        t2 = perf_counter()
+        self.seconds = t2 - t1
+        return out
+
+    def get_labels (self):
+        return np.asarray(self.label_map).reshape(-1)
+
+    # segmented image, rendered from the label map and palette 
+    def get_image (self):
+        return label_image(self.label_map, self.get_palette(), self.size)
+
+
+
+#
+# incremental version of the DP algorithm for video and image sequences: the cube histogram, the densities 
+# and the decision graph are kept from one frame to the next. Only the pixels that differ from the previous 
+# frame are quantized, and their old and new cubes update the histogram. 
+# - max_dist is the maximum distance between any two cubes seen in the sequence; only the distances of new 
+#   cubes are added, so that dc stays the same as long as no new cube extends the range of the colours 
+# - the density of a cube is the kernel sum over the pixel counts (see density_block), so that it changes 
+#   by the kernel sum over the changes of the counts: each frame only adds the terms of the cubes whose 
+#   count has changed, looked up in the kernel table of the lattice (see update_density) 
+# - delta and parent are only searched again for the cubes whose set of cubes with higher density has 
+#   changed (see unchanged_cubes); all other cubes keep their nearest cube with higher density 
+# Frames without any changed pixels keep the clusters of the previous frame. The engine selects the 
+# calculation of delta, where 'approx' (default) searches the lattice neighbourhood of each cube first (see 
+# distance_points_approx). The cubes are taken in order of their first appearance in the sequence, and 
+# max_dist includes cubes of earlier frames, so that the results may differ slightly from DPImage. 
+class DPSequence(DPImage):
+    def __init__(self, dist = 'Euclidean', engine = 'approx', workers = 1):
+        DPImage.__init__(self, dist, engine, None, workers)
+        if self.engine not in ('sorted', 'numpy', 'approx'): 
+            raise Exception('DP engine '+self.engine+' is not defined for image sequences')
+        self.SEGMENTS = 0     # the histogram is updated from the changed pixels (no superpixels) 
+        self.reset()
+
+    # forget the frames seen so far (the next frame is segmented from scratch) 
+    def reset (self): 
+        self.frames      = 0                       # number of frames since the last reset 
+        self.previous    = None                    # pixels of the previous frame 
+        self.pixel_cube  = np.empty(0, dtype=np.int64) # index (in seq_cubes) of the cube of each pixel 
+        self.seq_index   = dict()                  # index of each cube seen in the sequence (in seq_cubes) 
+        self.seq_cubes   = np.empty((0, 0), dtype=np.int64) # all cubes seen in the sequence 
+        self.seq_counts  = np.empty(0)             # number of pixels of the current frame in each of these cubes 
+        self.seq_change  = np.empty(0)             # change of these counts with the current frame 
+        self.seq_rho     = np.empty(0)             # kernel sum of the counts for each of these cubes 
+        self.seq_new     = 0                       # number of cubes added with the current frame 
+        self.seq_max     = 0.0                     # maximum distance between any two cubes of the sequence 
+        self.seq_kernel  = None                    # kernel table of the kernel sums (see update_density) 
+        self.seq_lattice = None                    # origin, side and dc of the lattice of that kernel table 
+        self.seq_graph   = None                    # rho, delta and parent of the previous frame (see distance_points) 
+
+    # add the cubes that have not been seen before; returns the index of each cube in seq_cubes 
+    def add_cubes (self, cubes): 
+        keys = [tuple(p) for p in cubes.tolist()]
+        n = len(self.seq_index)
+        for p in keys: 
+            self.seq_index.setdefault(p, len(self.seq_index))
+        new = len(self.seq_index) - n
+        if new > 0: 
+            added = np.array(list(self.seq_index.keys())[n:], dtype=np.int64).reshape(new, -1)
+            self.seq_cubes  = np.concatenate([self.seq_cubes, added]) if n > 0 else added
+            self.seq_counts = np.concatenate([self.seq_counts, np.zeros(new)])
+            self.seq_rho    = np.concatenate([self.seq_rho, np.zeros(new)])
+        self.seq_new += new
+        return np.array([self.seq_index[p] for p in keys], dtype=np.int64)
+
+    # update the cube histogram with the pixels that differ from the previous frame; returns their rows 
+    def update_histogram (self, pixels): 
+        n = len(pixels)
+        if self.previous is None or self.previous.shape != pixels.shape: 
+            self.reset()
+            rows = np.arange(n)
+        else: 
+            rows = np.nonzero((pixels != self.previous).any(axis=1))[0]
+        self.seq_new = 0
+        cubes, counts, inverse = quantize(pixels[rows], self.GRANULARITY)
+        index = self.add_cubes(cubes.reshape(len(cubes), pixels.shape[1]))
+        self.seq_change = np.zeros(len(self.seq_cubes))
+        if len(self.pixel_cube) == n: 
+            self.seq_change -= np.bincount(self.pixel_cube[rows], minlength=len(self.seq_cubes))
+        else: 
+            self.pixel_cube = np.zeros(n, dtype=np.int64)
+        self.seq_change[index] += counts
+        self.seq_counts += self.seq_change
+        self.pixel_cube[rows] = index[inverse]
+        self.previous = np.array(pixels)
+        return rows
+
+    # add the distances of the new cubes to the maximum distance between the cubes of the sequence (all 
+    # distances through the grid index on the first frame, or if there are too many new cubes) 
+    def update_max_dist (self): 
+        n, new = len(self.seq_cubes), self.seq_new
+        if new == 0: 
+            return
+        cubes = self.seq_cubes.astype(float)
+        if new == n or new * float(n) > BLOCK_ELEMENTS: 
+            index = make_index('grid', cubes, self.dist)
+            self.seq_max = max(self.seq_max, index.max_distance())
+            self.profile.count('distance_evals', index.dist_evals)
+            return
+        self.seq_max = max(self.seq_max, float(dist_matrix(cubes[n - new:], cubes, self.dist).max()))
+        self.profile.count('distance_evals', new * n)
+
+    # kernel sum over the cubes 'cols' with 'weights' for each of the cubes 'rows' (indexes in seq_cubes), 
+    # with the kernel values of their lattice offsets taken from the kernel table; flat holds the index of 
+    # each cube in the flattened kernel table (relative to its centre) 
+    def kernel_gather (self, rows, cols, weights, flat): 
+        kernel = self.seq_kernel.reshape(-1)
+        centre = len(kernel) // 2
+        rho = np.zeros(len(rows))
+        for block in row_blocks(len(rows), len(cols)): 
+            rho[block] = kernel[flat[rows[block], None] - flat[None, cols] + centre] @ weights
+        self.profile.count('kernel_lookups', len(rows) * len(cols))
+        return rho
+
+    # kernel sums of all cubes in the sequence for the counts of the current frame. While dc and the lattice 
+    # stay the same, the terms of the changed counts are added to the kernel sums of the previous frame (and 
+    # the new cubes get their whole sums), as long as these look-ups cost less than a convolution on the 
+    # lattice: an FFT over the padded lattice costs about as much as ten look-ups for each cell. Otherwise 
+    # all kernel sums are calculated again by convolution (see density_lattice); lattices whose full kernel 
+    # does not fit into BLOCK_ELEMENTS (e.g. Granularity 1-2) are always convolved, with the kernel cut off 
+    # at DensityCutoff * dc 
+    def update_density (self): 
+        n = len(self.seq_cubes)
+        step = self.GRANULARITY if self.GRANULARITY is not None else 1
+        q = (self.seq_cubes - int(step/2)) // step
+        origin = q.min(axis=0)
+        q = q - origin
+        side = q.max(axis=0) + 1
+        radius = int(side.max()) - 1
+        cells = (2.0 * radius + 1) ** q.shape[1]
+        lattice = (origin.tolist(), radius, self.dc)
+        changed = np.nonzero(self.seq_change)[0]
+        if lattice == self.seq_lattice and (len(changed) + self.seq_new) * float(n) < 8 * cells: 
+            flat = np.ravel_multi_index(tuple(q.T), (2 * radius + 1,) * q.shape[1])
+            old, new = np.arange(n - self.seq_new), np.arange(n - self.seq_new, n)
+            self.seq_rho[old] += self.kernel_gather(old, changed, self.seq_change[changed], flat)
+            self.seq_rho[new] = self.kernel_gather(new, np.arange(n), self.seq_counts, flat)
+            self.profile.set('density_updates', len(changed) + self.seq_new)
+            return
+        if cells > BLOCK_ELEMENTS: 
+            radius = min(radius, int(ceil(self.D_CUTOFF * self.dc / step)))
+        self.seq_kernel = kernel_table(self.dist, radius, q.shape[1], step, self.dc)
+        self.seq_rho = lattice_convolve(q, self.seq_counts, self.seq_kernel)
+        self.seq_lattice = lattice if cells <= BLOCK_ELEMENTS else None
+        self.profile.set('density_updates', n)
+
+    # density of the cubes of the current frame from the kernel sums (see density_points_np) 
+    def density_points_np (self): 
+        with self.profile.stage('max_dist'):
+            self.update_max_dist()
+        self.max_dist = self.seq_max
+        self.dc = self.max_dist / self.D_SCALING
+        self.dc = log(float(self.weights.sum())) + self.dc 
+        with self.profile.stage('density'):
+            self.update_density()
+        self.rho = self.seq_rho[self.seq_counts > 0]
+        self.rho += (self.weights - 1) * exp(-pow(self.est_dist()/self.dc,2)) - self.weights
+        self.rho_max = self.rho.max()
+        self.rho *= self.DG_SCALING/self.rho_max
+        self.dens = dict(zip(self.keys, self.rho.tolist()))
+        return self.dens
+
+    # cubes (of the rho arrays old and new over seq_cubes) that have the same cubes with higher density in 
+    # both frames: the cubes with the same rank in both orders, where the cubes before them are the same 
+    # (the first k cubes of the new order are the first k of the old order if none of them has an old rank 
+    # of k or more). Cubes with the same density as another cube are taken as changed 
+    def unchanged_cubes (self, old, new): 
+        n = len(new)
+        rank = list()
+        for rho in (old, new): 
+            order = np.argsort(-rho, kind='stable')
+            r = np.empty(n, dtype=np.int64)
+            r[order] = np.arange(n)
+            rank.append(r)
+        same = np.ones(n + 1, dtype=bool)
+        same[1:] = np.maximum.accumulate(rank[0][np.argsort(rank[1])]) == np.arange(n)
+        unchanged = (rank[0] == rank[1]) & same[rank[1]]
+        for rho in (old, new): 
+            s = np.sort(rho)
+            ties = s[np.nonzero(s[1:] == s[:-1])[0]]
+            unchanged &= ~np.isin(rho, ties)
+        return unchanged
+
+    # delta and parent of the cubes of the current frame: only the cubes whose cubes with higher density 
+    # have changed (and the cubes without a parent, if cubes have come or gone) are searched again 
+    def distance_points (self): 
+        n, m = len(self.keys), len(self.seq_cubes)
+        active = np.nonzero(self.seq_counts > 0)[0]
+        rho = np.full(m, -np.inf)
+        rho[active] = self.rho
+        self.delta  = np.zeros(n)
+        self.parent = np.full(n, -1, dtype=int)
+        if self.seq_graph is None: 
+            rows = np.arange(n)
+        else: 
+            old_rho, old_delta, old_parent = (np.concatenate([a, np.full(m - len(a), v)]) 
+                                              for a, v in zip(self.seq_graph, (-np.inf, 0.0, -1)))
+            keep = self.unchanged_cubes(old_rho, rho)[active] & (old_rho[active] > -np.inf)
+            if not np.array_equal(old_rho > -np.inf, rho > -np.inf): 
+                keep &= old_parent[active] >= 0
+            self.delta[keep] = old_delta[active[keep]]
+            self.parent[keep] = np.searchsorted(active, old_parent[active[keep]])
+            rows = np.nonzero(~keep)[0]
+        self.profile.set('delta_updates', len(rows))
+        q = self.lattice_points() if self.engine == 'approx' else None
+        # a lattice with more than BLOCK_ELEMENTS cells is not allocated (as in distance_points_approx): 
+        # many cubes to search use the grid index, a few the blocks below 
+        if q is not None and np.prod(q.max(axis=0) + 1 + 2.0 * self.S_RADIUS) > BLOCK_ELEMENTS: 
+            q = None
+            if len(rows) * n > BLOCK_ELEMENTS: 
+                index = make_index('grid', self.cubes, self.dist)
+                delta, parent = index.nearest_higher(self.rho)
+                self.profile.count('distance_evals', index.dist_evals)
+                self.delta[rows], self.parent[rows] = delta[rows], parent[rows]
+                rows = rows[:0]
+        if q is not None: 
+            delta, parent = self.nearest_higher_lattice(q, rows)
+            self.delta[rows], self.parent[rows] = delta[rows], parent[rows]
+            rows = rows[self.parent[rows] < 0]
+        arrays = {'cubes': self.cubes, 'rho': self.rho}
+        blocks = [rows[b] for b in row_blocks(len(rows), n)]
+        for b, (delta, parent) in zip(blocks, map_blocks(self.pool, delta_block, blocks, arrays, self.dist)): 
+            self.delta[b], self.parent[b] = delta, parent
+            self.profile.count('distance_evals', len(b) * n)
+        self.seq_graph = (rho, np.zeros(m), np.full(m, -1, dtype=int))
+        self.seq_graph[1][active] = self.delta
+        self.seq_graph[2][active[self.parent >= 0]] = active[self.parent[self.parent >= 0]]
+        self.order = np.argsort(-self.rho, kind='stable')
+        self.delta *= self.DG_SCALING/self.delta.max()
+        self.dst = dict(zip(self.keys, self.delta.tolist()))
+        return self.dst
+
+    # segment the next frame of the sequence (PIL image or (h,w[,d]) array) 
+    def run_frame (self, image): 
+        t1 = perf_counter()
+        image = image if isinstance(image, Image.Image) else Image.fromarray(np.asarray(image))
+        pixels = np.asarray(image).reshape(-1, len(image.getbands()))
+        profile = StageProfile(self.hooks)
+        with profile.stage('preprocess'):
+            rows = self.update_histogram(pixels)
+        if len(rows) > 0 or self.frames == 0: 
+            self.initialise()
+            self.profile = profile
+            active = np.nonzero(self.seq_counts > 0)[0]
+            remap = np.zeros(len(self.seq_cubes), dtype=np.int64)
+            remap[active] = np.arange(len(active))
+            self.set_cubes(self.seq_cubes[active], self.seq_counts[active].astype(np.int64), remap[self.pixel_cube])
+            self.cluster()
+        self.profile = profile
+        self.image, self.points = image, pixels
+        self.profile.set('points', len(pixels))
+        self.profile.set('changed_pixels', len(rows))
+        self.frames += 1
+        self.seconds = perf_counter() - t1
+
+    # segment all frames of a source (see support.image_frames); yields the label map of each frame 
+    def run_sequence (self, source): 
+        for image in image_frames(source): 
+            self.run_frame(image)
+            yield self.get_labels().reshape(image.size[1], image.size[0])
+
+
+# bound of the error of the sampled density (engine 'approx', see DPPoints.density_sampled) for a sample 
+# of sample_size cubes: each of the independent draws adds a term between 0 and the total number of 
+# pixels W, so that (Hoeffding inequality) the estimated density of a cube differs from the exact density 
+# by at most sample_error(sample_size, confidence) * W with probability 'confidence'. E.g. the default 
+# SampleSize of 2000 gives 3.0% of W at 95%. The delta and parent of the cubes are exact for the densities 
+def sample_error(sample_size, confidence = 0.95):
+    return (log(2 / (1 - confidence)) / (2 * sample_size)) ** 0.5
+
+# smallest sample size (SampleSize) for which the error of the sampled density stays within tolerance * W 
+# with probability 'confidence' (see sample_error) 
+def sample_size(tolerance, confidence = 0.95):
+    return int(ceil(log(2 / (1 - confidence)) / (2 * tolerance * tolerance)))
+
+
+# run the exact engine ('sorted') and the approximate engine ('approx') on the same data and report the 
+# drift of the approximate centroids: the distance of each exact centroid to the nearest approximate 
+# centroid (and of each approximate centroid to the nearest exact one), the share of points in the same 
+# cluster (each approximate cluster taken as the cluster of its nearest exact centroid), the largest 
+# difference of the densities and its bound for the sampled density (both as share of the largest exact 
+# density), the share of cubes with a different delta (before the scaling) or parent and the runtimes 
+def compare_approx(data, dist = 'Euclidean', granularity = None, sample_size = None):
+    runs = dict()
+    for engine in ('sorted', 'approx'):
+        dp = DPPoints(dist, engine)
+        if granularity is not None:
+            dp.GRANULARITY = granularity
+        if sample_size is not None:
+            dp.SAMPLE_SIZE = sample_size
+        dp.run(data)
+        runs[engine] = dp
+    exact, approx = runs['sorted'], runs['approx']
+    # delta before the scaling: distance of each cube to its parent (the densest cube has none) 
+    delta = {engine: dist_rows(dp.cubes, dp.cubes[dp.parent], dist) * (dp.parent >= 0) for engine, dp in runs.items()}
+    # difference of the densities before the scaling, and the bound of the sampled density (95%, see 
+    # sample_error), as share of the largest exact density 
+    rho_error = np.abs(exact.rho * exact.rho_max - approx.rho * approx.rho_max).max() / (exact.DG_SCALING * exact.rho_max)
+    density_bound = 0.0
+    if approx.lattice_coords() is None and len(approx.keys) > approx.SAMPLE_SIZE: 
+        density_bound = float(sample_error(approx.SAMPLE_SIZE) * approx.weights.sum() / exact.rho_max)
+    d = dist_matrix(exact.get_palette(), approx.get_palette(), dist)
+    same = np.argmin(d, axis=0)[approx.get_labels()] == exact.get_labels()
+    return {'exact_centroids': len(exact.centroids), 'approx_centroids': len(approx.centroids),
+            'max_drift': float(d.min(axis=1).max()), 'mean_drift': float(d.min(axis=1).mean()),
+            'max_extra_drift': float(d.min(axis=0).max()), 'agreement': float(same.mean()),
+            'density_error': float(rho_error), 'density_bound': density_bound,
+            'delta_mismatch': float(np.mean(~np.isclose(delta['sorted'], delta['approx']))),
+            'parent_mismatch': float(np.mean(exact.parent != approx.parent)),
+            'exact_seconds': exact.seconds, 'approx_seconds': approx.seconds,
+            'speedup': exact.seconds / approx.seconds if approx.seconds > 0 else float('inf')}
@@ -0,0 +1,58 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from stages import Cancelled
+
+# Clustering runs in the background: a job runs a function of a clustering object (e.g. run_img of
+# DPImage or KMeansImage) in a thread of an executor. The events of the stage profile of the object
+# (see module stages) are collected in a queue, which the GUI polls from its own thread; a job that is
+# cancelled raises Cancelled at the next event of the run. numpy releases the interpreter lock in its
+# array operations, so that DP and KMEANS on the same image run concurrently in two threads.
+class Job:
+
+    def __init__(self, executor, model, run, *args, params = None):
+        self.model     = model                  # clustering object (with attribute hooks)
+        self.params    = params                 # parameters of the run for its result (e.g. the image of the GUI)
+        self.events    = queue.Queue()          # events (event, name, value) of the run, not yet polled
+        self.cancelled = threading.Event()
+        model.hooks.append(self.hook)
+        self.future    = executor.submit(run, *args)
+
+    # hook of the clustering object: called in the thread of the run
+    def hook (self, event, name, value):
+        if self.cancelled.is_set():
+            raise Cancelled(name)
+        self.events.put((event, name, value))
+
+    def cancel (self):
+        self.cancelled.set()
+        self.future.cancel()
+
+    # events of the run since the last call
+    def poll (self):
+        events = list()
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def done (self):
+        return self.future.done()
+
+    # result of the run function; raises Cancelled for a cancelled job (and any exception of the run)
+    def result (self):
+        if self.future.cancelled():
+            raise Cancelled('job')
+        return self.future.result()
+
+
+# executor for the jobs of the GUI: one thread for each clustering algorithm
+def job_executor (workers = 2):
+    return ThreadPoolExecutor(max_workers = workers)
@@ -6,14 +6,20 @@
 
 
 import random
-from functools import reduce 
-from datetime import datetime
+from time     import perf_counter
 
-from support import read_ini_section, read_ini_parameter, dist_func 
+import numpy as np
+
+from support import read_ini_section, read_ini_parameter, dist_matrix, dist_rows, row_blocks, quantize 
+from support import label_dtype, label_image, image_strips, source_shape, image_frames 
+from spatial import make_index
+from stages  import StageProfile 
+from superpixels import superpixel_settings, superpixel_quantize 
+from dp      import DPPoints 
 
 class KMeansPoints:
 
-    def __init__(self, k, dist = 'Euclidean', preprocessing = True):
+    def __init__(self, k, dist = 'Euclidean', preprocessing = True, index = None, init = None, algorithm = 'lloyd'):
         
         self.k = k            # input parameter K: number of clusters that should be calculated by algorithm
         
@@ -21,7 +27,15 @@ class KMeansPoints:
                                          # 'Euclidean', 'Manhattan' and 'Supremum' 
          
         self.preprocessing   = preprocessing 
+        self.index           = index     # optional spatial index over the means for the assignment of points 
+                                         # ('grid', 'brute' or an index class, see module spatial) 
+        self.algorithm       = algorithm # assignment step: 'lloyd' (all distances in each loop) or 'hamerly' 
+                                         # (bounds skip points whose group can not change; ignores index) 
+        if self.algorithm not in ('lloyd', 'hamerly'):
+            raise Exception('KMEANS algorithm '+self.algorithm+' is not defined in program')
         self.points          = list()    # list of original pixel stream (passed into the process) 
+        self.cache           = None      # optional HistogramCache for the preprocessing (see module cache) 
+        self.hooks           = list()    # callbacks hook(event, name, value) for the stages of a run (see module stages) 
         
         # this data is read in from the app.ini file - global section 
         sc = read_ini_section('GLOBAL') 
@@ -30,104 +44,228 @@ class KMeansPoints:
         # this data is read in from the app.ini file - section for KMEANS algorithm 
         sc = read_ini_section('KMEANS') 
         self.SET_RANDOM_SEED   = bool(read_ini_parameter(sc,'SetRandomSeed') == 'yes')
+        # initialisation of the means. Supported options are: 'random' (k random cubes), 'kmeans++' 
+        # (k-means++ weighted by the number of pixels in each cube) and 'dp' (centroids of the DP algorithm) 
+        self.init              = init if init is not None else read_ini_parameter(sc,'Initialisation')
+        if self.init not in ('random', 'kmeans++', 'dp'):
+            raise Exception('KMEANS initialisation '+self.init+' is not defined in program')
+        self.MAX_ITERATIONS    = int  (read_ini_parameter(sc,'MaxIterations'))
+        self.TOLERANCE         = float(read_ini_parameter(sc,'Tolerance'))
+        self.seed              = None    # seed of the initialisation (None: derived from k and the number of points) 
         
         self.initialise()
         
         
     def initialise (self):  
         self.seconds         = 0         # measure time for run
+        self.profile         = StageProfile(self.hooks) # times of the stages and counters of the last run 
         self.counter         = 0         # record the number of loops in the KMEANS process 
-        self.p_map           = dict()    # map original pixels to approximated pixels
+        self.inverse         = np.empty(0, dtype=int) # index of the approximated pixel (cube) for each original pixel
+        self.keys            = list()    # list of approximated pixels (keys of pnts) 
         self.pnts            = dict()    # dictionary with pre-processed pixels, value contains count for pixel 
         self.assigned_group  = dict()    # dictionary with assigned groups
-        self.prnt_sum        = dict() 
         self.means           = list()    # current means values 
         self.new_means       = list()    # newly calculate means values 
-        self.prnt_sum        = dict() 
+        self.cubes           = np.empty((0, 0))   # (n,d) array with the pre-processed pixels (keys of pnts) 
+        self.weights         = np.empty(0)        # number of pixels in each cube 
+        self.labels          = np.empty(0, dtype=int) # assigned group for each cube 
+        self.dist_evals      = 0         # number of distance calculations in the assignment steps 
+        self.dist_skipped    = 0         # number of point to mean distances skipped (compared to lloyd) 
+        self.upper           = np.empty(0)        # hamerly: upper bound of distance to the assigned mean 
+        self.lower           = np.empty(0)        # hamerly: lower bound of distance to any other mean 
+        self.bound_means     = np.empty((0, 0))   # hamerly: means at the time of the last assignment 
    
     # This  method returns the clustered data stream 
     def get_data(self):
-        return [[p for p in self.points if self.assigned_group[p] == i] for i in range(self.k)]
+        groups = [self.assigned_group[p] for p in self.keys]
+        points = np.asarray(self.points).reshape(len(self.inverse), -1).tolist()
+        return [[tuple(p) for p, j in zip(points, self.inverse.tolist()) if groups[j] == i] for i in range(self.k)]
     
     # preprocessed image data (to improve runtimes of clustering algorithm)
     def get_pre_processed_data (self):
-        return [self.p_map[p] for p in self.points]
+        return [self.keys[i] for i in self.inverse.tolist()]
+
+    # compact output of the clustering: label map with the group (0 ... k-1) of each original point, 
+    # as uint8 (up to 256 clusters) or uint16 array 
+    def get_labels (self):
+        groups = np.array([self.assigned_group[p] for p in self.keys], dtype=label_dtype(self.k))
+        return groups[self.inverse]
+
+    # palette for the label map: one row with the mean for each group 
+    def get_palette (self):
+        return np.array(self.means, dtype=float).reshape(self.k, -1)
 
-    # pre-process the image data 
+    # pre-process the image data: quantize the points into cubes (see support.quantize), 
+    # or only count the distinct points when preprocessing is switched off 
     def pre_process_points (self, data): 
-        self.points = [tuple(p) for p in data] 
-        self.pnts = dict()
-        self.p_map = dict() 
-        for _pp in self.points:
-            pp = list(_pp)
-            if self.preprocessing:
-                p = tuple(map(lambda x: ((int(x/self.GRANULARITY))*self.GRANULARITY) + int(self.GRANULARITY/2), list(pp)))
-            else:
-                p = tuple(pp)
-            if p not in self.pnts: 
-                self.pnts[p] = 1
-            else: 
-                self.pnts[p] = self.pnts[p] + 1
-            if _pp not in self.p_map: 
-                self.p_map[_pp] = p
+        self.points = data 
+        quantizer = quantize if self.cache is None else self.cache.quantize
+        self.set_cubes(*quantizer(data, self.GRANULARITY if self.preprocessing else None))
+
+    # set the pre-processed points: the distinct cubes, the number of points in each cube and the 
+    # inverse index from the original points to the cubes 
+    def set_cubes (self, cubes, counts, inverse): 
+        self.keys = [tuple(p) for p in cubes.tolist()]
+        self.pnts = dict(zip(self.keys, counts.tolist()))
+        self.cubes   = cubes.astype(float).reshape(len(self.keys), -1)
+        self.weights = counts.astype(float)
+        self.inverse = inverse
     
             
-    # adds the values of two lists for each dimension    
-    # for example:  sum_dimensions([1,2,3],[4,5,6]) = [5,7,9]
-    def sum_dimensions(self,lst1,lst2):
-        return [lst1_i + lst2_i for lst1_i, lst2_i in zip(lst1, lst2)]
-
-
-    # calculate the mean value of the lists across all dimensions 
-    # (which are the 3 RGB channels for images)
-    # input is a list of points (lists)
-    # for example: mean_func([[1,2,3],[4,5,6]]) = [2.5, 3.5, 4.5]
-    def mean_func(self,lists, i): 
-        l = sum([self.pnts[tuple(p)] for p in self.pnts if self.assigned_group[p] == i])
-        if l > 0:   # avoid division by zero 
-            # sum up across all dimensions 
-            vs = reduce(self.sum_dimensions, lists)
-            # divide by the number of points to get the mean across each dimension
-            return [(1/l) * v_i for v_i in vs]
+    # assign each point to the group of the mean it is closest to, with a distance matrix of the 
+    # cubes against the means (in blocks of rows); with a spatial index over the means only the 
+    # means in the grid cells close to a point are compared with the point 
+    def assign_groups (self):
+        means = np.array(self.new_means, dtype=float)
+        if self.algorithm == 'hamerly':
+            return self.assign_groups_hamerly(means)
+        if self.index is not None:
+            index = make_index(self.index, means, self.dist)
+            _, self.labels = index.nearest(self.cubes)
+            self.dist_evals += index.dist_evals
         else:
-            return 0; # consider the mean to be zero when the list is empty
+            n = len(self.cubes)
+            self.labels = np.zeros(n, dtype=int)
+            for rows in row_blocks(n, len(means)):
+                self.labels[rows] = np.argmin(dist_matrix(self.cubes[rows], means, self.dist), axis=1)
+            self.dist_evals += n * len(means)
+
+    # assign the cubes in the given rows to their closest mean, and set the upper bound (distance to 
+    # that mean) and lower bound (distance to the second closest mean) for these cubes 
+    def assign_rows (self, rows, means):
+        for block in row_blocks(len(rows), len(means)):
+            r = rows[block]
+            d = dist_matrix(self.cubes[r], means, self.dist)
+            self.labels[r] = np.argmin(d, axis=1)
+            self.upper[r] = d[np.arange(len(r)), self.labels[r]]
+            d[np.arange(len(r)), self.labels[r]] = np.inf
+            self.lower[r] = d.min(axis=1)
+        self.dist_evals += len(rows) * len(means)
+
+    # assignment with Hamerly's bounds (triangle inequality): the upper bound grows and the lower 
+    # bound shrinks by the distance the means have moved since the last assignment. A cube keeps its 
+    # group without any distance calculation, as long as its upper bound does not exceed its lower bound 
+    # or half the distance from its mean to the closest other mean 
+    def assign_groups_hamerly (self, means):
+        n, k = len(self.cubes), len(means)
+        if len(self.upper) != n:
+            self.labels = np.zeros(n, dtype=int)
+            self.upper  = np.zeros(n)
+            self.lower  = np.zeros(n)
+            self.assign_rows(np.arange(n), means)
+            self.bound_means = means
+            return
+        evals = self.dist_evals
+        moved = dist_rows(self.bound_means, means, self.dist)
+        self.upper += moved[self.labels]
+        self.lower -= moved.max()
+        cc = dist_matrix(means, means, self.dist)
+        np.fill_diagonal(cc, np.inf)
+        self.dist_evals += k * k
+        bound = np.maximum(cc.min(axis=1)[self.labels] / 2, self.lower)
+        # tighten the upper bound for the remaining cubes, then check all means for those still above 
+        rows = np.nonzero(self.upper > bound)[0]
+        self.upper[rows] = dist_rows(self.cubes[rows], means[self.labels[rows]], self.dist)
+        self.dist_evals += len(rows)
+        rows = rows[self.upper[rows] > bound[rows]]
+        self.assign_rows(rows, means)
+        self.dist_skipped += n * k - (self.dist_evals - evals - k * k)
+        self.bound_means = means
+
+    # calculate the weighted mean of the cubes in each group (weighted with the number of pixels in 
+    # each cube); groups without any cubes keep their previous mean 
+    def update_means (self):
+        means  = np.array(self.new_means, dtype=float)
+        counts = np.bincount(self.labels, weights=self.weights, minlength=self.k)
+        for j in range(self.cubes.shape[1]):
+            sums = np.bincount(self.labels, weights=self.weights * self.cubes[:, j], minlength=self.k)
+            means[counts > 0, j] = sums[counts > 0] / counts[counts > 0]
+        return means.tolist()
+
+    # k-means++ initialisation: the first mean is a random cube (weighted by its number of pixels), 
+    # each further mean is a random cube with probability proportional to the number of pixels times 
+    # the squared distance to the closest mean chosen so far 
+    def init_kmeanspp (self, rng, means = None):
+        means = list() if means is None else list(means)
+        n = len(self.cubes)
+        if len(means) == 0:
+            means.append(self.cubes[rng.choice(n, p=self.weights/self.weights.sum())].tolist())
+        d2 = dist_matrix(self.cubes, np.array(means), self.dist).min(axis=1) ** 2
+        while len(means) < self.k:
+            p = self.weights * d2
+            i = rng.choice(n, p=p/p.sum()) if p.sum() > 0 else rng.choice(n)
+            means.append(self.cubes[i].tolist())
+            d2 = np.minimum(d2, dist_matrix(self.cubes, self.cubes[i:i+1], self.dist)[:, 0] ** 2)
+        return means
+
+    # DP initialisation: the centroids (outliers in the decision graph) found by the DP algorithm on 
+    # the same cubes, taken in order of decreasing density; missing means are added with k-means++ 
+    def init_dp (self, rng):
+        dp = DPPoints(self.dist)
+        dp.GRANULARITY = self.GRANULARITY if self.preprocessing else 1
+        # the DP run reports its stages to the hooks of the KMEANS run (so that it can be cancelled) 
+        dp.hooks = self.hooks
+        dp.run_cubes(self.cubes, self.weights)
+        centroids = sorted(dp.centroids, key = lambda p: -dp.dens[p])[:self.k]
+        return self.init_kmeanspp(rng, [list(p) for p in centroids])
+
+    # pick the k initial means according to the initialisation option; the runs are reproducible 
+    # (with the same seed for all options) when SetRandomSeed is switched on or a seed is set 
+    def init_means (self):
+        if self.k > len(self.keys):
+            raise Exception('KMEANS with k='+str(self.k)+' needs at least k distinct cubes, but the data has only '+str(len(self.keys)))
+        seed = self.seed
+        if seed is None and self.SET_RANDOM_SEED:
+            seed = self.k * len(self.points)
+        if self.init == 'random':
+            if seed is not None:
+                random.seed(seed)
+            return [list(r) for r in random.sample(self.keys, self.k)]
+        rng = np.random.default_rng(seed)
+        if self.init == 'kmeans++':
+            return self.init_kmeanspp(rng)
+        return self.init_dp(rng)
 
     # last not least, run all steps of the DP algorithm in the single function call 'run' and measure the time 
     def run(self, data):
-        self.points = [tuple(p) for p in data]
+        self.points = data
         # initialise data 
         self.initialise()
-        t1 = datetime.now()
+        t1 = perf_counter()
         # preprocess the pixels 
-        self.pre_process_points(data)
-        # pick k random points to start with the process and assign points to groups accordingly
-        if self.SET_RANDOM_SEED:
-            random.seed(self.k * len(self.points))
-        rnd  = random.sample(self.pnts.keys(), self.k) 
-        self.new_means = [list(r) for r in rnd]
+        with self.profile.stage('preprocess'):
+            self.pre_process_points(data)
+        self.profile.set('points', len(self.inverse))
+        self.profile.set('cubes', len(self.keys))
+        # pick k initial means to start with the process and assign points to groups accordingly
+        with self.profile.stage('init'):
+            self.new_means = self.init_means()
         self.means = list()  
-        self.prnt_sum = dict()
 
         # assign groups accordingly to the centre they are closest to 
-        for p in self.pnts.keys():
-            self.assigned_group[p] = min([i for i, _ in enumerate(self.new_means)], 
-                                         key = lambda x: dist_func(list(p), list(self.new_means[x]), self.dist))  
-            self.prnt_sum [p] = list([i * self.pnts[p] for i in list(p)]) 
+        with self.profile.stage('assign'):
+            self.assign_groups()
         
-        # break, once we don't get any changes any more in the cluster means 
-        while self.means != self.new_means:
+        # break, once the cluster means move less than TOLERANCE (or after MAX_ITERATIONS loops) 
+        while self.counter < self.MAX_ITERATIONS:
             self.counter = self.counter + 1         # increment counter by 1 
+            self.profile.set('iterations', self.counter)
             self.means = self.new_means
             # Recalculate the k centroids, based on the new data
-            self.new_means = [self.mean_func([self.prnt_sum [p] for p in self.pnts.keys() if self.assigned_group[p] == i], i) 
-                              for i in range(self.k)]
-            
+            with self.profile.stage('update'):
+                self.new_means = self.update_means()
             # assign groups accordingly to the centre they are closest to 
-            for p in self.pnts.keys():
-                self.assigned_group[p] = min([i for i, _ in enumerate(self.new_means)], 
-                                             key = lambda x: dist_func(list(p), list(self.new_means[x]), self.dist)) 
-        t2 = datetime.now()
-        self.seconds = (t2-t1).seconds
+            with self.profile.stage('assign'):
+                self.assign_groups()
+            shift = np.abs(np.array(self.new_means) - np.array(self.means)).max()
+            if shift <= self.TOLERANCE:
+                break
+        self.means = self.new_means
+        self.assigned_group = dict(zip(self.keys, self.labels.tolist()))
+        self.profile.set('distance_evals', self.dist_evals)
+        self.profile.set('distances_skipped', self.dist_skipped)
+        t2 = perf_counter()
+        self.seconds = t2 - t1
 
 #
 # now derive a separate class for the kmeans algorithm on images. It is basically 'wrapped around'
@@ -139,20 +277,192 @@ from PIL import Image
 # https://pillow.readthedocs.io/en/5.1.x/reference/Image.html 
 
 class KMeansImage(KMeansPoints): 
-    def __init__(self, k, dist='Euclidean',preprocessing=True):
-        KMeansPoints.__init__(self, k, dist, preprocessing)
+    def __init__(self, k, dist='Euclidean',preprocessing=True, index=None, init=None, algorithm='lloyd'):
+        KMeansPoints.__init__(self, k, dist, preprocessing, index, init, algorithm)
         self.image = list()
+        self.superpixel = np.empty(0, dtype=int)    # index of the superpixel of each pixel (if Segments > 0) 
+        # this data is read in from the app.ini file - section for superpixels 
+        self.SEGMENTS, self.COMPACTNESS, self.SP_ITERATIONS = superpixel_settings()
+
+    # quantize the pixels, or with Segments > 0 (see app.ini) the mean colours of their superpixels, 
+    # weighted with the number of pixels (see module superpixels; the histogram cache is not used then) 
+    def pre_process_points (self, data): 
+        if self.SEGMENTS <= 0: 
+            return KMeansPoints.pre_process_points(self, data)
+        self.points = data
+        cubes, counts, inverse, self.superpixel = superpixel_quantize(np.asarray(self.image), 
+                                                  self.GRANULARITY if self.preprocessing else None, 
+                                                  self.SEGMENTS, self.COMPACTNESS, self.SP_ITERATIONS)
+        self.set_cubes(cubes, counts, inverse)
               
+    # the pixels are passed on as (n,d) array on the image buffer, with one row for each pixel 
     def pre_process_img (self, image): 
         self.image = image
-        self.points = list(image.getdata())
-        KMeansPoints.pre_process_points(self, self.points)
+        self.points = np.asarray(image).reshape(-1, len(image.getbands()))
+        self.pre_process_points(self.points)
         
     def run_img(self, image):
         self.image = image
-        self.points = list(image.getdata())
+        self.points = np.asarray(image).reshape(-1, len(image.getbands()))
         KMeansPoints.run(self, self.points)
     def get_data_img (self):
         # now convert to an integer
-        rmeans = [list(map(int,m)) for m in self.means]
-        return [tuple(rmeans[self.assigned_group[self.p_map[p]]]) for p in self.points] 
\ No newline at end of file
+        rmeans = [tuple(map(int,m)) for m in self.means]
+        groups = [rmeans[self.assigned_group[p]] for p in self.keys]
+        return [groups[i] for i in self.inverse.tolist()]
+
+    # segmented image, rendered from the label map and palette (means converted to integers) 
+    def get_image (self):
+        return label_image(self.get_labels(), np.trunc(self.get_palette()), self.image.size)
+
+
+#
+# KMEANS for video and image sequences: consecutive frames have nearly the same colours, so that each 
+# frame starts from the means of the previous frame (warm start) instead of the initialisation option, 
+# and usually needs only a few loops. The first frame (and the first frame after a reset) is initialised 
+# as in KMeansImage. 
+class KMeansSequence(KMeansImage):
+    def __init__(self, k, dist='Euclidean', preprocessing=True, index=None, init=None, algorithm='lloyd'):
+        KMeansImage.__init__(self, k, dist, preprocessing, index, init, algorithm)
+        self.reset()
+
+    # forget the means of the previous frame 
+    def reset (self):
+        self.frames     = 0           # number of frames since the last reset 
+        self.warm_means = list()      # means of the previous frame 
+
+    def init_means (self):
+        if len(self.warm_means) == self.k:
+            return [list(m) for m in self.warm_means]
+        return KMeansImage.init_means(self)
+
+    # segment the next frame of the sequence (PIL image or (h,w[,d]) array) 
+    def run_frame (self, image):
+        image = image if isinstance(image, Image.Image) else Image.fromarray(np.asarray(image))
+        self.run_img(image)
+        self.profile.set('warm_start', int(len(self.warm_means) == self.k))
+        self.warm_means = self.means
+        self.frames += 1
+
+    # segment all frames of a source (see support.image_frames); yields the label map of each frame 
+    def run_sequence (self, source):
+        for image in image_frames(source):
+            self.run_frame(image)
+            yield self.get_labels().reshape(image.size[1], image.size[0])
+
+#
+# streaming version of the KMEANS algorithm for images that are too large to be held in memory as a
+# whole: the image is read in strips of rows, the means are updated with mini-batch steps on the cube 
+# histogram of each strip, and a second pass over the strips assigns the labels. For arrays (.npy files) 
+# and uncompressed image files (BMP, PPM, uncompressed TIFF) memory is bounded by one strip of pixels and 
+# its cube histogram, independent of the size of the image; compressed image files (JPEG, PNG, compressed 
+# TIFF) are decoded as a whole in each pass (see support.image_strips) 
+class KMeansStream(KMeansPoints):
+    def __init__(self, k, dist='Euclidean', preprocessing=True, init=None, strip_rows=256, passes=3):
+        KMeansPoints.__init__(self, k, dist, preprocessing, None, init)
+        self.strip_rows   = strip_rows    # number of image rows read in each strip
+        self.passes       = passes        # maximum number of passes over the image for the mini-batch updates
+        self.size         = (0, 0)        # size (width, height) of the streamed image 
+        self.batch_counts = np.zeros(k)   # number of pixels seen by each mean (learning rate 1/count)
+        self.label_map    = np.empty((0, 0), dtype=np.uint8) # labels written by run_stream
+
+    # cubes (quantized pixels) and their counts for a strip of pixels 
+    def strip_cubes (self, pixels):
+        cubes, counts, inverse = quantize(pixels, self.GRANULARITY if self.preprocessing else None)
+        return cubes.astype(float).reshape(len(cubes), -1), counts.astype(float), inverse
+
+    # index of the closest mean for each of the cubes
+    def nearest_means (self, cubes):
+        means  = np.array(self.new_means, dtype=float)
+        labels = np.zeros(len(cubes), dtype=int)
+        for rows in row_blocks(len(cubes), self.k):
+            labels[rows] = np.argmin(dist_matrix(cubes[rows], means, self.dist), axis=1)
+        self.dist_evals += len(cubes) * self.k
+        return labels
+
+    # mini-batch step on the cubes of one strip: each mean moves towards the weighted mean of its 
+    # cubes in the strip, with a learning rate of (pixels in the strip) / (all pixels seen by the mean) 
+    def batch_update (self, cubes, counts):
+        labels = self.nearest_means(cubes)
+        w = np.bincount(labels, weights=counts, minlength=self.k)
+        self.batch_counts += w
+        means = np.array(self.new_means, dtype=float)
+        for j in range(cubes.shape[1]):
+            sums = np.bincount(labels, weights=counts * cubes[:, j], minlength=self.k)
+            means[w > 0, j] += (sums[w > 0] - w[w > 0] * means[w > 0, j]) / self.batch_counts[w > 0]
+        self.new_means = means.tolist()
+        self.counter = self.counter + 1
+
+    # first pass(es): fit the means on the strips of the image (PIL image, array or file name). The 
+    # initial means are picked from the first strip with at least k distinct cubes 
+    def fit_stream (self, source):
+        self.initialise()
+        self.size, _ = source_shape(source)
+        self.batch_counts = np.zeros(self.k)
+        for _ in range(self.passes):
+            start = np.array(self.new_means, dtype=float)
+            for y, pixels in image_strips(source, self.strip_rows):
+                cubes, counts, _ = self.strip_cubes(pixels)
+                if len(self.new_means) == 0:
+                    if len(cubes) < self.k:
+                        continue
+                    self.points, self.cubes, self.weights = pixels, cubes, counts
+                    self.keys = [tuple(p) for p in cubes.tolist()]
+                    self.new_means = self.init_means()
+                self.batch_update(cubes, counts)
+            if len(start) > 0 and np.abs(np.array(self.new_means) - start).max() <= self.TOLERANCE:
+                break
+        self.means = self.new_means
+        self.cubes, self.weights, self.points, self.keys = np.empty((0, 0)), np.empty(0), list(), list()
+
+    # second pass: yields the first row and the labels of each strip 
+    def label_stream (self, source):
+        dtype = label_dtype(self.k)
+        for y, pixels in image_strips(source, self.strip_rows):
+            cubes, _, inverse = self.strip_cubes(pixels)
+            yield y, self.nearest_means(cubes).astype(dtype)[inverse]
+
+    # fit the means and write the label map of the image into 'out' (an (h,w) array, e.g. a memory-mapped 
+    # file from np.lib.format.open_memmap); without 'out' the label map is allocated in memory 
+    def run_stream (self, source, out = None):
+        t1 = perf_counter()
+        self.fit_stream(source)
+        width, height = self.size
+        if out is None:
+            out = np.zeros((height, width), dtype=label_dtype(self.k))
+        for y, labels in self.label_stream(source):
+            out[y:y + len(labels) // width] = labels.reshape(-1, width)
+        self.label_map = out
+        t2 = perf_counter()
+        self.seconds = t2 - t1
+        return out
+
+    def get_labels (self):
+        return np.asarray(self.label_map).reshape(-1)
+
+    # segmented image, rendered from the label map and palette (means converted to integers) 
+    def get_image (self):
+        return label_image(self.label_map, np.trunc(self.get_palette()), self.size)
+
+
+# run KMEANS with each of the initialisation options on the same data, once for each of the seeds, and 
+# report the number of loops and the runtime of each run, with their mean for each option (a single run 
+# says little, as the loops of all options vary widely with the initial means). loops_saved is the mean 
+# number of loops saved against the 'random' initialisation (which is run as well if not in inits) 
+def compare_inits(data, k, dist = 'Euclidean', preprocessing = True, inits = ('random', 'kmeans++', 'dp'), seeds = range(5)):
+    report = dict()
+    for init in ('random',) + tuple(i for i in inits if i != 'random'):
+        loops, seconds = list(), list()
+        for seed in seeds:
+            km = KMeansPoints(k, dist, preprocessing, init = init)
+            km.seed = seed
+            t1 = perf_counter()
+            km.run(data)
+            seconds.append(perf_counter() - t1)
+            loops.append(km.counter)
+        report[init] = {'loops': loops, 'mean_loops': float(np.mean(loops)), 'min_loops': min(loops), 
+                        'max_loops': max(loops), 'seconds': seconds, 'mean_seconds': float(np.mean(seconds))}
+        report[init]['loops_saved'] = report['random']['mean_loops'] - report[init]['mean_loops']
+    if 'random' not in inits:
+        del report['random']
+    return report
@@ -0,0 +1,172 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+# Loader for generic point data sets (e.g. tabular feature data) for DPPoints and KMeansPoints. CSV, XLSX
+# and .npy files are read in chunks of CHUNK_ROWS rows into a memory-mapped (n,d) float array in a .npy
+# file, so that data sets with millions of rows never have to be held in memory as a whole (or as lists
+# of tuples). The clustering algorithms run directly on the array, with any number of columns; with a
+# granularity the rows are quantized into cubes on the N-dimensional grid, chunk by chunk (see
+# support.quantize_chunks).
+#
+#   from loader import load_points
+#   data = load_points('testdata/testdata.xlsx')
+#   dp = DPPoints('Euclidean'); dp.GRANULARITY = 4; dp.run(data)
+#
+# The first row of a CSV or XLSX file is taken as header if it is not numeric. XLSX files are read
+# with the standard library (zipfile), without any further package.
+
+import csv
+import os
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from support import CHUNK_ROWS
+
+XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+# rows of a CSV file as lists of strings; the delimiter (comma, semicolon, tab or space) is taken from
+# the start of the file
+def csv_rows(file_name):
+    with open(file_name, newline='') as f:
+        sample = f.read(1 << 16)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t ')
+        except csv.Error:
+            dialect = csv.excel
+        for row in csv.reader(f, dialect):
+            if len(row) > 0:
+                yield row
+
+
+# column index (0 for A) of an XLSX cell reference such as 'AB12'
+def xlsx_column(ref):
+    col = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        col = col * 26 + ord(ch.upper()) - ord('A') + 1
+    return col - 1
+
+
+# rows of the first worksheet of an XLSX file as lists of strings; the sheet is parsed row by row, so that
+# only the shared strings (e.g. the header) are held in memory
+def xlsx_rows(file_name):
+    with zipfile.ZipFile(file_name) as z:
+        strings = list()
+        if 'xl/sharedStrings.xml' in z.namelist():
+            for si in ET.fromstring(z.read('xl/sharedStrings.xml')).iter(XLSX_NS+'si'):
+                strings.append(''.join(t.text or '' for t in si.iter(XLSX_NS+'t')))
+        sheets = sorted(n for n in z.namelist() if n.startswith('xl/worksheets/sheet') and n.endswith('.xml'))
+        if len(sheets) == 0:
+            raise Exception('XLSX file '+file_name+' has no worksheet')
+        with z.open(sheets[0]) as f:
+            for _, row in ET.iterparse(f):
+                if row.tag != XLSX_NS+'row':
+                    continue
+                values = dict()
+                for c in row.iter(XLSX_NS+'c'):
+                    v = c.find(XLSX_NS+'v')
+                    if c.get('t') == 's':
+                        values[xlsx_column(c.get('r'))] = strings[int(v.text)]
+                    elif c.get('t') == 'inlineStr':
+                        values[xlsx_column(c.get('r'))] = ''.join(t.text or '' for t in c.iter(XLSX_NS+'t'))
+                    elif v is not None:
+                        values[xlsx_column(c.get('r'))] = v.text
+                row.clear()
+                if len(values) > 0:
+                    yield [values.get(i, '') for i in range(max(values) + 1)]
+
+
+# numeric rows of a CSV or XLSX file in chunks of (rows, columns) float arrays; a first row that is not
+# numeric is skipped as header, and all rows must have as many columns as the first numeric row. 'columns'
+# selects columns by index (default: all columns)
+def table_chunks(rows, file_name, columns = None, chunk_rows = CHUNK_ROWS):
+    chunk = list()
+    width = None
+    for i, row in enumerate(rows):
+        if columns is not None:
+            row = [row[c] if c < len(row) else '' for c in columns]
+        try:
+            values = [float(x) for x in row]
+        except ValueError:
+            if i == 0:
+                continue
+            raise Exception('Row '+str(i + 1)+' is not numeric: '+str(row))
+        if width is None:
+            width = len(values)
+        if len(values) != width:
+            raise Exception('Data file '+file_name+' has rows of different lengths: row '+str(i + 1)+' has '+
+                            str(len(values))+' columns instead of '+str(width))
+        chunk.append(values)
+        if len(chunk) == chunk_rows:
+            yield np.array(chunk)
+            chunk = list()
+    if len(chunk) > 0:
+        yield np.array(chunk)
+
+
+# chunks of a .npy file (memory-mapped), as (rows, columns) float arrays
+def npy_chunks(file_name, columns = None, chunk_rows = CHUNK_ROWS):
+    a = np.load(file_name, mmap_mode='r')
+    a = a.reshape(len(a), -1)
+    for start in range(0, len(a), chunk_rows):
+        chunk = np.asarray(a[start:start + chunk_rows], dtype=float)
+        yield chunk if columns is None else chunk[:, columns]
+
+
+# chunks of a data file, by file extension (.csv/.txt, .xlsx or .npy)
+def data_chunks(file_name, columns = None, chunk_rows = CHUNK_ROWS):
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext in ('.csv', '.txt'):
+        return table_chunks(csv_rows(file_name), file_name, columns, chunk_rows)
+    if ext == '.xlsx':
+        return table_chunks(xlsx_rows(file_name), file_name, columns, chunk_rows)
+    if ext == '.npy':
+        return npy_chunks(file_name, columns, chunk_rows)
+    raise Exception('Data file type '+ext+' is not defined in program')
+
+
+# load a data file into a memory-mapped (n,d) float array, saved as .npy file 'out' (default: a new file
+# in the temporary directory). The chunks are appended to a raw file first (the number of rows of a CSV or
+# XLSX file is only known at its end), and then copied into the .npy file, chunk by chunk. A .npy file of
+# floats without column selection is mapped as it is
+def load_points(file_name, out = None, columns = None, chunk_rows = CHUNK_ROWS):
+    if file_name.lower().endswith('.npy') and columns is None and out is None:
+        a = np.load(file_name, mmap_mode='r')
+        if a.dtype == np.float64:
+            return a.reshape(len(a), -1)
+    temporary = out is None
+    if temporary:
+        fd, out = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+    n, d = 0, None
+    try:
+        with open(out + '.raw', 'wb') as raw:
+            for chunk in data_chunks(file_name, columns, chunk_rows):
+                if d is not None and chunk.shape[1] != d:
+                    raise Exception('Data file '+file_name+' has rows of different lengths')
+                d = chunk.shape[1]
+                raw.write(np.ascontiguousarray(chunk, dtype=np.float64).tobytes())
+                n += len(chunk)
+        data = np.lib.format.open_memmap(out, mode='w+', dtype=np.float64, shape=(n, d if d is not None else 0))
+        if n > 0:
+            source = np.memmap(out + '.raw', dtype=np.float64, mode='r', shape=(n, d))
+            for start in range(0, n, chunk_rows):
+                data[start:start + chunk_rows] = source[start:start + chunk_rows]
+            del source
+        data.flush()
+    except Exception:
+        if temporary:
+            os.remove(out)
+        raise
+    finally:
+        if os.path.exists(out + '.raw'):
+            os.remove(out + '.raw')
+    return np.load(out, mmap_mode='r')
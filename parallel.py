@@ -0,0 +1,101 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing    import shared_memory
+
+import numpy as np
+
+# Pool of worker processes for block computations on shared arrays. The arrays are copied once
+# into shared memory, and the workers attach to them by name, so that they are not pickled for
+# each block. A block function has the signature fn(arrays, rows, *args), where arrays is a
+# dictionary of the shared numpy arrays and rows is the block (slice) to be computed. Serial
+# runs call the same block functions on the original arrays (see function map_blocks).
+
+
+# attach to shared arrays in a worker process; specs maps each array name to the name, shape and
+# data type of its shared memory block
+def attach(specs):
+    handles, arrays = list(), dict()
+    for key, (name, shape, dtype) in specs.items():
+        # the parent process owns the shared memory and removes it (the workers share its resource tracker)
+        shm = shared_memory.SharedMemory(name=name)
+        handles.append(shm)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return handles, arrays
+
+
+# run a block function in a worker process on the shared arrays
+def run_shared(fn, specs, rows, *args):
+    handles, arrays = attach(specs)
+    try:
+        result = fn(arrays, rows, *args)
+        # results must not refer to the shared memory after it has been closed
+        return tuple(np.array(r) for r in result) if isinstance(result, tuple) else np.array(result)
+    finally:
+        del arrays
+        for shm in handles:
+            shm.close()
+
+
+class SharedPool:
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool    = ProcessPoolExecutor(max_workers = workers)
+        self.memory  = dict()      # shared memory block for each array name
+        self.specs   = dict()      # name, shape and data type of the shared memory for each array name
+        self.source  = dict()      # array that has been copied into the shared memory (for each name)
+
+    # copy arrays into shared memory (arrays that have already been shared are not copied again)
+    def share(self, arrays):
+        for key, a in arrays.items():
+            if self.source.get(key) is a:
+                continue
+            self.release(key)
+            a = np.ascontiguousarray(a)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+            np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+            self.memory[key] = shm
+            self.specs[key]  = (shm.name, a.shape, a.dtype.str)
+            self.source[key] = arrays[key]
+
+    # compute the block function for all blocks in the worker processes; all blocks are submitted at once, 
+    # and the results are returned (as iterator) in order of the blocks, as soon as they are available
+    def map(self, fn, blocks, *args):
+        jobs = [self.pool.submit(run_shared, fn, self.specs, rows, *args) for rows in blocks]
+        return (job.result() for job in jobs)
+
+    # view of the shared memory of an array, e.g. to read the results that the workers have written into 
+    # it; the view is only valid until the array is released 
+    def shared (self, key):
+        name, shape, dtype = self.specs[key]
+        return np.ndarray(shape, dtype=dtype, buffer=self.memory[key].buf)
+
+    def release(self, key):
+        if key in self.memory:
+            self.memory[key].close()
+            self.memory[key].unlink()
+            del self.memory[key], self.specs[key], self.source[key]
+
+    def close(self):
+        self.pool.shutdown()
+        for key in list(self.memory.keys()):
+            self.release(key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# compute a block function for all blocks, in the shared pool (if given) or serially; the results are
+# returned as iterator, so that the caller can process (and report) each block once it is done
+def map_blocks(pool, fn, blocks, arrays, *args):
+    if pool is None:
+        return (fn(arrays, rows, *args) for rows in blocks)
+    pool.share(arrays)
+    return pool.map(fn, blocks, *args)
@@ -0,0 +1,305 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+# Local segmentation service: a long-running HTTP server that segments images with the DP and KMEANS
+# algorithms for other programs, without starting a Python process (or the GUI) for each image. The
+# images are segmented in a pool of worker processes, which are started once (with the clustering
+# modules imported, app.ini read in and a histogram cache in memory) and stay warm between requests.
+# Requests that come in together are grouped into batches (up to BatchSize requests, collected for at
+# most BatchWindow seconds), and each batch is sent to a worker process as one task.
+#
+#   python service.py [--host 127.0.0.1] [--port 8765] [--workers N]
+#
+#   POST /segment?alg=dp&granularity=16&dist=Euclidean&output=image     body: image file (any PIL format)
+#        parameters: alg (dp, kmean), k (KMEANS), granularity, dist, pct_outlier, density_min,
+#        d_scaling (DP thresholds, default: app.ini) and output: 'image' (segmented image as PNG) or
+#        'labels' (.npz file with the label map 'labels' (h,w) and the 'palette' of the clusters)
+#   GET  /stats      queue depth, number of requests and batches, latency percentiles (JSON)
+#
+# Defaults are read in from the SERVICE section of app.ini.
+
+import argparse
+import io
+import json
+import queue
+import signal
+import threading
+from collections        import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server        import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time               import perf_counter
+from urllib.parse       import urlparse, parse_qs
+
+import numpy as np
+
+from support import read_ini_section, read_ini_parameter
+
+ALGORITHMS = ('dp', 'kmean')
+METRICS    = ('Euclidean', 'Manhattan', 'Supremum')
+OUTPUTS    = ('image', 'labels')
+
+# histogram cache of a worker process (see warm_worker)
+worker_cache = None
+
+
+# start of a worker process: import the clustering modules and set up the histogram cache once, so that
+# the requests do not wait for them. The cache of each worker is kept in memory only (the workers would
+# otherwise write and evict the same files in the cache directory)
+def warm_worker():
+    global worker_cache
+    import dp, kmeans
+    from cache import HistogramCache
+    sc = read_ini_section('CACHE')
+    worker_cache = HistogramCache(None, int(read_ini_parameter(sc,'MemoryItems')))
+
+
+# segment one image (request parameters and image file content) in a worker process; returns the content
+# type and the content of the response
+def segment_request(params, content):
+    from PIL    import Image
+    from kmeans import KMeansImage
+    from dp     import DPImage
+    image = Image.open(io.BytesIO(content)).convert('RGB')
+    if params['alg'] == 'dp':
+        model = DPImage(params['dist'])
+        for key, attr in (('pct_outlier', 'PCT_OUTLIER'), ('density_min', 'DENSITY_MIN'), ('d_scaling', 'D_SCALING')):
+            if params.get(key) is not None:
+                setattr(model, attr, params[key])
+    else:
+        model = KMeansImage(params['k'], params['dist'], True)
+    model.GRANULARITY = params['granularity']
+    model.cache = worker_cache
+    model.run_img(image)
+    out = io.BytesIO()
+    if params['output'] == 'labels':
+        np.savez(out, labels=model.get_labels().reshape(image.size[1], image.size[0]), palette=model.get_palette())
+        return 'application/octet-stream', out.getvalue()
+    model.get_image().convert('RGB').save(out, format='PNG')
+    return 'image/png', out.getvalue()
+
+
+# segment a batch of requests in a worker process; the result of each request is (True, content type,
+# content), or (False, error message, None) for a request that failed
+def segment_batch(requests):
+    results = list()
+    for params, content in requests:
+        try:
+            results.append((True,) + segment_request(params, content))
+        except Exception as e:
+            results.append((False, str(e), None))
+    return results
+
+
+# latencies (seconds from arrival to response) of the last 'window' requests, and counters of the service
+class ServiceStats:
+
+    def __init__(self, window = 1000):
+        self.latencies = deque(maxlen = window)
+        self.requests  = 0       # number of requests answered
+        self.errors    = 0       # number of requests that failed
+        self.batches   = 0       # number of batches sent to the worker processes
+        self.lock      = threading.Lock()
+
+    def add (self, seconds, ok = True):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.errors += 0 if ok else 1
+
+    # latency percentiles (p50, p90, p99, in seconds) of the requests in the window
+    def percentiles (self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+        if len(latencies) == 0:
+            return {'p50': None, 'p90': None, 'p99': None}
+        return {'p'+str(p): float(np.percentile(latencies, p)) for p in (50, 90, 99)}
+
+
+# queue of the requests and the dispatcher thread, which groups the waiting requests into batches and
+# sends them to the pool of worker processes: a batch is split into one task for each worker (at most),
+# so that the workers share the requests of a burst. Each request gets a Future with its result
+class Batcher:
+
+    def __init__(self, workers, batch_size = 8, batch_window = 0.01, stats = None):
+        self.pool         = ProcessPoolExecutor(max_workers = workers, initializer = warm_worker)
+        self.workers      = workers
+        self.batch_size   = batch_size      # maximum number of requests in a batch
+        self.batch_window = batch_window    # maximum time (seconds) to collect the requests of a batch
+        self.stats        = stats if stats is not None else ServiceStats()
+        self.queue        = queue.Queue()   # requests (params, content, future) not yet sent to the pool
+        self.running      = 0               # number of requests sent to the pool and not yet answered
+        self.lock         = threading.Lock()
+        # start all worker processes now (rather than with the first requests)
+        for f in [self.pool.submit(segment_batch, list()) for _ in range(workers)]:
+            f.result()
+        self.thread = threading.Thread(target = self.dispatch, daemon = True)
+        self.thread.start()
+
+    def submit (self, params, content):
+        future = Future()
+        self.queue.put((params, content, future))
+        return future
+
+    # number of requests waiting in the queue or running in the pool
+    def depth (self):
+        with self.lock:
+            return self.queue.qsize() + self.running
+
+    def dispatch (self):
+        while True:
+            batch = [self.queue.get()]
+            if batch[0] is None:
+                return
+            t = perf_counter() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout = max(0.0, t - perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+            with self.lock:
+                self.running += len(batch)
+                with self.stats.lock:
+                    self.stats.batches += 1
+            tasks = min(self.workers, len(batch))
+            for part in [batch[i::tasks] for i in range(tasks)]:
+                job = self.pool.submit(segment_batch, [(params, content) for params, content, _ in part])
+                job.add_done_callback(lambda job, part = part: self.done(job, part))
+
+    # results of a batch: set the future of each request
+    def done (self, job, batch):
+        with self.lock:
+            self.running -= len(batch)
+        try:
+            results = job.result()
+        except Exception as e:
+            results = [(False, str(e), None)] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close (self):
+        self.queue.put(None)
+        self.thread.join()
+        self.pool.shutdown()
+
+
+# parameters of a segmentation request from the query string, with the defaults from app.ini; raises
+# ValueError for unknown or invalid parameters
+def request_params(query):
+    q = {key: values[-1] for key, values in parse_qs(query).items()}
+    sc = read_ini_section('GLOBAL')
+    params = {'alg':         q.pop('alg', 'dp'),
+              'k':           int(q.pop('k', 3)),
+              'granularity': int(q.pop('granularity', read_ini_parameter(sc,'Granularity'))),
+              'dist':        q.pop('dist', read_ini_parameter(sc,'DistanceMetric')),
+              'output':      q.pop('output', 'image')}
+    for key in ('pct_outlier', 'density_min', 'd_scaling'):
+        params[key] = float(q.pop(key)) if key in q else None
+    if len(q) > 0:
+        raise ValueError('Parameters '+', '.join(sorted(q))+' are not defined in program')
+    for key, allowed in (('alg', ALGORITHMS), ('dist', METRICS), ('output', OUTPUTS)):
+        if params[key] not in allowed:
+            raise ValueError(key+' '+params[key]+' is not defined in program')
+    if params['k'] < 1 or params['granularity'] < 1:
+        raise ValueError('k and granularity must be positive')
+    return params
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+
+    def do_GET (self):
+        service = self.server.service
+        if urlparse(self.path).path != '/stats':
+            return self.reply(404, 'text/plain', b'not found')
+        stats = dict(service.stats.percentiles(), queue_depth = service.batcher.depth(),
+                     requests = service.stats.requests, errors = service.stats.errors,
+                     batches = service.stats.batches)
+        self.reply(200, 'application/json', json.dumps(stats).encode())
+
+    def do_POST (self):
+        t1 = perf_counter()
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path != '/segment':
+            return self.reply(404, 'text/plain', b'not found')
+        content = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            params = request_params(url.query)
+        except ValueError as e:
+            return self.reply(400, 'text/plain', str(e).encode())
+        ok, kind, body = service.batcher.submit(params, content).result()
+        service.stats.add(perf_counter() - t1, ok)
+        if ok:
+            self.reply(200, kind, body)
+        else:
+            self.reply(500, 'text/plain', kind.encode())
+
+    def reply (self, status, kind, body):
+        self.send_response(status)
+        self.send_header('Content-Type', kind)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message (self, format, *args):
+        pass
+
+
+# HTTP server with one thread for each connection; the listen queue holds the connections of a burst of
+# requests (the default of 5 resets further connections)
+class ServiceServer(ThreadingHTTPServer):
+    request_queue_size = 128
+    daemon_threads     = True
+
+
+# the service: HTTP server and the batcher with the worker processes
+class SegmentationService:
+
+    def __init__(self, host, port, workers, batch_size = 8, batch_window = 0.01, latency_window = 1000):
+        self.stats   = ServiceStats(latency_window)
+        self.batcher = Batcher(workers, batch_size, batch_window, self.stats)
+        self.server  = ServiceServer((host, port), ServiceHandler)
+        self.server.service = self
+
+    def serve_forever (self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close (self):
+        self.server.server_close()
+        self.batcher.close()
+
+
+def main(argv = None):
+    # defaults are read in from the app.ini file - SERVICE section
+    sc = read_ini_section('SERVICE')
+    parser = argparse.ArgumentParser(description = 'Local segmentation service for DP and KMEANS clustering')
+    parser.add_argument('--host', default = read_ini_parameter(sc,'Host'))
+    parser.add_argument('--port', type = int, default = int(read_ini_parameter(sc,'Port')))
+    parser.add_argument('--workers', type = int, default = int(read_ini_parameter(sc,'Workers')),
+                        help = 'number of worker processes')
+    args = parser.parse_args(argv)
+    service = SegmentationService(args.host, args.port, args.workers, int(read_ini_parameter(sc,'BatchSize')),
+                                  float(read_ini_parameter(sc,'BatchWindow')), int(read_ini_parameter(sc,'LatencyWindow')))
+    print('Segmentation service on http://'+args.host+':'+str(args.port)+' with', args.workers, 'workers')
+    # stop on SIGTERM as on Ctrl-C, so that the worker processes are shut down with the server
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+from math      import ceil
+import numpy as np
+
+from support import dist_matrix, row_blocks
+
+# Spatial indexes for the neighbour queries of the clustering algorithms. Both classes offer
+# the same interface, so that the algorithms can work with either of them:
+#   radius         - all indexed points within a given distance of a query point
+#   knn            - the k nearest indexed points for a list of query points
+#   nearest        - the nearest indexed point for a list of query points
+#   nearest_higher - for each indexed point the nearest indexed point with a higher value (density)
+#   radius_blocks  - blocks of distances between indexed points, covering all pairs within a distance
+#   max_distance   - the maximum distance between any two indexed points
+# All three distance metrics ('Euclidean', 'Manhattan' and 'Supremum') are supported. On equal
+# distances the point with the lower index is returned (like function min on a list of points).
+# Each index counts the distances it calculates for its queries in attribute dist_evals.
+
+
+# brute force index: compares each query point with all indexed points (in blocks of rows)
+class BruteForceIndex:
+
+    def __init__(self, points, dist = 'Euclidean', cell = None):
+        self.points = np.asarray(points, dtype=float).reshape(len(points), -1)
+        self.dist   = dist
+        self.n      = len(self.points)
+        self.dist_evals = 0     # number of distances calculated by the queries
+
+    # distance matrix between two sets of points, counted in dist_evals
+    def distances (self, points1, points2):
+        self.dist_evals += len(points1) * len(points2)
+        return dist_matrix(points1, points2, self.dist)
+
+    # candidates for a block of query points: all indexed points
+    def candidates (self, queries, r = None):
+        return np.arange(self.n)
+
+    # indexes and distances of all indexed points within distance r of point query (sorted by distance)
+    def radius (self, query, r):
+        query = np.asarray(query, dtype=float).reshape(1, -1)
+        cols = self.candidates(query, r)
+        d = self.distances(query, self.points[cols])[0]
+        keep = d <= r
+        cols, d = cols[keep], d[keep]
+        o = np.lexsort((cols, d))
+        return cols[o], d[o]
+
+    # distances and indexes of the k nearest indexed points for each query point
+    def knn (self, queries, k):
+        queries = np.asarray(queries, dtype=float).reshape(len(queries), -1)
+        k = min(k, self.n)
+        dk = np.zeros((len(queries), k))
+        ik = np.zeros((len(queries), k), dtype=int)
+        for rows in row_blocks(len(queries), self.n):
+            d = self.distances(queries[rows], self.points)
+            i = np.argsort(d, axis=1, kind='stable')[:, :k]
+            dk[rows] = np.take_along_axis(d, i, axis=1)
+            ik[rows] = i
+        return dk, ik
+
+    # distance and index of the nearest indexed point for each query point
+    def nearest (self, queries):
+        d, i = self.knn(queries, 1)
+        return d[:, 0], i[:, 0]
+
+    # for each indexed point: distance and index of the nearest indexed point with a higher value;
+    # points without any point of higher value get index -1 and their maximum distance to any point
+    def nearest_higher (self, values):
+        values = np.asarray(values)
+        delta  = np.zeros(self.n)
+        parent = np.full(self.n, -1, dtype=int)
+        for rows in row_blocks(self.n, self.n):
+            d = self.distances(self.points[rows], self.points)
+            higher = values[None, :] > values[rows, None]
+            dh = np.where(higher, d, np.inf)
+            p = np.argmin(dh, axis=1)
+            dl = dh[np.arange(len(p)), p]
+            top = ~higher.any(axis=1)
+            dl[top] = d.max(axis=1)[top]
+            p[top] = -1
+            delta[rows], parent[rows] = dl, p
+        return delta, parent
+
+    # blocks (rows, cols, distances) of indexed points, so that every pair of points within distance r
+    # is contained in exactly one block; distances larger than r are set to infinity
+    def radius_blocks (self, r):
+        cols = np.arange(self.n)
+        for rows in row_blocks(self.n, self.n):
+            d = self.distances(self.points[rows], self.points)
+            d[d > r] = np.inf
+            yield cols[rows], cols, d
+
+    # maximum distance between any two indexed points
+    def max_distance (self):
+        m = 0.0
+        for rows in row_blocks(self.n, self.n):
+            m = max(m, float(self.distances(self.points[rows], self.points).max()))
+        return m
+
+
+# grid index: the points are put into the cells of a regular grid with cell length 'cell'. A point in a
+# cell at (Chebyshev) cell distance m from the cell of a query point is at least (m-1)*cell away from the
+# query point in all three metrics, so that queries only have to look at the cells close to the query.
+# The grid fits the RGB cube lattice, where all points are spread over a regular grid anyway.
+class GridIndex(BruteForceIndex):
+
+    def __init__(self, points, dist = 'Euclidean', cell = None):
+        BruteForceIndex.__init__(self, points, dist)
+        if cell is None:
+            # default: roughly one point per cell
+            extent = float((self.points.max(axis=0) - self.points.min(axis=0)).max()) if self.n > 0 else 1.0
+            cell = max(extent, 1.0) / max(1, int(ceil(self.n ** (1.0/max(1, self.points.shape[1])))))
+        self.cell   = float(cell)
+        coords      = np.floor(self.points / self.cell).astype(np.int64)
+        self.cells, cell_of = np.unique(coords, axis=0, return_inverse=True)
+        cell_of     = cell_of.reshape(-1)
+        self.sorted = np.argsort(cell_of, kind='stable')       # point indexes, grouped by cell
+        self.start  = np.searchsorted(cell_of[self.sorted], np.arange(len(self.cells) + 1))
+
+    # indexed points in the given cells (in order of their index)
+    def members (self, cells):
+        if len(cells) == 0:
+            return np.empty(0, dtype=int)
+        return np.sort(np.concatenate([self.sorted[self.start[c]:self.start[c+1]] for c in cells]))
+
+    # cell distance of all grid cells from the cell at grid coordinates 'coord'
+    def cell_distance (self, coord):
+        return np.abs(self.cells - coord).max(axis=1)
+
+    # candidates for a block of query points: all points in cells within reach of distance r
+    def candidates (self, queries, r = None):
+        if r is None:
+            return np.arange(self.n)
+        lo = np.floor(queries.min(axis=0) / self.cell)
+        hi = np.floor(queries.max(axis=0) / self.cell)
+        ring = int(ceil(r / self.cell))
+        near = ((self.cells >= lo - ring) & (self.cells <= hi + ring)).all(axis=1)
+        return self.members(np.nonzero(near)[0])
+
+    # rings of cells (cell distances) that are searched one after another by the queries
+    def rings (self, cd):
+        top = int(cd.max()) if len(cd) > 0 else 0
+        ring = 1
+        while ring < top:
+            yield ring
+            ring = 2 * ring
+        yield top
+
+    def knn (self, queries, k):
+        queries = np.asarray(queries, dtype=float).reshape(len(queries), -1)
+        k = min(k, self.n)
+        dk = np.zeros((len(queries), k))
+        ik = np.zeros((len(queries), k), dtype=int)
+        qcoords = np.floor(queries / self.cell).astype(np.int64)
+        groups, group_of = np.unique(qcoords, axis=0, return_inverse=True)
+        group_of = group_of.reshape(-1)
+        for g, coord in enumerate(groups):
+            rows = np.nonzero(group_of == g)[0]
+            cd = self.cell_distance(coord)
+            for ring in self.rings(cd):
+                cols = self.members(np.nonzero(cd <= ring)[0])
+                if len(cols) < k and ring < cd.max():
+                    continue
+                d = self.distances(queries[rows], self.points[cols])
+                i = np.argsort(d, axis=1, kind='stable')[:, :k]
+                d = np.take_along_axis(d, i, axis=1)
+                # unseen points are further than ring*cell away from all query points in this cell
+                done = (d[:, -1] <= ring * self.cell) | (ring >= cd.max())
+                dk[rows[done]], ik[rows[done]] = d[done], cols[i[done]]
+                rows = rows[~done]
+                if len(rows) == 0:
+                    break
+        return dk, ik
+
+    def nearest_higher (self, values):
+        values = np.asarray(values)
+        delta  = np.zeros(self.n)
+        parent = np.full(self.n, -1, dtype=int)
+        for c, coord in enumerate(self.cells):
+            rows = self.sorted[self.start[c]:self.start[c+1]]
+            cd = self.cell_distance(coord)
+            for ring in self.rings(cd):
+                cols = self.members(np.nonzero(cd <= ring)[0])
+                d = self.distances(self.points[rows], self.points[cols])
+                higher = values[cols][None, :] > values[rows, None]
+                dh = np.where(higher, d, np.inf)
+                dl = dh.min(axis=1)
+                done = (dl <= ring * self.cell) | (ring >= cd.max())
+                p = np.where(dh == dl[:, None], cols[None, :], self.n).min(axis=1)
+                p[np.isinf(dl)] = -1
+                delta[rows[done]], parent[rows[done]] = dl[done], p[done]
+                rows = rows[~done]
+                if len(rows) == 0:
+                    break
+        top = np.nonzero(parent < 0)[0]
+        for rows in row_blocks(len(top), self.n):
+            delta[top[rows]] = self.distances(self.points[top[rows]], self.points).max(axis=1)
+        return delta, parent
+
+    def radius_blocks (self, r):
+        ring = int(ceil(r / self.cell))
+        for c, coord in enumerate(self.cells):
+            rows = self.sorted[self.start[c]:self.start[c+1]]
+            cols = self.members(np.nonzero(self.cell_distance(coord) <= ring)[0])
+            for block in row_blocks(len(rows), len(cols)):
+                d = self.distances(self.points[rows[block]], self.points[cols])
+                d[d > r] = np.inf
+                yield rows[block], cols, d
+
+    # branch and bound over pairs of cells: the distance between the far corners of two cells is an
+    # upper bound for the distances between their points; only pairs above the best distance are checked
+    def max_distance (self):
+        m = 0.0
+        bounds = [self.corner_distance(coord) for coord in self.cells]
+        for c in np.argsort([-b.max() for b in bounds]):
+            if bounds[c].max() <= m:
+                break
+            rows = self.sorted[self.start[c]:self.start[c+1]]
+            cols = self.members(np.nonzero(bounds[c] > m)[0])
+            m = max(m, float(self.distances(self.points[rows], self.points[cols]).max()))
+        return m
+
+    # upper bound of the distance between points in the cell at 'coord' and points in each grid cell
+    def corner_distance (self, coord):
+        diff = (np.abs(self.cells - coord) + 1) * self.cell
+        if self.dist == 'Euclidean':
+            return np.sqrt((diff * diff).sum(axis=1))
+        elif self.dist == 'Manhattan':
+            return diff.sum(axis=1)
+        elif self.dist == 'Supremum':
+            return diff.max(axis=1)
+        else:
+            raise Exception('Distance function '+self.dist+' is not defined in program')
+
+
+# available spatial indexes; further index classes with the same interface can be registered here
+INDEXES = {'brute': BruteForceIndex, 'grid': GridIndex}
+
+# build a spatial index of the given kind (name in INDEXES or index class) over the points
+def make_index(kind, points, dist = 'Euclidean', cell = None):
+    if isinstance(kind, str):
+        if kind not in INDEXES:
+            raise Exception('Spatial index '+kind+' is not defined in program')
+        kind = INDEXES[kind]
+    return kind(points, dist, cell)
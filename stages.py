@@ -0,0 +1,71 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+from collections import OrderedDict
+from contextlib  import contextmanager
+from time        import perf_counter
+
+# Instrumentation of the clustering algorithms: the algorithms run their steps as named stages
+# (e.g. 'preprocess', 'density', 'delta', 'assign') and record counters (e.g. 'cubes', 'iterations',
+# 'distance_evals'). Stages that run more than once (e.g. the assignment in each KMEANS loop) add up
+# their times. Hooks are called with (event, name, value) for each event:
+#   'start'    - a stage starts (value None)
+#   'end'      - a stage ends (value: seconds of this call)
+#   'count'    - a counter changes (value: new value of the counter)
+#   'progress' - a stage has done part of its work (value: fraction from 0 to 1)
+# A hook may raise Cancelled to stop the run (e.g. from the GUI, see module jobs); the exception is passed
+# on to the caller of the run.
+class Cancelled(Exception):
+    pass
+
+
+class StageProfile:
+
+    def __init__(self, hooks = None):
+        self.stages   = OrderedDict()   # seconds and number of calls of each stage, in order of their first call
+        self.counters = OrderedDict()   # value of each counter
+        self.hooks    = hooks if hooks is not None else list()
+
+    # time the code in a with block as stage 'name'
+    @contextmanager
+    def stage (self, name):
+        self.emit('start', name, None)
+        t1 = perf_counter()
+        try:
+            yield
+        finally:
+            t = perf_counter() - t1
+            seconds, calls = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (seconds + t, calls + 1)
+            self.emit('end', name, t)
+
+    # add value to counter 'name'
+    def count (self, name, value = 1):
+        self.set(name, self.counters.get(name, 0) + value)
+
+    def set (self, name, value):
+        self.counters[name] = value
+        self.emit('count', name, value)
+
+    # progress of stage 'name': done out of total steps
+    def progress (self, name, done, total):
+        self.emit('progress', name, done / total if total > 0 else 1.0)
+
+    def emit (self, event, name, value):
+        for hook in self.hooks:
+            hook(event, name, value)
+
+    def seconds (self, name):
+        return self.stages.get(name, (0.0, 0))[0]
+
+    # structured report: seconds and calls of each stage, the counters and the total time of all stages
+    def report (self):
+        return {'stages':   {name: {'seconds': s, 'calls': c} for name, (s, c) in self.stages.items()},
+                'counters': dict(self.counters),
+                'seconds':  sum(s for s, _ in self.stages.values())}
+
+    # one line for each stage with its time (e.g. for the output labels of the GUI)
+    def summary (self, sep = "\r"):
+        return sep.join(" "+name+": "+str(round(s, 3))+"s" for name, (s, _) in self.stages.items())
@@ -0,0 +1,107 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+from math      import ceil, sqrt
+import numpy as np
+
+from support import read_ini_section, read_ini_parameter, row_blocks, quantize
+
+# Superpixels (SLIC, simple linear iterative clustering) as pre-aggregation of the pixels of an image:
+# neighbouring pixels of similar colour are grouped into superpixels on the image grid, and only the
+# mean colours of the superpixels (weighted with their number of pixels) are passed on to the DP and
+# KMEANS algorithms. Noisy images have far fewer superpixels than distinct colour cubes, and the labels
+# of the superpixels are mapped back to the pixels through the superpixel index of each pixel.
+#
+# The superpixel centres start on a regular grid with step S = sqrt(pixels/segments). In each loop
+# each pixel joins the closest centre among the centres of its own and the 8 neighbouring grid cells
+# (the 2S x 2S window of SLIC), with the distance
+#     (colour distance)^2 + (compactness/S)^2 * (distance on the image grid)^2
+# and each centre moves to the mean colour and position of its pixels. The colour distance is the
+# Euclidean distance on the bands of the image (RGB), whatever distance metric the clustering uses.
+# Superpixels are not forced to be connected, as in the last step of the original SLIC algorithm.
+
+
+# superpixel settings from the SUPERPIXELS section in app.ini: number of superpixels (0 switches the
+# pre-aggregation off), compactness and number of loops
+def superpixel_settings():
+    sc = read_ini_section('SUPERPIXELS')
+    return (int  (read_ini_parameter(sc,'Segments')),
+            float(read_ini_parameter(sc,'Compactness')),
+            int  (read_ini_parameter(sc,'Iterations')))
+
+
+# SLIC superpixels of an (h,w[,d]) image array; returns the superpixel of each pixel (in row order),
+# the mean colour of each superpixel (superpixels without pixels are removed) and its number of pixels
+def slic(image, segments, compactness = 20.0, iterations = 10):
+    a = np.asarray(image, dtype=np.float32)
+    h, w = a.shape[0], a.shape[1]
+    a = a.reshape(h, w, -1)
+    step = max(1, int(round(sqrt(h * w / max(1, segments)))))
+    gh, gw = int(ceil(h / step)), int(ceil(w / step))
+    # the image is padded to whole grid cells and viewed as (cell row, row in cell, cell column, column in
+    # cell), so that the centres of the neighbouring cells broadcast over the pixels of each cell
+    a = np.pad(a, ((0, gh * step - h), (0, gw * step - w), (0, 0)), mode='edge')
+    cells = a.reshape(gh, step, gw, step, -1)
+    ys = np.arange(gh * step, dtype=np.float32).reshape(gh, step, 1, 1)
+    xs = np.arange(gw * step, dtype=np.float32).reshape(1, 1, gw, step)
+    # centres in the middle of the grid cells: position (y, x) and colour. The grid of centres is padded
+    # with one cell on each side, whose centres lie too far away to take any pixels
+    cy = np.minimum(np.arange(gh) * step + step // 2, h - 1)
+    cx = np.minimum(np.arange(gw) * step + step // 2, w - 1)
+    pos = np.full((gh + 2, gw + 2, 2), np.inf, dtype=np.float32)
+    pos[1:-1, 1:-1] = np.stack(np.meshgrid(cy, cx, indexing='ij'), axis=-1)
+    col = np.zeros((gh + 2, gw + 2, a.shape[2]), dtype=np.float32)
+    col[1:-1, 1:-1] = a[cy][:, cx]
+    index = np.arange((gh + 2) * (gw + 2)).reshape(gh + 2, gw + 2)
+    scale = np.float32((compactness / step) ** 2)
+    valid = (np.arange(gh * step) < h)[:, None] & (np.arange(gw * step) < w)[None, :]
+    labels = np.full((gh, step, gw, step), -1, dtype=np.int64)
+    for _ in range(iterations):
+        new = np.empty_like(labels)
+        for rows in row_blocks(gh, 9 * step * step * gw):
+            best = np.full((rows.stop - rows.start, step, gw, step), np.inf, dtype=np.float32)
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    shift = (slice(rows.start + 1 + dy, rows.stop + 1 + dy), slice(1 + dx, gw + 1 + dx))
+                    c, p = col[shift][:, None, :, None, :], pos[shift][:, None, :, None, :]
+                    d = scale * ((ys[rows] - p[..., 0]) ** 2 + (xs - p[..., 1]) ** 2)
+                    for j in range(cells.shape[4]):
+                        d += (cells[rows, :, :, :, j] - c[..., j]) ** 2
+                    closer = d < best
+                    best = np.where(closer, d, best)
+                    new[rows] = np.where(closer, index[shift][:, None, :, None], new[rows])
+        if np.array_equal(new, labels):
+            break
+        labels = new
+        # move each centre to the mean colour and position of its pixels (the padding pixels do not count)
+        flat = labels.reshape(gh * step, gw * step)[valid]
+        k = len(index.reshape(-1))
+        sizes = np.bincount(flat, minlength=k).astype(float)
+        used = sizes > 0
+        col, pos = col.reshape(k, -1), pos.reshape(k, 2)
+        for j in range(col.shape[1]):
+            col[used, j] = np.bincount(flat, weights=a[:, :, j][valid], minlength=k)[used] / sizes[used]
+        yy, xx = np.indices((gh * step, gw * step))
+        pos[used, 0] = np.bincount(flat, weights=yy[valid], minlength=k)[used] / sizes[used]
+        pos[used, 1] = np.bincount(flat, weights=xx[valid], minlength=k)[used] / sizes[used]
+        col, pos = col.reshape(gh + 2, gw + 2, -1), pos.reshape(gh + 2, gw + 2, 2)
+    # keep the superpixels with pixels only, numbered in order of the centres
+    flat = labels.reshape(gh * step, gw * step)[valid]
+    sizes = np.bincount(flat)
+    used = np.nonzero(sizes)[0]
+    number = np.zeros(len(sizes), dtype=np.int64)
+    number[used] = np.arange(len(used))
+    return number[flat], col.reshape(-1, col.shape[2])[used].astype(float), sizes[used]
+
+
+# pre-aggregation of an image into superpixels, with the same result as support.quantize: the mean
+# colours of the superpixels are quantized into cubes with side length 'granularity', each cube counts
+# the pixels of its superpixels, and the inverse index maps each pixel (through its superpixel) to its
+# cube. The superpixel index of each pixel is returned as well
+def superpixel_quantize(image, granularity, segments, compactness = 20.0, iterations = 10):
+    superpixel, means, sizes = slic(image, segments, compactness, iterations)
+    cubes, _, inverse = quantize(means, granularity)
+    counts = np.bincount(inverse, weights=sizes, minlength=len(cubes)).astype(np.int64)
+    return cubes, counts, inverse[superpixel], superpixel
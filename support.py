@@ -4,18 +4,43 @@
 # Due Date:    Friday, 15 June 2018 
 
 from math      import pow 
+from functools import lru_cache
+from glob      import glob
+from os        import path, stat
 import configparser
+import numpy as np
+from PIL import Image
+
+# app.ini is parsed once and kept in memory; it is parsed again once the file has been changed 
+# (modification time), so that changed settings are used by the next run without a restart 
+INI_FILE = 'app.ini'
+ini_config = {'mtime': None, 'config': None}
+
+def read_ini_config (): 
+    try: 
+        mtime = stat(INI_FILE).st_mtime_ns
+    except OSError: 
+        mtime = None
+    if ini_config['config'] is None or mtime != ini_config['mtime']: 
+        config = configparser.ConfigParser()
+        config.read(INI_FILE)
+        ini_config['config'], ini_config['mtime'] = config, mtime
+    return ini_config['config']
 
 def read_ini_section (section): 
-    config = configparser.ConfigParser()
-    config.read('app.ini')
-    return config[section] # read the section and return data 
+    return read_ini_config()[section] # read the section and return data 
 
 def read_ini_parameter (section, par): 
     # return the parameters for further use 
     return section[par]
 
 
+# file name for a segmented image in the log directory: <image file>_<alg>_<k>_<granularity>_<distance>.jpeg
+# (alg is 'kmean' or 'dp'; k is the number of clusters) 
+def log_image_name(image_path, alg, k, granularity, dist): 
+    return path.basename(image_path)+"_"+alg+"_"+str(k)+"_"+str(granularity)+"_"+dist+".jpeg"
+
+
 # set up the function for the minkowski distance, which is later used for calculation 
 # of Euclidean and Manhattan distance
 def dist_minkowski(point1, point2, p):
@@ -23,17 +48,355 @@ def dist_minkowski(point1, point2, p):
 
 # calculate the distance between two points 
 # choose different function for Euclidean, Manhattan and Supremum: 
-def dist_func(point1, point2, dist): 
+def dist_offset(offset, dist): 
+    origin = [0] * len(offset)
     if dist == 'Euclidean':
-        return dist_minkowski(point1, point2, 2)
+        return dist_minkowski(offset, origin, 2)
     elif dist == 'Manhattan':
-        return dist_minkowski(point1, point2, 1)
+        return dist_minkowski(offset, origin, 1)
     elif dist == 'Supremum':
         # return dist_minkowski(point1, point2, 'infinite') can't be implemented as calculation, but is a limes
         # therefore, a native calculation is used for the 'Supremum' distance 
-        return max([abs(point1 - point2) for point1, point2 in zip(point1,point2)])
+        return max(offset)
+    else:
+        raise Exception('Distance function '+dist+' is not defined in program')
+
+# distance between two points; with a lattice distance table (see lattice_dist_table) the distance 
+# between two cubes of the table is looked up rather than calculated 
+def dist_func(point1, point2, dist, table = None): 
+    if table is not None: 
+        keys, centre, values = table
+        return values[centre + keys[point1] - keys[point2]]
+    return dist_offset([abs(point1 - point2) for point1, point2 in zip(point1,point2)], dist)
+
+
+# vectorised version of dist_func: returns the matrix with the distances between each row 
+# in points1 (shape m x d) and each row in points2 (shape n x d). The differences are 
+# accumulated dimension by dimension, so that memory stays at m x n (rather than m x n x d)
+def dist_matrix(points1, points2, dist): 
+    points1 = np.asarray(points1, dtype=float)
+    points2 = np.asarray(points2, dtype=float)
+    d = np.zeros((len(points1), len(points2)))
+    for i in range(points1.shape[1]): 
+        diff = np.abs(points1[:, i, None] - points2[None, :, i])
+        if dist == 'Euclidean':
+            d += diff * diff
+        elif dist == 'Manhattan':
+            d += diff
+        elif dist == 'Supremum':
+            np.maximum(d, diff, out=d)
+        else:
+            raise Exception('Distance function '+dist+' is not defined in program')
+    if dist == 'Euclidean':
+        np.sqrt(d, out=d)
+    return d
+
+
+# distances between the pairs of points in the same rows of points1 and points2 (both shape n x d) 
+def dist_rows(points1, points2, dist): 
+    diff = np.abs(np.asarray(points1, dtype=float) - np.asarray(points2, dtype=float))
+    if dist == 'Euclidean':
+        return np.sqrt((diff * diff).sum(axis=1))
+    elif dist == 'Manhattan':
+        return diff.sum(axis=1)
+    elif dist == 'Supremum':
+        return diff.max(axis=1)
+    else:
+        raise Exception('Distance function '+dist+' is not defined in program')
+
+
+# number of matrix elements that are calculated in one block by the vectorised algorithms 
+# (4M float values, i.e. 32 MB per distance matrix block) 
+BLOCK_ELEMENTS = 1 << 22
+
+# split the rows 0..n-1 into slices, so that each block of rows against m columns 
+# stays within BLOCK_ELEMENTS 
+def row_blocks(n, m): 
+    step = max(1, BLOCK_ELEMENTS // max(1, m))
+    return [slice(s, min(s + step, n)) for s in range(0, n, step)]
+
+
+# distances (in lattice steps) of all integer offsets -radius..radius in d dimensions, as array of 
+# shape (2*radius+1,)*d with offset 0 in the centre; the tables are kept for later calls 
+@lru_cache(maxsize = 16)
+def offset_table(dist, radius, d = 3): 
+    axis = np.abs(np.arange(-radius, radius + 1, dtype=float))
+    grids = np.meshgrid(*([axis] * d), indexing='ij')
+    if dist == 'Euclidean':
+        table = np.sqrt(sum(g * g for g in grids))
+    elif dist == 'Manhattan':
+        table = sum(grids)
+    elif dist == 'Supremum':
+        table = np.max(grids, axis=0)
     else:
         raise Exception('Distance function '+dist+' is not defined in program')
- 
+    table.setflags(write=False)
+    return table
+
+# number of entries of a lattice distance table (4M float values, i.e. 32 MB) 
+DIST_TABLE_SIZE = 1 << 22
+
+# the cubes lie on a regular lattice with spacing 'step', so that the distance between two cubes only 
+# depends on the offsets of their coordinates (multiples of step). The distances of all lattice offsets 
+# -radius..radius (see offset_table) are precomputed once, as flat list: with the flat position key[p] of 
+# each cube p on the lattice, the offset p - q is at position centre + key[p] - key[q] of the list. 
+# Returns the table (key of each point, centre, distances) for dist_func, or None for points that are not 
+# on one lattice or when the table would have more than DIST_TABLE_SIZE entries 
+def lattice_dist_table(dist, step, points): 
+    points = np.asarray(points)
+    if step is None or len(points) == 0 or points.dtype.kind not in 'uif': 
+        return None
+    offsets = points - points.min(axis=0)
+    if np.any(offsets % step != 0): 
+        return None
+    offsets = (offsets // step).astype(np.int64)
+    radius = int(offsets.max())
+    d = points.shape[1]
+    if (2 * radius + 1) ** d > DIST_TABLE_SIZE: 
+        return None
+    strides = (2 * radius + 1) ** np.arange(d - 1, -1, -1, dtype=np.int64)
+    keys = dict(zip(map(tuple, points.tolist()), (offsets @ strides).tolist()))
+    values = (offset_table(dist, radius, d) * step).ravel().tolist()
+    return keys, radius * int(strides.sum()), values
+
+# density kernel exp(-(d/dc)^2) for all lattice offsets -radius..radius, with lattice spacing 'step' 
+def kernel_table(dist, radius, d, step, dc): 
+    return np.exp(-(offset_table(dist, radius, d) * (step / dc))**2)
+
+# smallest size >= n with the prime factors 2, 3 and 5 only, for which the FFT is fastest 
+def fft_size(n): 
+    size = n
+    while True: 
+        m = size
+        for f in (2, 3, 5): 
+            while m % f == 0: 
+                m //= f
+        if m == 1: 
+            return size
+        size += 1
+
+# for each point on the lattice (integer coordinates q, shape (n,d), starting at 0): the sum of the 
+# weights of all points, scaled with the kernel value of their offset (see kernel_table). The weights 
+# are put into a histogram of the lattice, which is convolved with the kernel by FFT. Offsets beyond 
+# the radius of the kernel do not contribute; the histogram is padded by (at least) the radius on 
+# each axis, so that the circular convolution of the FFT does not wrap around onto other lattice points 
+def lattice_convolve(q, weights, kernel): 
+    q = np.asarray(q, dtype=np.int64)
+    side = q.max(axis=0) + 1
+    centre = kernel.shape[0] // 2
+    radius = np.minimum(centre, side - 1)
+    shape = tuple(fft_size(int(n)) for n in side + radius)
+    index = tuple(q.T)
+    hist = np.bincount(np.ravel_multi_index(index, shape), weights=weights, minlength=int(np.prod(shape)))
+    # kernel offset o goes to position o modulo the padded shape 
+    kern = np.zeros(shape)
+    part = kernel[tuple(slice(centre - r, centre + r + 1) for r in radius)]
+    kern[tuple(slice(0, 2 * r + 1) for r in radius)] = part
+    axes = tuple(range(len(shape)))
+    kern = np.roll(kern, tuple((-radius).tolist()), axis=axes)
+    conv = np.fft.irfftn(np.fft.rfftn(hist.reshape(shape), axes=axes) * np.fft.rfftn(kern, axes=axes), s=shape, axes=axes)
+    return conv[index]
+
+
+# quantize points (pixels) onto the lattice of cubes with side length 'granularity': each coordinate x 
+# is mapped to the centre of its cube, floor(x/granularity)*granularity + int(granularity/2). Without a 
+# granularity (None) the points are only counted. For non-negative coordinates (e.g. pixels) this is 
+# int(x/granularity) as in the original per-pixel preprocessing; negative coordinates of generic point 
+# data go to the cube below them (e.g. -3 to -32 for granularity 64), where int() would have put them 
+# into the same cube as +3, so that all cubes have the same size 
+# data is an (n,d) array (for example np.asarray(image).reshape(-1, 3)) or a list of points. 
+# Returns the distinct cubes (in order of their first appearance in data), the number of points in 
+# each cube and the inverse index, which maps each point in data to the index of its cube 
+def quantize(data, granularity = None): 
+    a = np.asarray(data)
+    a = a.reshape(len(a), -1) if a.ndim != 2 else a
+    n, d = a.shape
+    if granularity is not None and a.dtype == np.uint8 and granularity & (granularity - 1) == 0 and granularity <= 256: 
+        # 8-bit channels and a power of 2: the cube of each channel is a shift, and the cubes are counted 
+        # on the lattice of (256/granularity)^d cubes (as long as the lattice is not much larger than the data) 
+        shift = granularity.bit_length() - 1
+        q = a >> shift 
+        side = 256 >> shift
+        if side ** d <= max(4 * n, 1 << 16): 
+            key = np.zeros(n, dtype=np.int64)
+            for i in range(d): 
+                key = key * side + q[:, i]
+            counts = np.bincount(key, minlength=side ** d)
+            lattice = np.nonzero(counts)[0]
+            first = np.full(side ** d, n, dtype=np.int64)
+            np.minimum.at(first, key, np.arange(n))
+            order = np.argsort(first[lattice], kind='stable')
+            rank = np.zeros(side ** d, dtype=np.int64)
+            rank[lattice[order]] = np.arange(len(lattice))
+            cubes = q[first[lattice[order]]].astype(np.int64) * granularity + int(granularity/2)
+            return cubes, counts[lattice[order]], rank[key]
+    if n > CHUNK_ROWS: 
+        return quantize_chunks(a, granularity)
+    if granularity is None: 
+        q = a
+    elif a.dtype.kind in 'ui': 
+        q = a.astype(np.int64) // granularity
+    else: 
+        q = np.floor(a / granularity)
+    _, first, inverse, counts = np.unique(q, axis=0, return_index=True, return_inverse=True, return_counts=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.zeros(len(first), dtype=np.int64)
+    rank[order] = np.arange(len(first))
+    cubes = q[first[order]]
+    if granularity is not None: 
+        cubes = cubes * granularity + int(granularity/2)
+    return cubes, counts[order], rank[inverse.reshape(-1)]
+
+
+# number of rows of a large data set that are quantized (or loaded, see module loader) at a time 
+CHUNK_ROWS = 1 << 18
+
+# quantize a large (n,d) array (e.g. memory-mapped) in chunks of CHUNK_ROWS rows, with the same result as 
+# function quantize: the cubes of each chunk are added to the cubes of the chunks before (in order of 
+# their first appearance), so that only one chunk of the data is held in memory at a time 
+def quantize_chunks(data, granularity = None): 
+    n = len(data)
+    index = dict()
+    cubes, counts = list(), np.zeros(0, dtype=np.int64)
+    inverse = np.zeros(n, dtype=np.int64)
+    for start in range(0, n, CHUNK_ROWS): 
+        c, k, inv = quantize(np.asarray(data[start:start + CHUNK_ROWS]), granularity)
+        m = len(index)
+        ids = np.array([index.setdefault(p, len(index)) for p in map(tuple, c.tolist())], dtype=np.int64)
+        if len(index) > m: 
+            cubes.append(c[ids >= m])
+            counts = np.concatenate([counts, np.zeros(len(index) - m, dtype=np.int64)])
+        counts[ids] += k
+        inverse[start:start + CHUNK_ROWS] = ids[inv]
+    return np.concatenate(cubes), counts, inverse
+
+
+# merge two cube histograms (distinct cubes and their counts); the cubes of the first histogram keep 
+# their position, new cubes of the second histogram are appended in their order 
+def merge_histograms(cubes1, counts1, cubes2, counts2): 
+    if len(cubes1) == 0: 
+        return np.asarray(cubes2), np.asarray(counts2)
+    cubes, _, inverse = quantize(np.concatenate([cubes1, cubes2]))
+    counts = np.bincount(inverse, weights=np.concatenate([counts1, counts2]), minlength=len(cubes))
+    return cubes, counts.astype(np.int64)
+
+
+# smallest unsigned integer type for labels 0..n-1 (uint8 for up to 256 labels, otherwise uint16/uint32) 
+def label_dtype(n): 
+    if n <= 1 << 8:
+        return np.uint8
+    elif n <= 1 << 16:
+        return np.uint16
+    return np.uint32
+
+
+# render a label map (one label per pixel, in row order) with the given palette (one colour per label) 
+# as image of the given size (width, height). Up to 256 RGB colours give a palette ('P') image on the 
+# label buffer itself; otherwise the colours are looked up into an array for Image.fromarray 
+def label_image(labels, palette, size): 
+    width, height = size
+    palette = np.clip(np.rint(np.asarray(palette, dtype=float)), 0, 255).astype(np.uint8).reshape(len(palette), -1)
+    labels  = np.asarray(labels).reshape(height, width)
+    if len(palette) <= 256 and palette.shape[1] == 3: 
+        image = Image.fromarray(labels.astype(np.uint8, copy=False))
+        image.putpalette(palette.reshape(-1).tolist())
+        return image
+    pixels = palette[labels]
+    return Image.fromarray(pixels[:, :, 0] if palette.shape[1] == 1 else pixels)
+
+
+# open a source for streaming: PIL images and (h,w[,d]) arrays are used as they are, file names 
+# are opened as memory-mapped array (.npy files) or as image (all other files, opened lazily by PIL)
+def open_source(source): 
+    if isinstance(source, str): 
+        if source.endswith('.npy'): 
+            return np.load(source, mmap_mode='r')
+        return Image.open(source)
+    return source
+
+# size (width, height) and number of bands of a source 
+def source_shape(source): 
+    source = open_source(source)
+    if isinstance(source, Image.Image): 
+        return source.size, len(source.getbands())
+    return (source.shape[1], source.shape[0]), (source.shape[2] if source.ndim > 2 else 1)
+
+# rows of an uncompressed image file (BMP, PPM or uncompressed TIFF with 8 bits per band) as memory-mapped 
+# arrays: a list of (first row, last row + 1, (rows,w,d) array) for each tile of full rows in the file, 
+# so that strips are read from the file without decoding the image. None for other images 
+def raw_image_parts(image): 
+    if image.mode not in ('L', 'RGB', 'RGBA') or getattr(image, 'filename', '') == '' or len(image.tile) == 0: 
+        return None
+    width, bands = image.size[0], len(image.getbands())
+    parts = list()
+    for codec, box, offset, args in image.tile: 
+        args = (args,) if isinstance(args, str) else tuple(args)
+        rawmode, stride, orientation = (args + (0, 1))[:3]
+        if codec != 'raw' or box[0] != 0 or box[2] != width or rawmode not in (image.mode, image.mode[:3][::-1]): 
+            return None
+        rows = box[3] - box[1]
+        stride = stride if stride > 0 else width * bands
+        a = np.memmap(image.filename, dtype=np.uint8, mode='r', offset=offset, shape=(rows, stride))
+        a = a[::-1] if orientation < 0 else a
+        a = a[:, :width * bands].reshape(rows, width, bands)
+        parts.append((box[1], box[3], a[:, :, ::-1] if rawmode != image.mode else a))
+    return parts
+
+# read a source in strips of 'rows' image rows: yields the first row of each strip and the pixels 
+# of the strip as (n,d) array. Arrays (memory-mapped) and uncompressed image files (see raw_image_parts) 
+# are sliced without touching the other rows, so that memory is bounded by one strip. Compressed image 
+# files (e.g. JPEG, PNG, compressed TIFF) cannot be read in parts: PIL decodes the whole image into its 
+# pixel buffer for each pass over the strips, and hands out one strip at a time 
+def image_strips(source, rows): 
+    source = open_source(source)
+    (width, height), bands = source_shape(source)
+    parts = raw_image_parts(source) if isinstance(source, Image.Image) else None
+    for y in range(0, height, rows): 
+        if parts is not None: 
+            strip = np.concatenate([a[max(y, y0) - y0:min(y + rows, y1) - y0] for y0, y1, a in parts 
+                                    if y0 < y + rows and y1 > y])
+        elif isinstance(source, Image.Image): 
+            strip = np.asarray(source.crop((0, y, width, min(y + rows, height))))
+        else: 
+            strip = np.asarray(source[y:y + rows])
+        yield y, strip.reshape(-1, bands)
+
+
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png', '.bmp', '.tif', '.tiff')
+
+# list of image files in a directory, or matching a glob pattern
+def image_files(source):
+    if path.isdir(source):
+        files = glob(path.join(source, '*'))
+    else:
+        files = glob(source)
+    return sorted(f for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
 
+# read the frames of an image sequence one at a time: a directory or glob pattern of image files (in 
+# order of their names), a .npy file with an (frames,h,w[,d]) array (memory-mapped), a file that PIL 
+# reads as sequence of frames (e.g. animated GIF or multi-page TIFF), a video file (read with the 
+# optional package imageio, which is only imported here) or a list of images or arrays. Yields the 
+# frames as PIL images 
+def image_frames(source): 
+    if not isinstance(source, str): 
+        frames = source
+    elif path.isdir(source) or not path.isfile(source): 
+        frames = (Image.open(f).convert('RGB') for f in image_files(source))
+    elif source.endswith('.npy'): 
+        frames = np.load(source, mmap_mode='r')
+    elif source.lower().endswith(IMAGE_EXTENSIONS + ('.gif', '.webp')): 
+        frames = pil_frames(Image.open(source))
+    else: 
+        try: 
+            import imageio.v3 as iio
+        except ImportError: 
+            raise Exception('Video file '+source+' can not be read: package imageio is not installed')
+        frames = iio.imiter(source)
+    for frame in frames: 
+        yield frame if isinstance(frame, Image.Image) else Image.fromarray(np.asarray(frame))
 
+# frames of a PIL image with several frames (a single frame for all other images) 
+def pil_frames(image): 
+    for i in range(getattr(image, 'n_frames', 1)): 
+        image.seek(i)
+        yield image.convert('RGB')
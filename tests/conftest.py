@@ -0,0 +1,34 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+# The modules are imported from the project directory, and app.ini and the images are read from there 
+# (as for the GUI, which runs in the project directory) 
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse = True)
+def project_dir(monkeypatch):
+    monkeypatch.chdir(ROOT)
+
+
+# small test image: a few colour regions with some noise, so that DP finds more than one cluster 
+@pytest.fixture
+def image():
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    a = np.zeros((48, 64, 3), dtype=np.int64)
+    a[:, :32]    = (200, 40, 40)
+    a[:, 32:]    = (30, 60, 190)
+    a[24:, 16:48] = (40, 180, 60)
+    a += rng.integers(-20, 21, a.shape)
+    return Image.fromarray(np.clip(a, 0, 255).astype(np.uint8))
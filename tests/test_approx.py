@@ -0,0 +1,37 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+
+from dp import DPPoints, compare_approx, sample_error, sample_size
+
+
+# the sample size for a tolerance keeps the error bound within that tolerance 
+@pytest.mark.parametrize('tolerance', [0.1, 0.03, 0.01])
+def test_sample_size(tolerance):
+    assert sample_error(sample_size(tolerance)) <= tolerance < sample_error(sample_size(tolerance) - 1)
+
+
+# on the lattice of an image the densities are exact, and so are delta and parent of the local search 
+def test_lattice_exact(image):
+    r = compare_approx(np.asarray(image).reshape(-1, 3), 'Euclidean', 8)
+    assert r['density_error'] < 1e-9 and r['density_bound'] == 0
+    assert r['delta_mismatch'] == 0 and r['parent_mismatch'] == 0 and r['agreement'] == 1
+
+
+# the sampled densities of generic points stay within the bound, and every cube keeps its own term 
+def test_sampled_density():
+    rng = np.random.default_rng(2)
+    data = np.concatenate([rng.normal(c, 20.0, size=(1000, 2)) for c in ((0, 0), (100, 100))])
+    dp = DPPoints('Euclidean', 'approx')
+    dp.GRANULARITY = None
+    dp.SAMPLE_SIZE = 300
+    dp.run(data)
+    d = np.sqrt(((dp.cubes[:, None] - dp.cubes[None]) ** 2).sum(axis=2))
+    exact = np.exp(-(d / dp.dc) ** 2) @ dp.weights
+    sampled = dp.density_sampled()
+    assert np.abs(sampled - exact).max() <= sample_error(300) * dp.weights.sum()
+    assert sampled.min() >= 1
@@ -0,0 +1,26 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import csv
+
+from batch import run_batch
+
+
+# a corrupt image gets a row with the error, and the other images are segmented 
+def test_bad_file(image, tmp_path):
+    image.save(tmp_path / 'good.png')
+    (tmp_path / 'bad.jpeg').write_bytes(b'not an image')
+    out = tmp_path / 'out' / 'segmented'
+    csv_path = out / 'timing.csv'
+    files = [str(tmp_path / 'bad.jpeg'), str(tmp_path / 'good.png')]
+    rows = run_batch(files, ['dp', 'kmean'], 3, 16, 'Euclidean', str(out), str(csv_path), workers = 1)
+    assert len(rows) == 4
+    with open(csv_path, newline='') as f:
+        table = list(csv.DictReader(f))
+    assert list(table[0].keys())[-1] == 'error'
+    errors = {(r['file'], r['alg']): r['error'] for r in table}
+    assert errors[('bad.jpeg', 'dp')] != '' and errors[('bad.jpeg', 'kmean')] != ''
+    assert errors[('good.png', 'dp')] == '' and errors[('good.png', 'kmean')] == ''
+    assert len(list(out.glob('good.png_*.jpeg'))) == 2
@@ -0,0 +1,63 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import os
+import threading
+
+import numpy as np
+
+from cache import HistogramCache, default_cache
+from support import quantize
+
+
+def test_memory_only_by_default():
+    assert default_cache().directory is None
+
+
+def test_cached_result(image):
+    pixels = np.asarray(image).reshape(-1, 3)
+    cache = HistogramCache(None, 2)
+    for _ in range(2):
+        cubes, counts, inverse = cache.quantize(pixels, 8)
+    expected = quantize(pixels, 8)
+    assert np.array_equal(cubes, expected[0]) and np.array_equal(counts, expected[1])
+    assert np.array_equal(inverse, expected[2])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disk_eviction(tmp_path):
+    cache = HistogramCache(str(tmp_path), 1, 2)
+    data = [np.full((10, 3), i, dtype=np.uint8) for i in range(4)]
+    for d in data:
+        cache.quantize(d, 4)
+    assert len(os.listdir(tmp_path)) == 2
+    cache.memory.clear()
+    cache.quantize(data[3], 4)
+    assert cache.hits == 1
+
+
+# clear() while other threads look up and add entries 
+def test_clear_with_threads(tmp_path):
+    cache = HistogramCache(str(tmp_path), 4, 8)
+    data = [np.full((50, 3), i, dtype=np.uint8) for i in range(12)]
+    errors = list()
+
+    def work():
+        try:
+            for _ in range(5):
+                for d in data:
+                    cache.quantize(d, 4)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target = work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for _ in range(20):
+        cache.clear()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert cache.hits + cache.misses == 4 * 5 * len(data)
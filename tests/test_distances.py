@@ -0,0 +1,28 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+
+from support import dist_func, lattice_dist_table, quantize
+
+
+# the distances looked up in the lattice table are the calculated distances 
+@pytest.mark.parametrize('dist', ['Euclidean', 'Manhattan', 'Supremum'])
+def test_lattice_table(dist):
+    data = np.random.default_rng(1).integers(0, 256, size=(500, 3)).astype(np.uint8)
+    cubes, _, _ = quantize(data, 16)
+    table = lattice_dist_table(dist, 16, cubes)
+    points = [tuple(p) for p in cubes.tolist()]
+    for p in points[:20]:
+        for q in points:
+            assert dist_func(p, q, dist, table) == pytest.approx(dist_func(p, q, dist))
+
+
+# no table for points off the lattice, without granularity or beyond DIST_TABLE_SIZE 
+def test_no_table():
+    assert lattice_dist_table('Euclidean', 4, [[0, 0], [2, 4]]) is None
+    assert lattice_dist_table('Euclidean', None, [[0, 0], [2, 4]]) is None
+    assert lattice_dist_table('Euclidean', 1, np.arange(10)[:, None] * np.ones(12, dtype=int)) is None
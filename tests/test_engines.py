@@ -0,0 +1,39 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from dp import DPImage
+
+
+# the vectorised engines find the same centroids and clusters as the original loops (engine 'python') 
+def compare_engine(image, engine, dist, granularity):
+    runs = dict()
+    for e in ('python', engine):
+        dp = DPImage(dist, e)
+        dp.GRANULARITY = granularity
+        dp.run_img(image)
+        runs[e] = dp
+    baseline, dp = runs['python'], runs[engine]
+    assert dp.keys == baseline.keys
+    assert np.allclose([dp.dens[p] for p in dp.keys], [baseline.dens[p] for p in baseline.keys])
+    assert np.allclose([dp.dst[p] for p in dp.keys], [baseline.dst[p] for p in baseline.keys])
+    assert sorted(dp.centroids) == sorted(baseline.centroids)
+    assert np.array_equal(dp.get_labels(), baseline.get_labels())
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'sorted'])
+@pytest.mark.parametrize('dist', ['Euclidean', 'Manhattan', 'Supremum'])
+@pytest.mark.parametrize('granularity', [8, 16])
+def test_engine(image, engine, dist, granularity):
+    compare_engine(image, engine, dist, granularity)
+
+
+@pytest.mark.parametrize('engine', ['numpy', 'sorted'])
+@pytest.mark.parametrize('dist', ['Euclidean', 'Manhattan', 'Supremum'])
+def test_engine_photo(engine, dist):
+    compare_engine(Image.open('images/i.jpeg'), engine, dist, 32)
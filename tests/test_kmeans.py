@@ -0,0 +1,118 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+
+from kmeans import KMeansPoints, compare_inits
+from support import dist_func
+from stages import Cancelled
+
+
+@pytest.fixture
+def pixels(image):
+    return np.asarray(image).reshape(-1, 3)
+
+
+def test_default_initialisation():
+    assert KMeansPoints(3).init == 'random'
+
+
+@pytest.mark.parametrize('init', ['random', 'kmeans++', 'dp'])
+def test_k_larger_than_cubes(init):
+    km = KMeansPoints(5, init = init)
+    with pytest.raises(Exception, match = 'needs at least k distinct cubes'):
+        km.run(np.array([[10, 20, 30], [12, 22, 30], [200, 200, 200]], dtype=np.uint8))
+
+
+@pytest.mark.parametrize('init', ['random', 'kmeans++', 'dp'])
+def test_seed(pixels, init):
+    labels = list()
+    for _ in range(2):
+        km = KMeansPoints(3, init = init)
+        km.seed = 7
+        km.run(pixels)
+        labels.append(km.get_labels())
+    assert np.array_equal(labels[0], labels[1])
+
+
+def test_compare_inits(pixels):
+    report = compare_inits(pixels, 3, seeds = range(3))
+    assert set(report) == {'random', 'kmeans++', 'dp'}
+    for r in report.values():
+        assert len(r['loops']) == 3 and len(r['seconds']) == 3
+        assert r['min_loops'] <= r['mean_loops'] <= r['max_loops']
+    assert report['random']['loops_saved'] == 0
+    for r in report.values():
+        assert r['loops_saved'] == report['random']['mean_loops'] - r['mean_loops']
+    # the random runs are the baseline, even if they are not reported 
+    report = compare_inits(pixels, 3, inits = ('kmeans++',), seeds = range(3))
+    assert set(report) == {'kmeans++'} and 'loops_saved' in report['kmeans++']
+
+
+# the hooks of the KMEANS run see the stages of the DP initialisation, and can cancel it 
+def test_cancel_dp_initialisation(pixels):
+    def cancel(event, name, value):
+        if event == 'start' and name == 'density':
+            raise Cancelled(name)
+    km = KMeansPoints(3, init = 'dp')
+    km.hooks.append(cancel)
+    with pytest.raises(Cancelled, match = 'density'):
+        km.run(pixels)
+
+
+# Hamerly's bounds skip distances, with the same labels, means and number of loops as Lloyd 
+@pytest.mark.parametrize('dist', ['Euclidean', 'Manhattan', 'Supremum'])
+@pytest.mark.parametrize('data', ['image', 'random'])
+def test_hamerly(pixels, dist, data):
+    if data == 'random':
+        rng = np.random.default_rng(4)
+        pixels = np.concatenate([rng.normal(c, 25, (3000, 3)) for c in (60, 128, 190)]).clip(0, 255).astype(np.uint8)
+    runs = dict()
+    for algorithm in ('lloyd', 'hamerly'):
+        km = KMeansPoints(6, dist, algorithm = algorithm)
+        km.GRANULARITY = 8
+        km.seed = 2
+        km.run(pixels)
+        runs[algorithm] = km
+    lloyd, hamerly = runs['lloyd'], runs['hamerly']
+    assert np.array_equal(hamerly.get_labels(), lloyd.get_labels())
+    assert np.allclose(hamerly.means, lloyd.means)
+    assert hamerly.counter == lloyd.counter
+    assert hamerly.dist_skipped > 0 and lloyd.dist_skipped == 0
+    assert hamerly.dist_evals < lloyd.dist_evals
+
+
+# reference: the loops of the original run, with the sums of the weighted cubes in each group and 
+# the nearest mean of each cube by dist_func, until the means do not change any more 
+def reference(pnts, means, dist):
+    means, new_means, loops = list(), means, 0
+    nearest = lambda p: min(range(len(new_means)), key = lambda i: dist_func(list(p), list(new_means[i]), dist))
+    groups = {p: nearest(p) for p in pnts}
+    while means != new_means:
+        loops += 1
+        means = new_means
+        new_means = list()
+        for i in range(len(means)):
+            members = [p for p in pnts if groups[p] == i]
+            l = sum(pnts[p] for p in members)
+            new_means.append([sum(p[j] * pnts[p] for p in members) / l for j in range(len(means[i]))])
+        groups = {p: nearest(p) for p in pnts}
+    return groups, new_means, loops
+
+
+# the vectorised weighted Lloyd loops find the same groups and means as the original loops 
+@pytest.mark.parametrize('dist', ['Euclidean', 'Manhattan', 'Supremum'])
+def test_reference(pixels, dist):
+    km = KMeansPoints(3, dist)
+    km.GRANULARITY = 16
+    km.TOLERANCE = 0
+    km.seed = 5
+    km.pre_process_points(pixels)
+    groups, means, loops = reference(km.pnts, km.init_means(), dist)
+    km.run(pixels)
+    assert km.assigned_group == groups
+    assert np.allclose(km.means, means)
+    assert km.counter == loops
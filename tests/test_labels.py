@@ -0,0 +1,50 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+
+from dp import DPImage
+from kmeans import KMeansImage
+from support import label_image
+
+
+# reference: the original output, the per-pixel list of colours put into a copy of the image
+def putdata(image, data):
+    out = image.copy()
+    out.putdata(data)
+    return np.asarray(out)
+
+
+# the rendered label maps of DP give the same images as the per-pixel lists of get_data
+def test_dp_image(image):
+    dp = DPImage('Euclidean')
+    dp.GRANULARITY = 16
+    dp.run_img(image)
+    labels = dp.get_labels()
+    assert labels.dtype == np.uint8 and labels.shape == (image.size[0] * image.size[1],)
+    assert np.array_equal(np.asarray(dp.get_image().convert('RGB')), putdata(image, dp.get_data()))
+    assert np.array_equal(np.asarray(dp.get_pre_processed_image().convert('RGB')),
+                          putdata(image, dp.get_pre_processed_data()))
+
+
+# the same for KMeans, with the means converted to integers as in get_data_img
+def test_kmeans_image(image):
+    km = KMeansImage(3, 'Euclidean', True)
+    km.GRANULARITY = 16
+    km.seed = 1
+    km.run_img(image)
+    assert np.array_equal(np.asarray(km.get_image().convert('RGB')), putdata(image, km.get_data_img()))
+
+
+# palette images for up to 256 RGB colours, arrays for more colours and for grey levels
+def test_label_image():
+    rng = np.random.default_rng(0)
+    for n, bands in ((256, 3), (300, 3), (10, 1)):
+        palette = rng.integers(0, 256, size=(n, bands))
+        labels = rng.integers(0, n, size=6 * 4)
+        image = label_image(labels, palette, (6, 4))
+        assert image.mode == ('P' if n <= 256 and bands == 3 else 'RGB' if bands == 3 else 'L')
+        expected = palette[labels].reshape(4, 6, bands).squeeze()
+        assert np.array_equal(np.asarray(image.convert('RGB' if bands == 3 else 'L')), expected)
@@ -0,0 +1,60 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+
+from loader import load_points
+
+
+@pytest.fixture
+def points():
+    return np.random.default_rng(2).normal(size=(25, 4)).round(6)
+
+
+# round trip through CSV files with and without header, in chunks smaller than the file 
+@pytest.mark.parametrize('delimiter', [',', ';', '\t'])
+@pytest.mark.parametrize('header', [True, False])
+def test_csv_round_trip(tmp_path, points, delimiter, header):
+    lines = [delimiter.join(repr(x) for x in row) for row in points.tolist()]
+    if header:
+        lines.insert(0, delimiter.join('abcd'))
+    (tmp_path / 'points.csv').write_text('\n'.join(lines) + '\n')
+    data = load_points(str(tmp_path / 'points.csv'), out = str(tmp_path / 'points.npy'), chunk_rows = 7)
+    assert isinstance(data, np.memmap)
+    assert np.array_equal(data, points)
+
+
+def test_csv_columns(tmp_path, points):
+    np.savetxt(tmp_path / 'points.csv', points, delimiter = ',')
+    data = load_points(str(tmp_path / 'points.csv'), out = str(tmp_path / 'points.npy'), columns = [3, 1])
+    assert np.allclose(data, points[:, [3, 1]])
+
+
+def test_npy_round_trip(tmp_path, points):
+    np.save(tmp_path / 'points.npy', points.astype(np.float32))
+    data = load_points(str(tmp_path / 'points.npy'), out = str(tmp_path / 'out.npy'), chunk_rows = 4)
+    assert np.array_equal(data, points.astype(np.float32).astype(float))
+
+
+def test_xlsx(tmp_path):
+    data = load_points('testdata/testdata.xlsx', out = str(tmp_path / 'points.npy'))
+    assert data.ndim == 2 and len(data) > 0
+    assert np.isfinite(data).all()
+
+
+# rows of different lengths in the same chunk and in different chunks 
+@pytest.mark.parametrize('chunk_rows', [100, 2])
+def test_ragged_csv(tmp_path, chunk_rows):
+    (tmp_path / 'ragged.csv').write_text('x,y,z\n1,2,3\n4,5,6\n7,8\n')
+    with pytest.raises(Exception, match = 'rows of different lengths: row 4'):
+        load_points(str(tmp_path / 'ragged.csv'), out = str(tmp_path / 'ragged.npy'), chunk_rows = chunk_rows)
+    assert not (tmp_path / 'ragged.npy.raw').exists()
+
+
+def test_not_numeric(tmp_path):
+    (tmp_path / 'text.csv').write_text('1,2\n3,x\n')
+    with pytest.raises(Exception, match = 'Row 2 is not numeric'):
+        load_points(str(tmp_path / 'text.csv'), out = str(tmp_path / 'text.npy'))
@@ -0,0 +1,27 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+
+from dp import DPPoints
+
+
+# runs in a pool of worker processes give the same result as serial runs, and keep the distance matrix 
+@pytest.mark.parametrize('engine', ['sorted', 'numpy'])
+def test_workers(image, engine):
+    pixels = np.asarray(image).reshape(-1, 3)
+    runs = list()
+    for workers in (1, 2):
+        dp = DPPoints('Euclidean', engine, workers = workers)
+        dp.GRANULARITY = 16
+        dp.D_METHOD = 'direct'
+        dp.run(pixels)
+        assert dp.distances is not None and dp.pool is None
+        runs.append(dp)
+    serial, parallel = runs
+    assert np.array_equal(serial.distances, parallel.distances)
+    assert np.array_equal(serial.rho, parallel.rho) and np.array_equal(serial.parent, parallel.parent)
+    assert np.array_equal(serial.get_labels(), parallel.get_labels())
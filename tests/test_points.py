@@ -0,0 +1,25 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+
+from dp import DPPoints
+
+
+# generic N-dimensional points without quantization (GRANULARITY None), with some duplicate rows 
+@pytest.mark.parametrize('dist', ['Euclidean', 'Manhattan', 'Supremum'])
+def test_unquantized_points(dist):
+    rng = np.random.default_rng(1)
+    data = np.concatenate([rng.normal(0, 1, (80, 5)), rng.normal(6, 1, (80, 5))])
+    data = np.concatenate([data, data[:20]])
+    centroids = dict()
+    for engine in ('sorted', 'numpy', 'python', 'approx'):
+        dp = DPPoints(dist, engine)
+        dp.GRANULARITY = None
+        dp.run(data)
+        centroids[engine] = sorted(dp.centroids)
+        assert len(dp.get_labels()) == len(data)
+    assert centroids['sorted'] == centroids['numpy'] == centroids['python']
@@ -0,0 +1,29 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+
+from dp import DPImage, DPPyramid
+from support import dist_matrix, quantize
+
+
+# the pyramid finds the centroids of DPImage at the coarse cube length; pixels in inner coarse cubes
+# keep the cluster of DPImage, pixels in border cubes go to the centroid nearest to their fine cube
+def test_pyramid(image):
+    pixels = np.asarray(image).reshape(-1, 3)
+    coarse = DPImage('Euclidean')
+    coarse.GRANULARITY = 64
+    coarse.run_img(image)
+    dp = DPPyramid('Euclidean', coarse = 64, fine = 16)
+    dp.run_img(image)
+    assert dp.centroids == coarse.centroids
+    colours   = dp.get_palette()[dp.get_labels()]
+    border    = dp.border[dp.inverse]
+    assert border.any() and not border.all()
+    baseline  = coarse.get_palette()[coarse.get_labels()]
+    assert np.array_equal(colours[~border], baseline[~border])
+    cubes, _, inverse = quantize(pixels, 16)
+    nearest = np.argmin(dist_matrix(cubes[inverse][border], dp.get_palette(), 'Euclidean'), axis=1)
+    assert np.array_equal(dp.get_labels()[border], nearest)
@@ -0,0 +1,46 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+
+from support import quantize
+
+
+# negative coordinates go to the cube below them, for integer and float data 
+@pytest.mark.parametrize('dtype', [np.int64, np.float64])
+def test_negative_coordinates(dtype):
+    cubes, counts, inverse = quantize(np.array([[-3], [3], [-64], [-65]], dtype=dtype), 64)
+    assert cubes[inverse].reshape(-1).tolist() == [-32, 32, -32, -96]
+    assert counts.tolist() == [2, 1, 1]
+
+
+# reference: the dictionary loop of the original pre_process_points (cubes in order of appearance) 
+def reference(points, granularity):
+    pnts, cube = dict(), list()
+    for pp in points:
+        p = tuple(map(lambda x: ((int(x/granularity))*granularity) + int(granularity/2), list(pp)))
+        pnts[p] = pnts.get(p, 0) + 1
+        cube.append(p)
+    return pnts, cube
+
+
+# the uint8 fast path (powers of 2), integer and float data, and data quantized in chunks 
+@pytest.mark.parametrize('granularity', [1, 4, 16, 64, 6, 25])
+@pytest.mark.parametrize('kind', ['uint8', 'int', 'float', 'chunks'])
+def test_reference(image, monkeypatch, granularity, kind):
+    pixels = np.asarray(image).reshape(-1, 3)
+    if kind == 'int':
+        pixels = pixels.astype(np.int64)
+    elif kind == 'float':
+        pixels = pixels + 0.5
+    elif kind == 'chunks':
+        pixels = pixels.astype(np.int64)
+        monkeypatch.setattr('support.CHUNK_ROWS', 500)
+    pnts, cube = reference(pixels.tolist(), granularity)
+    cubes, counts, inverse = quantize(pixels, granularity)
+    assert [tuple(p) for p in cubes.tolist()] == list(pnts.keys())
+    assert counts.tolist() == list(pnts.values())
+    assert [tuple(p) for p in cubes[inverse].tolist()] == cube
@@ -0,0 +1,26 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from dp import DPImage
+
+
+# a re-run with another DensityScaling and back restores the first decision graph, with the same 
+# centroids and labels as the first run 
+@pytest.mark.parametrize('engine', ['python', 'numpy', 'sorted', 'approx'])
+@pytest.mark.parametrize('source', ['fixture', 'images/i.jpeg'])
+def test_retune_round_trip(image, engine, source):
+    dp = DPImage('Euclidean', engine)
+    dp.GRANULARITY = 16 if source == 'fixture' else 32
+    dp.D_SCALING = 5
+    dp.run_img(image if source == 'fixture' else Image.open(source))
+    centroids, labels = sorted(dp.centroids), dp.get_labels()
+    dp.retune(d_scaling = 2)
+    dp.retune(d_scaling = 5)
+    assert sorted(dp.centroids) == centroids
+    assert np.array_equal(dp.get_labels(), labels)
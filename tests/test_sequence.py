@@ -0,0 +1,90 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+from PIL import Image
+
+from dp import DPImage, DPPoints, DPSequence
+from support import kernel_table, lattice_convolve
+
+
+# frames with a patch of the image moving over it 
+def moving_patch(image, frames = 5):
+    a = np.asarray(image)
+    out = list()
+    for t in range(frames):
+        f = a.copy()
+        f[4 + 3 * t:16 + 3 * t, 6 + 4 * t:20 + 4 * t] = a[30:42, 2:16]
+        out.append(Image.fromarray(f))
+    return out
+
+
+def test_first_frame_as_dp_image(image):
+    seq = DPSequence()
+    seq.GRANULARITY = 8
+    seq.run_frame(image)
+    dp = DPImage(engine = 'approx')
+    dp.GRANULARITY = 8
+    dp.run_img(image)
+    assert sorted(seq.centroids) == sorted(dp.centroids)
+    assert np.array_equal(seq.get_palette()[seq.get_labels()], dp.get_palette()[dp.get_labels()])
+
+
+def test_incremental_density(image):
+    seq = DPSequence()
+    seq.GRANULARITY = 8
+    max_dist = list()
+    for frame in moving_patch(image):
+        seq.run_frame(frame)
+        max_dist.append(seq.max_dist)
+        q = (seq.seq_cubes - 4) // 8
+        q = q - q.min(axis=0)
+        kernel = kernel_table(seq.dist, int(q.max()), 3, 8, seq.dc)
+        assert np.allclose(seq.seq_rho, lattice_convolve(q, seq.seq_counts, kernel))
+    assert seq.profile.counters['density_updates'] < len(seq.seq_cubes)
+    # max_dist is carried over from frame to frame, and only grows with new cubes 
+    assert max_dist == sorted(max_dist)
+
+
+def test_delta_reuse(image):
+    for engine in ('approx', 'sorted'):
+        seq = DPSequence(engine = engine)
+        seq.GRANULARITY = 8
+        frames = moving_patch(image)
+        updates = list()
+        for frame in frames + frames[::-1]:
+            seq.run_frame(frame)
+            updates.append(seq.profile.counters.get('delta_updates', len(seq.keys)) < len(seq.keys))
+            delta, parent = seq.delta.copy(), seq.parent.copy()
+            DPPoints.distance_points(seq)
+            assert np.array_equal(parent, seq.parent)
+            assert np.allclose(delta, seq.delta)
+        assert any(updates)
+
+
+def test_unchanged_frame(image):
+    seq = DPSequence()
+    seq.GRANULARITY = 8
+    seq.run_frame(image)
+    labels = seq.get_labels()
+    seq.run_frame(image)
+    assert seq.profile.counters['changed_pixels'] == 0
+    assert np.array_equal(seq.get_labels(), labels)
+
+
+# lattices with more cells than BLOCK_ELEMENTS are not allocated for delta: the changed cubes of each frame 
+# are searched with the grid index, with the same delta and parent as the lattice search of DPPoints 
+def test_large_lattice(image, monkeypatch):
+    seq = DPSequence()
+    seq.GRANULARITY = 8
+    for frame in moving_patch(image):
+        with monkeypatch.context() as m:
+            m.setattr('dp.BLOCK_ELEMENTS', 2000)
+            m.setattr(DPSequence, 'nearest_higher_lattice', None)
+            seq.run_frame(frame)
+        delta, parent = seq.delta.copy(), seq.parent.copy()
+        DPPoints.distance_points(seq)
+        assert np.array_equal(parent, seq.parent)
+        assert np.allclose(delta, seq.delta)
@@ -0,0 +1,84 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import io
+import json
+import os
+import threading
+from http.client import HTTPConnection
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from service import SegmentationService, request_params
+
+
+# service on a free port with one worker process, running in a background thread (started in the project 
+# directory, as the worker processes read app.ini from there) 
+@pytest.fixture(scope = 'module')
+def service():
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        service = SegmentationService('127.0.0.1', 0, 1)
+    thread = threading.Thread(target = service.serve_forever, daemon = True)
+    thread.start()
+    yield service
+    service.server.shutdown()
+    thread.join()
+
+
+def request(service, method, path, body = None):
+    connection = HTTPConnection('127.0.0.1', service.server.server_address[1], timeout = 60)
+    connection.request(method, path, body)
+    response = connection.getresponse()
+    return response.status, response.getheader('Content-Type'), response.read()
+
+
+def png(image):
+    out = io.BytesIO()
+    image.save(out, format='PNG')
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('alg', ['dp', 'kmean'])
+def test_segment_image(service, image, alg):
+    status, kind, body = request(service, 'POST', '/segment?alg='+alg+'&granularity=16', png(image))
+    assert status == 200 and kind == 'image/png'
+    assert Image.open(io.BytesIO(body)).size == image.size
+
+
+def test_segment_labels(service, image):
+    status, kind, body = request(service, 'POST', '/segment?granularity=16&output=labels', png(image))
+    assert status == 200
+    result = np.load(io.BytesIO(body))
+    assert result['labels'].shape == (image.size[1], image.size[0])
+    assert result['labels'].max() < len(result['palette'])
+
+
+@pytest.mark.parametrize('query', ['alg=svm', 'dist=Cosine', 'k=0', 'granularity=x', 'colour=red'])
+def test_bad_request(service, image, query):
+    status, _, body = request(service, 'POST', '/segment?'+query, png(image))
+    assert status == 400 and len(body) > 0
+
+
+# a body that is not an image fails in the worker process 
+def test_server_error(service):
+    status, kind, _ = request(service, 'POST', '/segment', b'not an image')
+    assert status == 500 and kind == 'text/plain'
+
+
+def test_stats(service):
+    status, kind, body = request(service, 'GET', '/stats')
+    stats = json.loads(body)
+    assert status == 200 and kind == 'application/json'
+    assert stats['queue_depth'] == 0 and stats['requests'] >= stats['errors']
+    assert request(service, 'GET', '/other')[0] == 404
+
+
+def test_request_params():
+    params = request_params('alg=kmean&k=4&granularity=8&dist=Manhattan&d_scaling=3')
+    assert (params['alg'], params['k'], params['granularity'], params['dist']) == ('kmean', 4, 8, 'Manhattan')
+    assert params['d_scaling'] == 3.0 and params['pct_outlier'] is None and params['output'] == 'image'
@@ -0,0 +1,68 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+
+from kmeans import KMeansPoints
+from spatial import BruteForceIndex, GridIndex
+from support import dist_matrix
+
+METRICS = ['Euclidean', 'Manhattan', 'Supremum']
+
+
+# cubes on a lattice (many equal distances) with densities that have some ties as well 
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(3)
+    return rng.integers(0, 16, (300, 3)) * 8 + 4
+
+
+@pytest.mark.parametrize('dist', METRICS)
+def test_grid_against_brute_force(points, dist):
+    grid, brute = GridIndex(points, dist, 20.0), BruteForceIndex(points, dist)
+    queries = np.random.default_rng(4).uniform(0, 130, (50, 3))
+    for a, b in zip(grid.knn(queries, 4), brute.knn(queries, 4)):
+        assert np.array_equal(a, b)
+    for a, b in zip(grid.nearest(queries), brute.nearest(queries)):
+        assert np.array_equal(a, b)
+    values = np.random.default_rng(5).integers(0, 40, len(points)).astype(float)
+    for a, b in zip(grid.nearest_higher(values), brute.nearest_higher(values)):
+        assert np.array_equal(a, b)
+    for a, b in zip(grid.radius(queries[0], 30.0), brute.radius(queries[0], 30.0)):
+        assert np.array_equal(a, b)
+    assert grid.max_distance() == brute.max_distance()
+
+
+# every pair of points within the radius is contained in exactly one block 
+@pytest.mark.parametrize('dist', METRICS)
+def test_radius_blocks(points, dist):
+    grid = GridIndex(points, dist, 10.0)
+    pairs = np.zeros((len(points), len(points)), dtype=int)
+    for rows, cols, d in grid.radius_blocks(25.0):
+        pairs[np.ix_(rows, cols)] += np.isfinite(d)
+    assert np.array_equal(pairs, (dist_matrix(points, points, dist) <= 25.0).astype(int))
+
+
+# the grid index calculates fewer distances than the brute force index, and counts them 
+def test_dist_evals(points):
+    grid, brute = GridIndex(points, 'Euclidean', 20.0), BruteForceIndex(points, 'Euclidean')
+    queries = np.random.default_rng(4).uniform(0, 130, (50, 3))
+    grid.nearest(queries)
+    brute.nearest(queries)
+    assert brute.dist_evals == 50 * len(points)
+    assert 0 < grid.dist_evals < brute.dist_evals
+
+
+def test_kmeans_with_index(image):
+    pixels = np.asarray(image).reshape(-1, 3)
+    runs = dict()
+    for index in (None, 'grid'):
+        km = KMeansPoints(4, index = index)
+        km.seed = 1
+        km.run(pixels)
+        runs[index] = km
+    assert np.array_equal(runs[None].get_labels(), runs['grid'].get_labels())
+    assert runs['grid'].profile.counters['distance_evals'] > 0
@@ -0,0 +1,68 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from dp import DPImage, DPStream
+from kmeans import KMeansPoints, KMeansStream
+from support import dist_matrix, image_strips, raw_image_parts
+
+
+# uncompressed files are read from the file (memory-mapped), compressed files are decoded by PIL; the 
+# strips are the rows of the image in both cases 
+@pytest.mark.parametrize('name, raw', [('a.bmp', True), ('a.tif', True), ('a.ppm', True), ('a.png', False)])
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+def test_image_strips(image, tmp_path, name, raw, mode):
+    image.convert(mode).save(tmp_path / name)
+    source = str(tmp_path / name)
+    assert (raw_image_parts(Image.open(source)) is not None) == raw
+    pixels = np.asarray(Image.open(source)).reshape(image.size[0] * image.size[1], -1)
+    strips = list(image_strips(source, 10))
+    assert [y for y, _ in strips] == list(range(0, image.size[1], 10))
+    assert np.array_equal(np.concatenate([s for _, s in strips]), pixels)
+
+
+# with one strip, the mini-batch steps are the steps of KMEANS on the whole image 
+def test_one_strip(image):
+    pixels = np.asarray(image).reshape(-1, 3)
+    km = KMeansPoints(3)
+    km.GRANULARITY = 16
+    km.seed = 1
+    km.run(pixels)
+    stream = KMeansStream(3, strip_rows = image.size[1], passes = 10)
+    stream.GRANULARITY = 16
+    stream.seed = 1
+    stream.run_stream(image)
+    assert np.allclose(stream.means, km.means)
+    assert np.array_equal(stream.get_labels(), km.get_labels())
+
+
+# with several strips (image file), each pixel gets the label of the mean nearest to its cube 
+def test_strips(image, tmp_path):
+    image.save(tmp_path / 'a.bmp')
+    stream = KMeansStream(3, strip_rows = 7)
+    stream.GRANULARITY = 16
+    stream.run_stream(str(tmp_path / 'a.bmp'))
+    assert stream.label_map.shape == (image.size[1], image.size[0])
+    cubes = np.asarray(image).reshape(-1, 3) // 16 * 16 + 8
+    assert np.array_equal(stream.get_labels(), np.argmin(dist_matrix(cubes, stream.means, 'Euclidean'), axis=1))
+
+
+# the streamed DP segmentation (histogram merged over the strips, labels written strip by strip into a 
+# memory-mapped array) finds the same centroids and segmented image as DPImage on the whole image 
+@pytest.mark.parametrize('strip_rows', [7, 48])
+def test_dp_stream(image, tmp_path, strip_rows):
+    dp = DPImage('Euclidean')
+    dp.GRANULARITY = 16
+    dp.run_img(image)
+    image.save(tmp_path / 'a.bmp')
+    stream = DPStream('Euclidean', strip_rows = strip_rows)
+    stream.GRANULARITY = 16
+    out = np.lib.format.open_memmap(str(tmp_path / 'labels.npy'), mode = 'w+', dtype = np.uint8, shape = (48, 64))
+    assert stream.run_stream(str(tmp_path / 'a.bmp'), out) is out
+    assert sorted(stream.centroids) == sorted(dp.centroids)
+    assert np.array_equal(np.asarray(stream.get_image().convert('RGB')), np.asarray(dp.get_image().convert('RGB')))
@@ -0,0 +1,49 @@
+#-----------------------------------
+# Author:      Rudiger von Hackewitz
+# Code for the Final Project Report
+# Due Date:    Friday, 15 June 2018
+
+import numpy as np
+import pytest
+
+from dp import DPImage
+from superpixels import slic, superpixel_quantize
+from support import quantize
+
+
+# each pixel belongs to one superpixel, and the superpixels carry the mean colour and number of their pixels
+def test_slic(image):
+    pixels = np.asarray(image).reshape(-1, 3)
+    superpixel, means, sizes = slic(np.asarray(image), 48)
+    assert superpixel.shape == (len(pixels),) and len(means) == len(sizes) <= 48
+    assert np.array_equal(np.bincount(superpixel), sizes)
+    for j in range(3):
+        assert np.allclose(np.bincount(superpixel, weights=pixels[:, j]) / sizes, means[:, j])
+
+
+# the cubes of the superpixel means count the pixels of their superpixels, and each pixel maps to the
+# cube of its superpixel
+def test_superpixel_quantize(image):
+    cubes, counts, inverse, superpixel = superpixel_quantize(np.asarray(image), 16, 48)
+    _, means, _ = slic(np.asarray(image), 48)
+    assert counts.sum() == image.size[0] * image.size[1]
+    assert np.array_equal(counts, np.bincount(inverse))
+    expected, _, index = quantize(means, 16)
+    assert np.array_equal(cubes[inverse], expected[index][superpixel])
+
+
+# on the superpixels DP finds the same segments of the image as on the pixels, from far fewer cubes
+@pytest.mark.parametrize('segments', [12, 48])
+def test_dp_superpixels(image, segments):
+    runs = dict()
+    for s in (0, segments):
+        dp = DPImage('Euclidean')
+        dp.GRANULARITY = 16
+        dp.SEGMENTS = s
+        dp.run_img(image)
+        runs[s] = dp
+    baseline, dp = runs[0], runs[segments]
+    assert len(dp.keys) < len(baseline.keys)
+    assert len(dp.centroids) == len(baseline.centroids)
+    pairs = set(zip(baseline.get_labels().tolist(), dp.get_labels().tolist()))
+    assert len(pairs) == len(baseline.centroids)